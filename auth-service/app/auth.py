@@ -5,10 +5,14 @@ import secrets
 import hashlib
 import logging
 from app.config import settings
+from shared.token_cache import TokenCache
 from shared.permissions import get_permissions_for_role
 
 logger = logging.getLogger("auth-service")
 
+# Проверенные токены: подпись проверяется один раз на токен, а не на каждый запрос
+token_cache = TokenCache(max_size=settings.TOKEN_CACHE_SIZE)
+
 pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -39,6 +43,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
         
         to_encode.update({
             "exp": expire,
+            "iat": datetime.utcnow(),
             "type": "access",
             "jti": secrets.token_urlsafe(16),
             "permissions": permissions
@@ -60,6 +65,7 @@ def create_refresh_token(data: dict) -> str:
         
         to_encode.update({
             "exp": expire,
+            "iat": datetime.utcnow(),
             "type": "refresh",
             "jti": secrets.token_urlsafe(32)
         })
@@ -73,9 +79,15 @@ def create_refresh_token(data: dict) -> str:
         raise
 
 def verify_token(token: str) -> dict:
-    """Проверка JWT токена"""
+    """Проверка JWT токена (повторные проверки того же токена - из кэша)"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        if not token_cache.put(token, payload):
+            logger.warning(f"Revoked token rejected for {payload.get('sub')}")
+            return None
         return payload
     except JWTError as e:
         logger.warning(f"JWT token verification failed: {e}")
@@ -10,6 +10,8 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     LOG_LEVEL: str = "INFO"
     USER_SERVICE_URL: str = "http://data-service:8004"
+    # Размер кэша проверенных токенов (LRU, записи живут до exp токена)
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,80 @@
+# auth-service/bench_auth_config.py
+"""
+Бенчмарк проверки доступа на горячем пути /auth/validate: прежний
+AuthConfig.can_access (объединение правил иерархии на каждый вызов +
+линейный перебор startswith) против префиксного дерева с кэшем решений.
+Перед замером проверяется совпадение решений на первых 20000 запросах.
+
+Запуск: python bench_auth_config.py [--requests 200000] [--paths 500]
+"""
+import argparse
+import logging
+import random
+import time
+
+from shared.auth_rules import AuthConfig, SUPERUSER_ROLES
+
+METHODS = ["GET", "POST", "PUT", "DELETE"]
+# Роли по частоте в потоке forwardAuth: каждый запрос сначала проверяется как public
+ROLES = ["public", "public", "user", "curator", "admin"]
+
+
+def legacy_can_access(config: AuthConfig, role: str, method: str, path: str) -> bool:
+    """Прежняя реализация can_access"""
+    if role in SUPERUSER_ROLES:
+        return True
+    for rule_path, allowed_methods in config._get_aggregated_access(role).items():
+        if path.startswith(rule_path) and method in allowed_methods:
+            return True
+    return False
+
+
+def make_requests(count: int, distinct_paths: int):
+    prefixes = ["/api/sessions", "/api/modules", "/api/table/users", "/api/admin/ingest",
+                "/api/analytics/basic", "/api/profile", "/api/users", "/api/unknown", "/static/dist"]
+    paths = []
+    for _ in range(distinct_paths):
+        path = f"{random.choice(prefixes)}/{random.randint(1, 10000)}"
+        if random.random() < 0.3:
+            path += f"?page={random.randint(1, 50)}"
+        paths.append(path)
+    return [(random.choice(ROLES), random.choice(METHODS), random.choice(paths)) for _ in range(count)]
+
+
+def measure(check, requests) -> float:
+    started = time.perf_counter()
+    for role, method, path in requests:
+        check(role, method, path)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AuthConfig.can_access benchmark")
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--paths', type=int, default=500, help="Distinct request paths")
+    parser.add_argument('--config', default='auth_rules.yml')
+    args = parser.parse_args()
+    # Отказы логируются на каждый вызов - в замер не входят
+    logging.disable(logging.WARNING)
+
+    config = AuthConfig(args.config)
+    requests = make_requests(args.requests, args.paths)
+
+    mismatches = [r for r in requests[:20000] if legacy_can_access(config, *r) != config.can_access(*r)]
+    if mismatches:
+        raise SystemExit(f"Decisions differ for {len(mismatches)} requests, e.g. {mismatches[:3]}")
+
+    # Замер с пустым кэшем: промахи на первых запросах входят в результат
+    config.snapshot.decide.cache_clear()
+    before = measure(lambda *r: legacy_can_access(config, *r), requests)
+    after = measure(config.can_access, requests)
+
+    print(f"{args.requests} checks, {args.paths} distinct paths")
+    print(f"  linear scan      {before / args.requests * 1e6:8.2f} us/check")
+    print(f"  trie + cache     {after / args.requests * 1e6:8.2f} us/check")
+    print(f"  speedup x{before / after:.1f}")
+    print(f"  decision cache   {config.get_stats()['decision_cache']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
 import logging
 import signal
-from auth_config import AuthConfig
-from app.auth import verify_token, create_access_token, create_refresh_token, store_refresh_token
+import asyncio
+from shared.auth_rules import AuthConfig
+from shared.redis_client import get_redis_client
+from shared.token_revocation import RevocationListener, publish_token_revocation
+from app.auth import verify_token, create_access_token, create_refresh_token, store_refresh_token, token_cache
 from app.database import get_db_manager
 from shared.auth_models import LoginRequest, TokenValidationRequest
 
@@ -39,8 +42,14 @@ def handle_sighup(signum, frame):
 
 signal.signal(signal.SIGHUP, handle_sighup)
 
+revocation_listener = None
+
 @app.on_event("startup")
 async def startup():
+    global revocation_listener
+    # Отзывы из других экземпляров auth-service (у каждого свой кэш токенов)
+    revocation_listener = RevocationListener(await asyncio.to_thread(get_redis_client), token_cache)
+    revocation_listener.start()
     logger.info("Auth-Service started with role hierarchy system")
 
 @app.get("/auth/validate")
@@ -234,9 +243,17 @@ async def refresh_tokens(request: Request, response: Response, db_manager=Depend
         raise HTTPException(500, "Internal server error")
 
 @app.post("/api/auth/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
     """Выход пользователя с очисткой cookies"""
     try:
+        # Закэшированный access token после выхода больше не принимается
+        access_token = request.cookies.get("access_token")
+        if access_token:
+            payload = verify_token(access_token)
+            token_cache.revoke_token(access_token)
+            if payload and payload.get('exp'):
+                # Сервисы с локальной проверкой доступа узнают об отзыве через Redis
+                await asyncio.to_thread(publish_token_revocation, get_redis_client(), access_token, payload['exp'])
         response.delete_cookie("access_token", path="/")
         response.delete_cookie("refresh_token", path="/api/auth/refresh")
         return {"message": "Successfully logged out"}
@@ -266,12 +283,13 @@ async def get_current_user(request: Request):
 @app.get("/api/auth/health")
 async def health_check():
     """Health check endpoint"""
-    # Фоновая перезагрузка конфига при health check
-    auth_config._load_and_compile()
+    # Только текущий снимок правил: изменения файла отслеживает watcher
     return {
         "status": "healthy",
         "service": "auth-service",
-        "version": "2.0.0"
+        "version": "2.0.0",
+        "auth_config": auth_config.health(),
+        "token_cache": token_cache.stats()
     }
 
 @app.get("/api/auth/config-status")
@@ -282,9 +300,9 @@ async def config_status():
 @app.get("/api/auth/reload-config")
 async def reload_config():
     """Перезагрузка конфигурации (требует админских прав)"""
-    auth_config.force_reload()
+    reloaded = auth_config.force_reload()
     return {
-        "status": "config reloaded", 
+        "status": "config reloaded" if reloaded else "reload failed, previous rules active", 
         "stats": auth_config.get_stats()
     }
 
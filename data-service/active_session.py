@@ -0,0 +1,93 @@
+# data-service/active_session.py
+"""
+Текущая сессия приема, общая для процессов API и ingest_worker.
+
+Сессию, в которую пишутся пакеты без явного id, выбирает API (создание
+сессии, обновление списка сессий). Процессы приема с INGEST_MODE=external
+не видят памяти API, поэтому значение хранится в Redis (ACTIVE_SESSION_KEY),
+а об изменении сообщается в канал ACTIVE_SESSION_CHANNEL. Подписчик приема
+держит значение в памяти: событие обновляет его сразу, а раз в
+refresh_seconds оно перечитывается из Redis на случай пропущенного события.
+Без Redis (или пока значение не записано) используется последняя сессия из БД.
+"""
+import time
+import threading
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger("data-service-active-session")
+
+ACTIVE_SESSION_KEY = "ingest:active_session"
+ACTIVE_SESSION_CHANNEL = "ingest_active_session"
+
+
+class ActiveSession:
+    """Текущая сессия приема: запись в API, чтение с кэшем в процессах приема"""
+
+    def __init__(self, redis_client, db_manager, refresh_seconds: float = 5.0):
+        self.redis_client = redis_client
+        self.db_manager = db_manager
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._value: Optional[int] = None
+        self._loaded_at = 0.0
+
+    @property
+    def _client(self):
+        return getattr(self.redis_client, 'client', None)
+
+    def publish(self, id_session: int):
+        """Новая текущая сессия (вызывается API при ее смене)"""
+        with self._lock:
+            self._value = id_session
+            self._loaded_at = time.monotonic()
+        client = self._client
+        if client is None:
+            return
+        try:
+            client.set(ACTIVE_SESSION_KEY, id_session)
+            self.redis_client.publish(ACTIVE_SESSION_CHANNEL, {'id_session': id_session})
+        except Exception as e:
+            logger.warning(f"Failed to publish active session {id_session}: {e}")
+
+    def on_message(self, message: Dict[str, Any]):
+        """Событие смены сессии из ACTIVE_SESSION_CHANNEL"""
+        try:
+            id_session = int(message['id_session'])
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Invalid active session event: {message}")
+            return
+        with self._lock:
+            self._value = id_session
+            self._loaded_at = time.monotonic()
+
+    def get(self) -> Optional[int]:
+        """Текущая сессия (None - сессий нет)"""
+        with self._lock:
+            if self._value and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return self._value
+
+        try:
+            id_session = self._load()
+        except Exception as e:
+            # Нет ни Redis, ни БД - пакеты идут в последнюю известную сессию
+            logger.error(f"Failed to load active session: {e}")
+            id_session = None
+        with self._lock:
+            if id_session:
+                self._value = id_session
+            self._loaded_at = time.monotonic()
+            return self._value
+
+    def _load(self) -> Optional[int]:
+        client = self._client
+        if client is not None:
+            try:
+                value = client.get(ACTIVE_SESSION_KEY)
+                if value:
+                    return int(value)
+            except Exception as e:
+                logger.warning(f"Failed to read active session from Redis: {e}")
+
+        sessions = self.db_manager.get_all_sessions()
+        return sessions[0]['id'] if sessions else None
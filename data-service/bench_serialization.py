@@ -0,0 +1,205 @@
+# data-service/bench_serialization.py
+"""
+Бенчмарк сериализации страниц data: прежний путь (dict на строку из
+RealDictCursor + jsonable_encoder + json) против кортежей с
+предвычисленными индексами колонок и orjson. Для страницы таблицы
+дополнительно сравниваются размер и время разбора на клиенте (json.loads)
+построчного и колоночного (layout=columnar) форматов.
+
+Запуск: python bench_serialization.py [--rows 10000] [--repeat 20]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from row_format import format_message_rows, format_data_rows, rows_to_dicts, to_columnar, dumps
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+# Колонки запроса last_messages (lm.* + effective_*)
+MESSAGE_COLUMNS = [
+    'id', 'id_module', 'id_session', 'id_message_type', 'datetime', 'datetime_unix',
+    'lat', 'lon', 'alt', 'gps_ok', 'message_number', 'rssi', 'snr', 'source', 'jumps',
+    'created_at', 'module_name', 'module_color', 'message_type',
+    'effective_lat', 'effective_lon', 'effective_alt'
+]
+
+# Колонки запроса d.* + module_name, module_color, message_type, session_name
+DATA_COLUMNS = MESSAGE_COLUMNS[:19] + ['session_name']
+
+
+# Колонки страницы /api/table/users (get_session_data)
+TABLE_COLUMNS = [
+    'data_id', 'id_session', 'datetime', 'datetime_unix', 'lat', 'lon', 'alt', 'gps_ok',
+    'message_number', 'rssi', 'snr', 'source', 'jumps', 'module_id', 'module_name',
+    'module_color', 'message_type_id', 'message_type_name', 'id'
+]
+
+
+def make_rows(count: int, modules: int = 200):
+    started = datetime(2024, 6, 1, 12, 0, 0)
+    rows = []
+    for i in range(count):
+        id_module = random.randint(1, modules)
+        moment = started + timedelta(seconds=i)
+        gps_ok = random.random() > 0.1
+        lat, lon, alt = 55.75 + random.random(), 37.61 + random.random(), random.random() * 300
+        rows.append((
+            i + 1, id_module, 1, 1, moment, int(moment.timestamp()),
+            lat, lon, alt, gps_ok, i, -random.randint(40, 120), random.random() * 10,
+            random.randint(0, 3), random.randint(0, 5), moment,
+            f"Module {id_module}", '#FF8800', 'GPS',
+            lat if gps_ok else None, lon if gps_ok else None, alt if gps_ok else None
+        ))
+    return rows
+
+
+def legacy_format_messages(rows):
+    """Прежний _format_messages по dict-строкам"""
+    result = []
+    for row in rows:
+        if row['effective_lat'] is None and row['effective_lon'] is None:
+            coords_value = None
+        else:
+            coords_value = {
+                'lat': row['effective_lat'],
+                'lon': row['effective_lon'],
+                'alt': row['effective_alt'] if row['effective_alt'] is not None else 0.0
+            }
+        result.append({
+            'id': row['id'],
+            'id_module': format(row['id_module'], 'X'),
+            'module_name': row['module_name'],
+            'module_color': row['module_color'],
+            'id_session': row['id_session'],
+            'id_message_type': row['id_message_type'],
+            'message_type': row['message_type'],
+            'datetime': row['datetime'].isoformat() if row['datetime'] else None,
+            'datetime_unix': row['datetime_unix'],
+            'coords': coords_value,
+            'rssi': row['rssi'],
+            'snr': row['snr'],
+            'source': row['source'],
+            'jumps': row['jumps'],
+            'gps_ok': bool(row['gps_ok']),
+            'message_number': row['message_number']
+        })
+    return result
+
+
+def legacy_format_data(rows):
+    """Прежнее форматирование записей _get_full_data_batch_in_transaction"""
+    result = []
+    for data in rows:
+        result.append({
+            'id': data['id'],
+            'id_module': format(data['id_module'], 'X'),
+            'module_name': data['module_name'],
+            'module_color': data['module_color'],
+            'id_session': data['id_session'],
+            'session_name': data['session_name'],
+            'message_type': data['id_message_type'],
+            'message_type_name': data['message_type'],
+            'datetime': data['datetime'].isoformat() if data['datetime'] else None,
+            'datetime_unix': data['datetime_unix'],
+            'coords': {'lat': data['lat'], 'lon': data['lon'], 'alt': data['alt']},
+            'rssi': data['rssi'],
+            'snr': data['snr'],
+            'source': data['source'],
+            'jumps': data['jumps'],
+            'gps_ok': bool(data['gps_ok']),
+            'message_number': data['message_number'],
+            'created_at': data['created_at'].isoformat() if data['created_at'] else None
+        })
+    return result
+
+
+def legacy_dumps(content) -> bytes:
+    """Кодирование ответа как в JSONResponse FastAPI"""
+    if jsonable_encoder is not None:
+        content = jsonable_encoder(content)
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def _parsed(payload: bytes) -> bytes:
+    json.loads(payload)
+    return payload
+
+
+def measure(label: str, func, repeat: int, rows: int):
+    func()  # прогрев
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(func())
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"  {label:<28} {median * 1000:9.2f} ms  {rows / median:12,.0f} rows/s  {size / 1024:9.1f} KiB")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization benchmark for data-service row payloads")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    message_rows = make_rows(args.rows)
+    data_rows = [row[:19] + ('Session 1',) for row in message_rows]
+    repeat, rows = args.repeat, args.rows
+
+    encoder = 'jsonable_encoder + json' if jsonable_encoder else 'json (fastapi not installed)'
+    print(f"{rows} rows per page, median of {repeat} runs; before = RealDict rows + {encoder}")
+
+    # dict на строку создает RealDictCursor при fetch - входит в стоимость прежнего пути
+    print("last_messages (_format_messages):")
+    before = measure("before", lambda: legacy_dumps(legacy_format_messages(
+        rows_to_dicts(MESSAGE_COLUMNS, message_rows))), repeat, rows)
+    after = measure("after", lambda: dumps(format_message_rows(MESSAGE_COLUMNS, message_rows)), repeat, rows)
+    print(f"  speedup x{before / after:.1f}")
+
+    print("data records (_get_full_data_batch_in_transaction):")
+    before = measure("before", lambda: legacy_dumps(legacy_format_data(
+        rows_to_dicts(DATA_COLUMNS, data_rows))), repeat, rows)
+    after = measure("after", lambda: dumps(format_data_rows(DATA_COLUMNS, data_rows)), repeat, rows)
+    print(f"  speedup x{before / after:.1f}")
+
+    print("table page (/api/table/users):")
+    before = measure("before", lambda: legacy_dumps({'success': True, 'data': rows_to_dicts(
+        DATA_COLUMNS, data_rows)}), repeat, rows)
+    after = measure("after", lambda: dumps({'success': True, 'data': rows_to_dicts(
+        DATA_COLUMNS, data_rows)}), repeat, rows)
+    print(f"  speedup x{before / after:.1f}")
+
+    table_rows = [
+        (row[0], row[2], row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11], row[12],
+         row[13], row[14], row[1], row[16], row[17], row[3], row[18], row[0])
+        for row in message_rows
+    ]
+    print("table page layout (rows -> columnar):")
+    measure("rows encode", lambda: dumps({'data': rows_to_dicts(TABLE_COLUMNS, table_rows)}), repeat, rows)
+    measure("columnar encode", lambda: dumps({'data': to_columnar(TABLE_COLUMNS, table_rows)}), repeat, rows)
+    rows_payload = dumps({'data': rows_to_dicts(TABLE_COLUMNS, table_rows)})
+    columnar_payload = dumps({'data': to_columnar(TABLE_COLUMNS, table_rows)})
+    before = measure("rows parse (client)", lambda: _parsed(rows_payload), repeat, rows)
+    after = measure("columnar parse (client)", lambda: _parsed(columnar_payload), repeat, rows)
+    print(f"  size x{len(rows_payload) / len(columnar_payload):.1f} smaller, parse x{before / after:.1f} faster")
+
+    # Результаты должны совпадать с прежним форматом
+    assert json.loads(dumps(format_message_rows(MESSAGE_COLUMNS, message_rows[:100]))) == \
+        json.loads(legacy_dumps(legacy_format_messages(rows_to_dicts(MESSAGE_COLUMNS, message_rows[:100]))))
+    assert json.loads(dumps(format_data_rows(DATA_COLUMNS, data_rows[:100]))) == \
+        json.loads(legacy_dumps(legacy_format_data(rows_to_dicts(DATA_COLUMNS, data_rows[:100]))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# data-service/bulk_import.py
+"""
+Фоновый пакетный импорт текстовых логов телеметрии (форматы GV/GL).
+
+Файл читается порциями строк, каждая порция разбирается пакетным парсером
+и записывается в таблицу data одним COPY. Прогресс и ошибки по строкам
+доступны через статус задачи. Задача выполняется в принявшем файл процессе
+API, ее состояние дублируется в Redis (job_store), чтобы статус отдавал
+любой воркер.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from log_parser import parse_log_lines, to_data_row
+
+logger = logging.getLogger("data-service-import")
+
+ALLOWED_EXTENSIONS = {'.txt', '.log', '.csv'}
+
+
+def allowed_file(filename: str) -> bool:
+    """Проверка расширения загружаемого файла"""
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def save_upload_file(source, upload_dir: str, suffix: str = '') -> str:
+    """Копирование загруженного файла во временный файл в upload_dir"""
+    os.makedirs(upload_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=upload_dir, suffix=suffix, delete=False) as temp_file:
+        shutil.copyfileobj(source, temp_file, length=1024 * 1024)
+        return temp_file.name
+
+
+class ImportJob:
+    """Состояние одной задачи импорта"""
+
+    def __init__(self, file_path: str, filename: str, id_session: Optional[int], session_name: str):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.id_session = id_session
+        self.session_name = session_name
+        self.status = 'queued'
+        self.total_bytes = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        self.processed_bytes = 0
+        self.lines_processed = 0
+        self.lines_inserted = 0
+        self.error_count = 0
+        self.errors: List[Dict] = []
+        self.message = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        progress = 100.0 if self.status == 'completed' else 0.0
+        if self.total_bytes and self.status != 'completed':
+            progress = round(self.processed_bytes * 100.0 / self.total_bytes, 2)
+
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'id_session': self.id_session,
+            'progress': progress,
+            'total_bytes': self.total_bytes,
+            'processed_bytes': self.processed_bytes,
+            'lines_processed': self.lines_processed,
+            'lines_inserted': self.lines_inserted,
+            'error_count': self.error_count,
+            'errors': list(self.errors),
+            'errors_truncated': self.error_count > len(self.errors),
+            'message': self.message,
+            'created_at': self.created_at.isoformat(),
+            'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+            'lines_per_second': round(self.lines_processed / elapsed) if elapsed else None
+        }
+
+
+class BulkImporter:
+    """Очередь фоновых задач импорта"""
+
+    def __init__(self, db_manager, chunk_size: int = 50000, max_errors: int = 1000,
+                 max_workers: int = 2, max_jobs_history: int = 100, job_store=None):
+        self.db_manager = db_manager
+        # RedisJobStore: состояние задач для других воркеров API (None - только этот процесс)
+        self.job_store = job_store
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.max_jobs_history = max_jobs_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-import")
+        self._jobs: Dict[str, ImportJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, filename: str, id_session: Optional[int] = None,
+               session_name: str = "") -> Dict[str, Any]:
+        """Постановка файла в очередь импорта"""
+        job = ImportJob(file_path, filename, id_session, session_name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._save(job)
+        self._executor.submit(self._run, job)
+        logger.info(f"Import job {job.id} queued for {filename} ({job.total_bytes} bytes)")
+        return job.to_dict()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Статус задачи (задачи других процессов - из job_store)"""
+        job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        return self.job_store.get(job_id) if self.job_store else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Краткий список задач всех процессов (без списка ошибок)"""
+        with self._lock:
+            local = {job.id: job.to_dict() for job in self._jobs.values()}
+        shared = self.job_store.list() if self.job_store else []
+        jobs = {info['job_id']: info for info in shared}
+        jobs.update(local)
+        result = sorted(jobs.values(), key=lambda info: info['created_at'], reverse=True)
+        for info in result:
+            info.pop('errors', None)
+        return result
+
+    def shutdown(self):
+        """Остановка пула задач"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _trim_history(self):
+        """Удаление самых старых завершенных задач сверх лимита"""
+        finished = [j for j in self._jobs.values() if j.status in ('completed', 'failed')]
+        excess = len(self._jobs) - self.max_jobs_history
+        for job in finished[:max(0, excess)]:
+            self._jobs.pop(job.id, None)
+
+    def _save(self, job: ImportJob):
+        if self.job_store:
+            self.job_store.save(job.id, job.to_dict(), job.created_at.timestamp())
+
+    def _add_errors(self, job: ImportJob, errors: List[Dict]):
+        job.error_count += len(errors)
+        free_slots = self.max_errors - len(job.errors)
+        if free_slots > 0:
+            job.errors.extend(errors[:free_slots])
+
+    def _run(self, job: ImportJob):
+        """Выполнение задачи импорта"""
+        job.status = 'running'
+        job.started_at = time.time()
+
+        try:
+            id_session = self.db_manager._get_or_create_session(job.id_session, job.session_name)
+            if not id_session:
+                raise RuntimeError("Не удалось получить или создать сессию")
+            job.id_session = id_session
+
+            with open(job.file_path, 'rb') as f:
+                lines = []
+                first_line_no = 1
+                chunk_bytes = 0
+
+                for raw_line in f:
+                    lines.append(raw_line.decode('utf-8', errors='replace'))
+                    chunk_bytes += len(raw_line)
+
+                    if len(lines) >= self.chunk_size:
+                        self._process_chunk(job, lines, first_line_no, chunk_bytes)
+                        first_line_no += len(lines)
+                        lines = []
+                        chunk_bytes = 0
+
+                if lines:
+                    self._process_chunk(job, lines, first_line_no, chunk_bytes)
+
+            job.status = 'completed'
+            job.message = f"Успешно: {job.lines_inserted}, ошибок: {job.error_count}"
+            logger.info(f"Import job {job.id} completed: {job.message}")
+
+        except Exception as e:
+            job.status = 'failed'
+            job.message = str(e)
+            logger.error(f"Import job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+    def _process_chunk(self, job: ImportJob, lines: List[str], first_line_no: int, chunk_bytes: int):
+        """Разбор порции строк и запись одним COPY"""
+        parsed, errors = parse_log_lines(lines, first_line_no)
+
+        now = datetime.now()
+        datetime_str = now.strftime("%Y-%m-%d %H:%M:%S")
+        datetime_unix = int(now.timestamp())
+
+        rows = [to_data_row(record, job.id_session, datetime_str, datetime_unix) for _, record in parsed]
+        inserted = self.db_manager.copy_data_batch(rows)
+
+        job.lines_processed += len(lines)
+        job.lines_inserted += inserted
+        job.processed_bytes += chunk_bytes
+        if errors:
+            self._add_errors(job, errors)
+        self._save(job)
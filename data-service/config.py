@@ -8,6 +8,69 @@ class Settings(BaseSettings):
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis-service:6379/0")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
 
+    # Экспорт сессий в Arrow/Parquet
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", "/app/exports")
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+
+    # Пакетный импорт лог-файлов
+    IMPORT_DIR: str = os.getenv("IMPORT_DIR", "/app/imports")
+    IMPORT_CHUNK_SIZE: int = int(os.getenv("IMPORT_CHUNK_SIZE", "50000"))
+    IMPORT_MAX_ERRORS: int = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+    IMPORT_WORKERS: int = int(os.getenv("IMPORT_WORKERS", "2"))
+
+    # Хранение и фоновое удаление данных (0 дней - политика отключена).
+    # Включается явно: без планировщика очередь полного удаления сессий не обрабатывается
+    RETENTION_ENABLED: bool = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+    RETENTION_INTERVAL_SECONDS: int = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    RETENTION_HIDDEN_DATA_DAYS: int = int(os.getenv("RETENTION_HIDDEN_DATA_DAYS", "0"))
+    RETENTION_HIDDEN_SESSION_DAYS: int = int(os.getenv("RETENTION_HIDDEN_SESSION_DAYS", "0"))
+    RETENTION_VISIBLE_DATA_DAYS: int = int(os.getenv("RETENTION_VISIBLE_DATA_DAYS", "0"))
+    RETENTION_CHUNK_SIZE: int = int(os.getenv("RETENTION_CHUNK_SIZE", "5000"))
+    RETENTION_CHUNK_PAUSE_MS: int = int(os.getenv("RETENTION_CHUNK_PAUSE_MS", "50"))
+    RETENTION_MAX_DUTY_CYCLE: float = float(os.getenv("RETENTION_MAX_DUTY_CYCLE", "0.5"))
+    RETENTION_LOCK_TIMEOUT_MS: int = int(os.getenv("RETENTION_LOCK_TIMEOUT_MS", "1000"))
+    RETENTION_VACUUM_THRESHOLD: int = int(os.getenv("RETENTION_VACUUM_THRESHOLD", "100000"))
+    RETENTION_VACUUM_COST_DELAY_MS: int = int(os.getenv("RETENTION_VACUUM_COST_DELAY_MS", "10"))
+
+    # Холодный архив скрытых сессий
+    ARCHIVE_ON_HIDE: bool = os.getenv("ARCHIVE_ON_HIDE", "true").lower() == "true"
+    ARCHIVE_HIDDEN_ON_START: bool = os.getenv("ARCHIVE_HIDDEN_ON_START", "false").lower() == "true"
+    ARCHIVE_CHUNK_SIZE: int = int(os.getenv("ARCHIVE_CHUNK_SIZE", "20000"))
+    ARCHIVE_WORKERS: int = int(os.getenv("ARCHIVE_WORKERS", "1"))
+
+    # Фоновые службы (retention, продолжение архиваций) работают в одном воркере API -
+    # лидере по advisory-блокировке Postgres; остальные проверяют ее с этим интервалом
+    LEADER_ELECTION_INTERVAL_SECONDS: int = int(os.getenv("LEADER_ELECTION_INTERVAL_SECONDS", "15"))
+
+    # Прием данных из Redis (module_data, corrupted_data)
+    # embedded - подписчик в процессе API (один воркер uvicorn),
+    # external - прием в отдельных процессах ingest_worker.py, API масштабируется воркерами
+    INGEST_MODE: str = os.getenv("INGEST_MODE", "embedded")
+    # Шарды процесса ingest_worker.py ('0,1'; пусто - все). Число шардов - INGEST_SHARDS (shared.ingest_partition)
+    INGEST_SHARD_INDEXES: str = os.getenv("INGEST_SHARD_INDEXES", "")
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "4"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))
+    INGEST_BATCH_ENABLED: bool = os.getenv("INGEST_BATCH_ENABLED", "true").lower() == "true"
+    INGEST_BATCH_MAX_PACKETS: int = int(os.getenv("INGEST_BATCH_MAX_PACKETS", "500"))
+    INGEST_BATCH_MIN_WINDOW_MS: float = float(os.getenv("INGEST_BATCH_MIN_WINDOW_MS", "5"))
+    INGEST_MAX_LATENCY_MS: float = float(os.getenv("INGEST_MAX_LATENCY_MS", "250"))
+    # Журнал на диске перед записью в БД: пакеты переживают рестарт и недоступность Postgres
+    INGEST_SPOOL_ENABLED: bool = os.getenv("INGEST_SPOOL_ENABLED", "true").lower() == "true"
+    SPOOL_DIR: str = os.getenv("SPOOL_DIR", "/app/spool")
+    SPOOL_SEGMENT_MB: int = int(os.getenv("SPOOL_SEGMENT_MB", "64"))
+    SPOOL_FSYNC_INTERVAL_MS: float = float(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "10"))
+    # Живое состояние модулей в Redis: снимок сессии и треки за последние LIVE_TRAIL_SECONDS без Postgres
+    LIVE_STATE_ENABLED: bool = os.getenv("LIVE_STATE_ENABLED", "true").lower() == "true"
+    LIVE_TRAIL_SECONDS: int = int(os.getenv("LIVE_TRAIL_SECONDS", "300"))
+    LIVE_STATE_TTL_SECONDS: int = int(os.getenv("LIVE_STATE_TTL_SECONDS", "21600"))
+    # Проверка JWT и правил auth_rules.yml в процессе (LOCAL_AUTH_ENABLED, shared.local_auth)
+    # вместо Traefik forwardAuth; префиксы - роуты, которые раньше шли через auth-forward
+    LOCAL_AUTH_PREFIXES: str = os.getenv(
+        "LOCAL_AUTH_PREFIXES",
+        "/api/sessions,/api/table,/api/modules,/api/database,/api/data,/api/users,/api/admin"
+    )
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,334 @@
+# data-service/coordination.py
+"""
+Согласование процессов API data-service.
+
+С INGEST_MODE=external uvicorn запускает API_WORKERS процессов, и запрос
+попадает в любой из них. Поэтому:
+
+- фоновые службы (планировщик retention, продолжение архивации) работают
+  в одном процессе - лидере, который держит advisory-блокировку Postgres
+  (LeaderElection). Блокировка живет вместе с соединением: если лидер
+  упал, ее забирает другой воркер при следующей попытке;
+- задачи, которые нельзя выполнять дважды (миграция, архивация сессии),
+  берут свою advisory-блокировку на время выполнения (AdvisoryLock);
+- состояние задач и отчеты процессов лежат в Redis (RedisJobStore,
+  ProcessReporter) - статус отдает любой воркер;
+- команды лидеру передаются через канал Redis (ControlListener).
+"""
+import os
+import json
+import time
+import socket
+import threading
+import logging
+from typing import Optional, Dict, Any, List, Callable
+
+import psycopg2
+
+logger = logging.getLogger("data-service-coordination")
+
+# Пространства ключей advisory-блокировок (первый аргумент pg_try_advisory_lock)
+LOCK_LEADER = 7301
+LOCK_MIGRATION = 7302
+LOCK_ARCHIVE_SESSION = 7303
+
+CONTROL_CHANNEL = "data_service_control"
+
+
+def process_id() -> str:
+    """Идентификатор процесса в отчетах: хост (контейнер) и PID"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class AdvisoryLock:
+    """
+    Сессионная advisory-блокировка Postgres на отдельном соединении
+
+    Соединение не берется из пула: блокировка держится, пока оно открыто,
+    и снимается сервером при его закрытии или обрыве.
+    """
+
+    def __init__(self, database_url: str, namespace: int, key: int = 0):
+        self.database_url = database_url
+        self.namespace = namespace
+        self.key = key
+        self._conn = None
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None
+
+    def try_acquire(self) -> bool:
+        if self._conn is not None:
+            return True
+        conn = psycopg2.connect(self.database_url)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", (self.namespace, self.key))
+                acquired = cursor.fetchone()[0]
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def alive(self) -> bool:
+        """Блокировка все еще у нас (соединение живо)"""
+        if self._conn is None:
+            return False
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Advisory lock {self.namespace}/{self.key} connection lost: {e}")
+            self.release()
+            return False
+
+    def release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class LeaderElection:
+    """Выбор процесса, выполняющего фоновые службы"""
+
+    def __init__(self, database_url: str, on_elected: Callable[[], None],
+                 on_lost: Callable[[], None], interval: float = 15):
+        self.lock = AdvisoryLock(database_url, LOCK_LEADER)
+        self.on_elected = on_elected
+        self.on_lost = on_lost
+        self.interval = interval
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="leader-election")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        if self.is_leader:
+            self.is_leader = False
+            self.on_lost()
+        self.lock.release()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self.lock.alive():
+                self._stop.wait(self.interval)
+                continue
+            if self.is_leader:
+                self.is_leader = False
+                logger.warning(f"Process {process_id()} lost leadership")
+                self._call(self.on_lost)
+            try:
+                if self.lock.try_acquire():
+                    self.is_leader = True
+                    logger.info(f"Process {process_id()} is the background services leader")
+                    self._call(self.on_elected)
+            except Exception as e:
+                logger.warning(f"Leader election failed: {e}")
+            self._stop.wait(self.interval)
+
+    @staticmethod
+    def _call(callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Leader callback {callback} failed: {e}")
+
+
+class RedisJobStore:
+    """
+    Состояние задач в Redis: <prefix>:<id> - JSON задачи, <prefix>:index -
+    id по времени создания. Ошибки Redis не мешают задачам: чтение возвращает
+    None/[], и вызывающий использует состояние своего процесса.
+    """
+
+    def __init__(self, redis_client, prefix: str, ttl_seconds: int = 86400, max_history: int = 100):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+
+    @property
+    def _client(self):
+        return getattr(self.redis_client, 'client', None)
+
+    def _key(self, job_id) -> str:
+        return f"{self.prefix}:{job_id}"
+
+    def save(self, job_id, state: Dict[str, Any], created_at: Optional[float] = None):
+        client = self._client
+        if client is None:
+            return
+        index = f"{self.prefix}:index"
+        try:
+            pipe = client.pipeline(transaction=False)
+            state = dict(state, saved_at=time.time())
+            pipe.set(self._key(job_id), json.dumps(state, default=str), ex=self.ttl_seconds)
+            pipe.zadd(index, {str(job_id): created_at or time.time()}, nx=True)
+            pipe.zremrangebyrank(index, 0, -self.max_history - 1)
+            pipe.expire(index, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to save {self.prefix} job {job_id}: {e}")
+
+    def get(self, job_id) -> Optional[Dict[str, Any]]:
+        client = self._client
+        if client is None:
+            return None
+        try:
+            raw = client.get(self._key(job_id))
+        except Exception as e:
+            logger.warning(f"Failed to read {self.prefix} job {job_id}: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Задачи от новых к старым"""
+        client = self._client
+        if client is None:
+            return []
+        try:
+            ids = client.zrevrange(f"{self.prefix}:index", 0, -1)
+            if not ids:
+                return []
+            values = client.mget([self._key(job_id) for job_id in ids])
+        except Exception as e:
+            logger.warning(f"Failed to list {self.prefix} jobs: {e}")
+            return []
+        return [json.loads(raw) for raw in values if raw]
+
+
+class ProcessReporter:
+    """
+    Периодическая запись состояния процесса в Redis (<prefix>:<процесс>, TTL -
+    три интервала), как отчеты ingest_worker. Отчет формирует report();
+    None - процессу нечего сообщать, ключ удаляется.
+    """
+
+    def __init__(self, redis_client, prefix: str, report: Callable[[], Optional[Dict[str, Any]]],
+                 interval: float = 5):
+        self.redis_client = redis_client
+        self.key = f"{prefix}:{process_id()}"
+        self.prefix = prefix
+        self.report = report
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Лидер останавливает и снова запускает отчет при смене лидерства
+        self._stop.clear()
+        self.publish_now()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=f"report-{self.prefix}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        client = getattr(self.redis_client, 'client', None)
+        if client is not None:
+            try:
+                client.delete(self.key)
+            except Exception:
+                pass
+
+    def publish_now(self):
+        client = getattr(self.redis_client, 'client', None)
+        if client is None:
+            return
+        try:
+            state = self.report()
+            if state is None:
+                client.delete(self.key)
+                return
+            state.update({'process': process_id(), 'reported_at': time.time()})
+            client.set(self.key, json.dumps(state, default=str), ex=int(self.interval * 3))
+        except Exception as e:
+            logger.warning(f"Failed to report {self.prefix}: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.publish_now()
+
+
+def read_reports(redis_client, prefix: str) -> List[Dict[str, Any]]:
+    """Последние отчеты всех процессов (устаревшие истекают по TTL)"""
+    client = getattr(redis_client, 'client', None)
+    if client is None:
+        return []
+    keys = sorted(client.scan_iter(match=f"{prefix}:*", count=100))
+    if not keys:
+        return []
+    return [json.loads(raw) for raw in client.mget(keys) if raw]
+
+
+class ControlListener:
+    """Команды процессу-лидеру через CONTROL_CHANNEL: {'action': ..., ...}"""
+
+    def __init__(self, redis_client, handlers: Dict[str, Callable[[Dict[str, Any]], None]]):
+        self.redis_client = redis_client
+        self.handlers = handlers
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="control-listener")
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self):
+        backoff = 1
+        while self.running:
+            try:
+                for _, message in self.redis_client.listen_channels(
+                    [CONTROL_CHANNEL], timeout=1, is_running=lambda: self.running
+                ):
+                    backoff = 1
+                    handler = self.handlers.get(message.get('action'))
+                    if handler is None:
+                        continue
+                    try:
+                        handler(message)
+                    except Exception as e:
+                        logger.error(f"Control action {message.get('action')} failed: {e}")
+            except Exception as e:
+                logger.error(f"Control listener error: {e}, reconnecting in {backoff}s")
+                deadline = time.time() + backoff
+                while self.running and time.time() < deadline:
+                    time.sleep(0.1)
+                backoff = min(backoff * 2, 30)
+
+
+def send_control(redis_client, action: str, **params) -> bool:
+    """Команда лидеру (False - Redis недоступен или лидер не слушает канал)"""
+    client = getattr(redis_client, 'client', None)
+    if client is None:
+        return False
+    try:
+        # Число получателей: 0 - лидера нет или он еще не подписался
+        delivered = client.publish(CONTROL_CHANNEL, json.dumps(dict(params, action=action)))
+    except Exception as e:
+        logger.warning(f"Failed to send control action {action}: {e}")
+        return False
+    return bool(delivered)
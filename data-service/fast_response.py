@@ -0,0 +1,13 @@
+# data-service/fast_response.py
+from fastapi.responses import Response
+
+from row_format import dumps
+
+
+class FastJSONResponse(Response):
+    """JSON-ответ через orjson: без jsonable_encoder и промежуточной строки"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,439 @@
+# data-service/ingest_spool.py
+"""
+Локальный журнал упреждающей записи (spool) для приема данных.
+
+Принятые и отфильтрованные пакеты сначала дописываются в сегментные файлы
+на диске, после чего воркер приема свободен. fsync выполняется группами
+(раз в fsync_interval_ms на все накопившиеся записи), append возвращается
+после того, как его запись сброшена на диск.
+
+Отдельный поток (replayer) читает журнал с позиции контрольной точки и
+передает пакеты в IngestWriter.write_batch. Контрольная точка сдвигается
+только после commit в Postgres, поэтому при остановке или падении БД
+пакеты не теряются: после рестарта чтение продолжается с последней точки.
+При недоступности БД replayer повторяет батч с экспоненциальной паузой и
+уменьшает размер батча (AIMD), при успешных commit размер растет.
+
+Формат записи: заголовок (длина, crc32, время добавления в мс) + JSON.
+Сегменты, целиком лежащие до контрольной точки, удаляются.
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import orjson
+
+from shared.tracing import TraceContext
+from ingest_writer import PendingPacket
+
+logger = logging.getLogger("data-service-spool")
+
+_HEADER = struct.Struct('>IIQ')  # длина, crc32, время добавления (мс)
+_SEGMENT_SUFFIX = '.seg'
+_CHECKPOINT_FILE = 'checkpoint.json'
+
+# Позиция в журнале: (номер сегмента, смещение)
+Position = Tuple[int, int]
+
+
+def _segment_name(seq: int) -> str:
+    return f"{seq:012d}{_SEGMENT_SUFFIX}"
+
+
+class IngestSpool:
+    """Сегментный журнал на диске с групповым fsync и воспроизведением в БД"""
+
+    def __init__(self, directory: str, writer, segment_max_bytes: int = 64 * 1024 * 1024,
+                 fsync_interval_ms: float = 10, max_retry_seconds: float = 30):
+        self.directory = directory
+        self.writer = writer
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.max_retry_seconds = max_retry_seconds
+
+        self.running = False
+        self._cond = threading.Condition()
+        self._file = None
+        self._write_seq = 0
+        self._write_offset = 0
+        self._appended: Position = (0, 0)
+        self._durable: Position = (0, 0)
+        self._checkpoint: Position = (0, 0)
+        self._flusher = None
+        self._replayer = None
+
+        # Чтение (только поток replayer)
+        self._read_pos: Position = (0, 0)
+        self._read_file = None
+        self._read_file_seq = None
+        self._batch_size = max(1, writer.max_packets)
+        self._oldest_pending_ms: Optional[int] = None
+
+        self.metrics: Dict[str, Any] = {
+            'records_appended': 0,
+            'records_replayed': 0,
+            'bytes_appended': 0,
+            'fsyncs': 0,
+            'fsync_ms_avg': 0.0,
+            'fsync_ms_max': 0.0,
+            'append_wait_ms_max': 0.0,
+            'segments_rotated': 0,
+            'segments_deleted': 0,
+            'corrupted_tails': 0,
+            'replay_batches': 0,
+            'replay_failures': 0,
+            'replay_batch_size': self._batch_size,
+            'last_replay_at': None,
+            'last_error': None
+        }
+
+    # ==================== ЗАПУСК / ОСТАНОВКА ====================
+
+    def start(self):
+        """Восстановление позиции по контрольной точке и запуск потоков fsync и воспроизведения"""
+        if self.running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._checkpoint = self._load_checkpoint()
+        segments = self._segments()
+        if segments and self._checkpoint < (segments[0], 0):
+            # Сегменты до первого существующего уже удалены - начинаем с первого
+            self._checkpoint = (segments[0], 0)
+        self._read_pos = self._checkpoint
+
+        # Запись всегда в новый сегмент: хвост прежнего мог быть оборван при падении
+        self._write_seq = max(segments[-1] if segments else 0, self._checkpoint[0]) + 1
+        self._open_segment(self._write_seq)
+        self._durable = self._appended = (self._write_seq, 0)
+
+        self.running = True
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="spool-fsync")
+        self._replayer = threading.Thread(target=self._replay_loop, daemon=True, name="spool-replay")
+        self._flusher.start()
+        self._replayer.start()
+        logger.info(f"Ingest spool started in {self.directory}, replay from {self._checkpoint}, "
+                    f"backlog {self._backlog_bytes()} bytes")
+
+    def stop(self):
+        """Остановка: записанное на диск, но не воспроизведенное, останется до следующего запуска"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for thread in (self._replayer, self._flusher):
+            if thread:
+                thread.join(timeout=30)
+        with self._cond:
+            self._sync_locked()
+            if self._file:
+                self._file.close()
+                self._file = None
+        if self._read_file:
+            self._read_file.close()
+            self._read_file = None
+        logger.info("Ingest spool stopped")
+
+    # ==================== ЗАПИСЬ ====================
+
+    def append(self, data: dict, id_session: int, trace: Optional[TraceContext] = None):
+        """Добавление пакета в журнал; возвращается после fsync записи"""
+        payload = orjson.dumps({'d': data, 's': id_session, 't': trace.to_dict() if trace else None})
+        record = _HEADER.pack(len(payload), zlib.crc32(payload), int(time.time() * 1000)) + payload
+
+        started = time.perf_counter()
+        with self._cond:
+            if not self.running:
+                raise RuntimeError("Ingest spool is stopped")
+            self._file.write(record)
+            self._write_offset += len(record)
+            position = (self._write_seq, self._write_offset)
+            self._appended = position
+            self.metrics['records_appended'] += 1
+            self.metrics['bytes_appended'] += len(record)
+
+            if self._write_offset >= self.segment_max_bytes:
+                self._rotate_locked()
+
+            # Групповой fsync: ждем, пока поток fsync не сбросит эту запись
+            while self._durable < position and self.running:
+                self._cond.wait(self.fsync_interval * 4 or 0.01)
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        if wait_ms > self.metrics['append_wait_ms_max']:
+            self.metrics['append_wait_ms_max'] = wait_ms
+        if trace:
+            trace.mark('spool_append')
+
+    def _open_segment(self, seq: int):
+        path = os.path.join(self.directory, _segment_name(seq))
+        self._file = open(path, 'ab')
+        self._write_seq = seq
+        self._write_offset = self._file.tell()
+
+    def _rotate_locked(self):
+        """Закрытие заполненного сегмента (с fsync) и переход к следующему"""
+        self._sync_locked()
+        self._file.close()
+        self._open_segment(self._write_seq + 1)
+        self._appended = self._durable = (self._write_seq, 0)
+        self.metrics['segments_rotated'] += 1
+        self._cond.notify_all()
+
+    def _sync_locked(self):
+        if self._file is None or self._durable >= self._appended:
+            return
+        started = time.perf_counter()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._durable = self._appended
+
+        fsync_ms = (time.perf_counter() - started) * 1000
+        metrics = self.metrics
+        metrics['fsyncs'] += 1
+        metrics['fsync_ms_avg'] += (fsync_ms - metrics['fsync_ms_avg']) / metrics['fsyncs']
+        metrics['fsync_ms_max'] = max(metrics['fsync_ms_max'], fsync_ms)
+        self._cond.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self.running:
+                    return
+                self._cond.wait(self.fsync_interval)
+                try:
+                    self._sync_locked()
+                except OSError as e:
+                    self.metrics['last_error'] = f"fsync: {e}"
+                    logger.error(f"Spool fsync failed: {e}")
+
+    # ==================== ВОСПРОИЗВЕДЕНИЕ ====================
+
+    def _replay_loop(self):
+        retry_delay = 0.5
+        while self.running:
+            try:
+                records, end_pos = self._read_batch(self._batch_size, self.writer.window_ms / 1000)
+                if not records:
+                    continue
+
+                # Батч повторяется целиком, пока БД не примет его
+                while self.running:
+                    if self.writer.write_batch(records, by_size=len(records) >= self._batch_size):
+                        break
+                    self.metrics['replay_failures'] += 1
+                    self.metrics['last_error'] = "database unavailable"
+                    self._batch_size = max(1, self._batch_size // 2)
+                    self._sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, self.max_retry_seconds)
+                else:
+                    return
+
+                retry_delay = 0.5
+                self._batch_size = min(self.writer.max_packets, self._batch_size + max(1, self._batch_size // 10))
+                self.metrics['replay_batch_size'] = self._batch_size
+                self.metrics['replay_batches'] += 1
+                self.metrics['records_replayed'] += len(records)
+                self.metrics['last_replay_at'] = datetime.now().isoformat()
+                self._read_pos = end_pos
+                self._oldest_pending_ms = None
+                self._commit(end_pos)
+            except Exception as e:
+                self.metrics['last_error'] = str(e)
+                logger.error(f"Spool replay error: {e}")
+                self._sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_seconds)
+
+    def _read_batch(self, max_records: int, window: float) -> Tuple[List[PendingPacket], Position]:
+        """
+        Чтение до max_records записей с текущей позиции
+
+        Если записей меньше, ждем новые не дольше window от первой прочитанной.
+        """
+        records: List[PendingPacket] = []
+        position = self._read_pos
+        deadline = None
+
+        while self.running:
+            position = self._read_available(position, records, max_records)
+            if len(records) >= max_records:
+                break
+            now = time.monotonic()
+            if records and deadline is None:
+                deadline = now + window
+            if deadline is not None and now >= deadline:
+                break
+            with self._cond:
+                if self._durable <= position and self.running:
+                    self._cond.wait(deadline - now if deadline is not None else 1)
+            if not records and deadline is None and self._durable <= position:
+                # Новых данных нет - отдаем управление циклу (проверка running)
+                break
+
+        return records, position
+
+    def _read_available(self, position: Position, records: List[PendingPacket], max_records: int) -> Position:
+        """Чтение сброшенных на диск записей начиная с position"""
+        with self._cond:
+            durable = self._durable
+
+        seq, offset = position
+        while len(records) < max_records and (seq, offset) < durable:
+            handle = self._reader(seq)
+            if handle is None:
+                # Сегмент отсутствует - переходим к следующему
+                seq, offset = seq + 1, 0
+                continue
+
+            limit = durable[1] if seq == durable[0] else None
+            handle.seek(offset)
+            header = handle.read(_HEADER.size)
+            if limit is None and len(header) < _HEADER.size:
+                # Конец закрытого сегмента
+                seq, offset = seq + 1, 0
+                continue
+
+            length, crc, appended_ms = _HEADER.unpack(header)
+            # Длина проверяется до чтения: в оборванном хвосте заголовок может
+            # быть нулевым (crc32(b'') == 0) или содержать мусорную длину
+            end = limit if limit is not None else os.fstat(handle.fileno()).st_size
+            item = None
+            if 0 < length <= end - offset - _HEADER.size:
+                payload = handle.read(length)
+                if len(payload) == length and zlib.crc32(payload) == crc:
+                    item = self._decode(payload)
+            if item is None:
+                # Оборванный хвост сегмента после падения - остаток сегмента пропускается
+                self.metrics['corrupted_tails'] += 1
+                logger.warning(f"Spool segment {seq}: corrupted record at {offset}, skipping rest of segment")
+                seq, offset = seq + 1, 0
+                continue
+
+            offset += _HEADER.size + length
+            trace = TraceContext.from_message({'trace': item['t']}) if item.get('t') else None
+            if self._oldest_pending_ms is None:
+                self._oldest_pending_ms = appended_ms
+            records.append(PendingPacket(item['d'], item['s'], trace))
+
+        return seq, offset
+
+    @staticmethod
+    def _decode(payload: bytes) -> Optional[Dict[str, Any]]:
+        """Запись журнала или None, если содержимое не разбирается"""
+        try:
+            item = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return None
+        if not isinstance(item, dict) or 'd' not in item or 's' not in item:
+            return None
+        return item
+
+    def _reader(self, seq: int):
+        if self._read_file_seq == seq and self._read_file:
+            return self._read_file
+        if self._read_file:
+            self._read_file.close()
+            self._read_file = None
+        path = os.path.join(self.directory, _segment_name(seq))
+        if not os.path.exists(path):
+            return None
+        self._read_file = open(path, 'rb')
+        self._read_file_seq = seq
+        return self._read_file
+
+    # ==================== КОНТРОЛЬНАЯ ТОЧКА ====================
+
+    def _commit(self, position: Position):
+        """Атомарная запись контрольной точки и удаление пройденных сегментов"""
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': position[0], 'offset': position[1],
+                       'updated_at': datetime.now().isoformat()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._checkpoint = position
+
+        for seq in self._segments():
+            if seq >= position[0]:
+                break
+            if self._read_file_seq == seq and self._read_file:
+                self._read_file.close()
+                self._read_file = None
+            try:
+                os.remove(os.path.join(self.directory, _segment_name(seq)))
+                self.metrics['segments_deleted'] += 1
+            except OSError as e:
+                logger.warning(f"Failed to delete spool segment {seq}: {e}")
+
+    def _load_checkpoint(self) -> Position:
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return int(data['segment']), int(data['offset'])
+        except FileNotFoundError:
+            return 0, 0
+        except (ValueError, KeyError) as e:
+            logger.error(f"Spool checkpoint is corrupted ({e}), replaying all segments")
+            return 0, 0
+
+    def _segments(self) -> List[int]:
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    result.append(int(name[:-len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(result)
+
+    # ==================== МЕТРИКИ ====================
+
+    def _backlog_bytes(self) -> int:
+        """Объем журнала после контрольной точки"""
+        checkpoint_seq, checkpoint_offset = self._checkpoint
+        total = 0
+        for seq in self._segments():
+            if seq < checkpoint_seq:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, _segment_name(seq)))
+            except OSError:
+                continue
+            total += size - checkpoint_offset if seq == checkpoint_seq else size
+        return max(total, 0)
+
+    def status(self) -> Dict[str, Any]:
+        """Глубина журнала, отставание воспроизведения и метрики fsync"""
+        with self._cond:
+            appended, durable = self._appended, self._durable
+        caught_up = self._checkpoint >= durable
+        lag_seconds = 0.0
+        if not caught_up and self._oldest_pending_ms is not None:
+            lag_seconds = max(time.time() - self._oldest_pending_ms / 1000, 0.0)
+
+        return {
+            'running': self.running,
+            'directory': self.directory,
+            'segments': len(self._segments()),
+            'write_position': list(appended),
+            'durable_position': list(durable),
+            'checkpoint': list(self._checkpoint),
+            'backlog_bytes': self._backlog_bytes(),
+            'backlog_records_estimate': self.metrics['records_appended'] - self.metrics['records_replayed'],
+            'caught_up': caught_up,
+            'lag_seconds': round(lag_seconds, 3),
+            'metrics': dict(self.metrics)
+        }
+
+    def _sleep(self, seconds: float):
+        deadline = time.time() + seconds
+        while self.running and time.time() < deadline:
+            time.sleep(min(0.1, deadline - time.time()))
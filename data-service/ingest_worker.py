@@ -0,0 +1,195 @@
+# data-service/ingest_worker.py
+"""
+Процесс приема данных, отдельный от HTTP API.
+
+Подписчик Redis, микро-батчинг и журнал на диске работают в своем процессе:
+HTTP API запускается с несколькими воркерами uvicorn (INGEST_MODE=external),
+не создавая повторных подписчиков. Процессов приема может быть несколько -
+каждый обслуживает свои шарды каналов (shared.ingest_partition), пакеты
+одного модуля всегда попадают в один процесс.
+
+Состояние процесса периодически пишется в Redis (ingest:status:<шарды>),
+откуда его отдают /api/admin/ingest и /api/admin/spool API.
+
+Запуск: python ingest_worker.py [--shards 0,1]
+"""
+import os
+import json
+import time
+import signal
+import argparse
+import logging
+import threading
+from typing import List, Optional, Dict, Any
+
+from config import settings
+from models_postgres import PostgreSQLDatabaseManager
+from redis_subscriber import RedisSubscriber
+from ingest_writer import IngestWriter
+from ingest_spool import IngestSpool
+from live_state import LiveStateCache
+from active_session import ActiveSession
+from shared.redis_client import get_redis_client
+from shared.ingest_partition import INGEST_SHARDS, shard_channels
+
+logger = logging.getLogger("data-service-ingest")
+
+STATUS_KEY_PREFIX = 'ingest:status:'
+STATUS_INTERVAL_SECONDS = 5
+
+
+def parse_shards(value: str) -> List[int]:
+    """Список шардов из строки '0,2' (пустая строка - все шарды)"""
+    if not value.strip():
+        return list(range(INGEST_SHARDS))
+    shards = sorted({int(part) for part in value.split(',') if part.strip()})
+    invalid = [shard for shard in shards if not 0 <= shard < INGEST_SHARDS]
+    if invalid:
+        raise ValueError(f"Shards {invalid} out of range 0..{INGEST_SHARDS - 1}")
+    return shards
+
+
+def create_live_state() -> Optional[LiveStateCache]:
+    """Кэш живого состояния сессий (None - выключен LIVE_STATE_ENABLED)"""
+    if not settings.LIVE_STATE_ENABLED:
+        return None
+    return LiveStateCache(
+        get_redis_client(),
+        trail_seconds=settings.LIVE_TRAIL_SECONDS,
+        ttl_seconds=settings.LIVE_STATE_TTL_SECONDS
+    )
+
+
+def create_ingest_pipeline(db_manager, shards: List[int],
+                           active_session: Optional[ActiveSession] = None) -> RedisSubscriber:
+    """
+    Подписчик каналов шардов с микро-батчингом и журналом на диске
+
+    Журнал у каждого набора шардов свой: два процесса не пишут в один каталог.
+    Текущую сессию приема процесс узнает из active_session (по умолчанию - из Redis).
+    """
+    if active_session is None:
+        active_session = ActiveSession(get_redis_client(), db_manager)
+    live_state = create_live_state()
+
+    ingest_writer = None
+    if settings.INGEST_BATCH_ENABLED or settings.INGEST_SPOOL_ENABLED:
+        ingest_writer = IngestWriter(
+            db_manager,
+            get_redis_client(),
+            max_packets=settings.INGEST_BATCH_MAX_PACKETS,
+            min_window_ms=settings.INGEST_BATCH_MIN_WINDOW_MS,
+            max_latency_ms=settings.INGEST_MAX_LATENCY_MS,
+            live_state=live_state
+        )
+
+    # Журнал на диске: батчи в БД пишет поток воспроизведения журнала
+    ingest_spool = None
+    if settings.INGEST_SPOOL_ENABLED:
+        spool_dir = settings.SPOOL_DIR
+        if len(shards) < INGEST_SHARDS:
+            spool_dir = os.path.join(spool_dir, 'shard-' + '-'.join(str(shard) for shard in shards))
+        ingest_spool = IngestSpool(
+            spool_dir,
+            ingest_writer,
+            segment_max_bytes=settings.SPOOL_SEGMENT_MB * 1024 * 1024,
+            fsync_interval_ms=settings.SPOOL_FSYNC_INTERVAL_MS
+        )
+        ingest_spool.start()
+    elif ingest_writer:
+        ingest_writer.start()
+
+    return RedisSubscriber(
+        db_manager,
+        workers=settings.INGEST_WORKERS,
+        queue_size=settings.INGEST_QUEUE_SIZE,
+        writer=ingest_writer,
+        spool=ingest_spool,
+        channels=shard_channels(shards),
+        live_state=live_state,
+        active_session=active_session
+    )
+
+
+def stop_ingest_pipeline(subscriber: Optional[RedisSubscriber]):
+    """Остановка подписчика, затем журнала и записи накопленного батча"""
+    if not subscriber:
+        return
+    subscriber.stop()
+    logger.info("Redis subscriber stopped")
+    # Невоспроизведенная часть журнала останется на диске до следующего запуска
+    if subscriber.spool:
+        subscriber.spool.stop()
+    # Дописываем накопленный микро-батч после остановки воркеров
+    if subscriber.writer:
+        subscriber.writer.stop()
+
+
+def status_key(shards: List[int]) -> str:
+    return STATUS_KEY_PREFIX + ','.join(str(shard) for shard in shards)
+
+
+def read_ingest_status(redis_client) -> List[Dict[str, Any]]:
+    """Последние состояния всех процессов приема (устаревшие истекают по TTL)"""
+    client = getattr(redis_client, 'client', None)
+    if client is None:
+        return []
+    result = []
+    for key in sorted(client.scan_iter(match=STATUS_KEY_PREFIX + '*', count=100)):
+        raw = client.get(key)
+        if raw:
+            result.append(json.loads(raw))
+    return result
+
+
+def _report_status(subscriber: RedisSubscriber, shards: List[int], stop_event: threading.Event):
+    key = status_key(shards)
+    while not stop_event.wait(STATUS_INTERVAL_SECONDS):
+        try:
+            status = subscriber.status()
+            status.update({'shards': shards, 'pid': os.getpid(), 'reported_at': time.time()})
+            subscriber.redis_client.client.set(
+                key, json.dumps(status, default=str), ex=STATUS_INTERVAL_SECONDS * 3
+            )
+        except Exception as e:
+            logger.warning(f"Failed to report ingest status: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest worker: Redis -> spool -> PostgreSQL")
+    parser.add_argument('--shards', default=settings.INGEST_SHARD_INDEXES,
+                        help=f"Shards of this process, e.g. '0,1' (of {INGEST_SHARDS}); empty - all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    shards = parse_shards(args.shards)
+
+    db_manager = PostgreSQLDatabaseManager()
+    subscriber = create_ingest_pipeline(db_manager, shards)
+    subscriber.start()
+    if not subscriber.running:
+        stop_ingest_pipeline(subscriber)
+        raise SystemExit("Ingest worker could not start: no Redis connection")
+    logger.info(f"Ingest worker started: shards {shards} of {INGEST_SHARDS}, PID {os.getpid()}")
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    reporter = threading.Thread(target=_report_status, args=(subscriber, shards, stop_event),
+                                daemon=True, name="ingest-status")
+    reporter.start()
+
+    while not stop_event.wait(1):
+        pass
+    logger.info("Shutting down ingest worker...")
+    stop_ingest_pipeline(subscriber)
+    try:
+        subscriber.redis_client.client.delete(status_key(shards))
+    except Exception:
+        pass
+    logger.info("Ingest worker stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+# data-service/ingest_writer.py
+"""
+Микро-батчинг записи принятых пакетов.
+
+Воркеры RedisSubscriber передают отфильтрованные пакеты в IngestWriter,
+который копит их и записывает одной транзакцией
+(save_structured_data_packets). Сброс происходит при наборе max_packets
+пакетов или по истечении окна с момента прихода первого пакета батча.
+
+Окно подстраивается под задержку commit: под нагрузкой (полные батчи,
+commit дольше окна) растет, в простое - сжимается до min_window_ms.
+Окно никогда не превышает max_latency_ms за вычетом средней задержки
+commit, поэтому пакет попадает на карту не позже max_latency_ms (при
+commit, укладывающемся в свою среднюю). Сообщение frontend_updates
+публикуется одно на сессию за сброс.
+"""
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+from shared.tracing import TraceContext, record_trace
+
+logger = logging.getLogger("data-service-ingest-writer")
+
+
+class PendingPacket:
+    """Пакет, ожидающий записи"""
+
+    __slots__ = ('data', 'id_session', 'trace', 'arrived', 'done')
+
+    def __init__(self, data: dict, id_session: int, trace: Optional[TraceContext],
+                 arrived: Optional[float] = None):
+        self.data = data
+        self.id_session = id_session
+        self.trace = trace
+        self.arrived = time.monotonic() if arrived is None else arrived
+        # Пакет обработан поштучной записью (записан или отброшен как ошибочный):
+        # при повторе батча после падения БД он пропускается
+        self.done = False
+
+
+class IngestWriter:
+    """Адаптивный микро-батчинг записи пакетов в БД и публикации обновлений"""
+
+    def __init__(self, db_manager, redis_client, max_packets: int = 500,
+                 min_window_ms: float = 5, max_latency_ms: float = 250,
+                 max_pending: int = 5000, live_state=None):
+        self.db_manager = db_manager
+        self.redis_client = redis_client
+        # LiveStateCache: последнее состояние модулей и треки в Redis (None - не ведется)
+        self.live_state = live_state
+        self.max_packets = max(1, max_packets)
+        self.min_window_ms = max(0.0, min_window_ms)
+        self.max_latency_ms = max(max_latency_ms, self.min_window_ms)
+        self.max_pending = max(max_pending, self.max_packets)
+
+        self.window_ms = self.min_window_ms
+        self.commit_ms_ewma = 0.0
+
+        self.running = False
+        self.thread = None
+        self._buffer: List[PendingPacket] = []
+        self._cond = threading.Condition()
+
+        self.metrics: Dict[str, Any] = {
+            'packets': 0,
+            'flushes': 0,
+            'flushes_by_size': 0,
+            'flushes_by_time': 0,
+            'failed_flushes': 0,
+            'fallback_packets': 0,
+            'lost_packets': 0,
+            'batch_packets_avg': 0.0,
+            'commit_ms_max': 0.0,
+            'wait_ms_max': 0.0,
+            'submit_blocked': 0,
+            'published': 0,
+            'last_flush_at': None
+        }
+
+    def start(self):
+        """Запуск потока записи"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True, name="ingest-writer")
+        self.thread.start()
+        logger.info(f"Ingest writer started: max {self.max_packets} packets, "
+                    f"window {self.min_window_ms}-{self.max_latency_ms} ms")
+
+    def stop(self):
+        """Остановка с записью накопленных пакетов"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=30)
+        logger.info("Ingest writer stopped")
+
+    def submit(self, data: dict, id_session: int, trace: Optional[TraceContext] = None):
+        """
+        Добавление пакета в текущий батч
+
+        При переполнении буфера (БД не успевает) вызывающий воркер ждет -
+        обратное давление передается в очереди RedisSubscriber.
+        """
+        with self._cond:
+            if len(self._buffer) >= self.max_pending:
+                self.metrics['submit_blocked'] += 1
+                while self.running and len(self._buffer) >= self.max_pending:
+                    self._cond.wait(0.5)
+            self._buffer.append(PendingPacket(data, id_session, trace))
+            self.metrics['packets'] += 1
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_packets:
+                self._cond.notify_all()
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._buffer)
+        return {
+            'running': self.running,
+            'pending': pending,
+            'window_ms': round(self.window_ms, 2),
+            'commit_ms_ewma': round(self.commit_ms_ewma, 2),
+            'max_packets': self.max_packets,
+            'max_latency_ms': self.max_latency_ms,
+            'metrics': dict(self.metrics)
+        }
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self.running and not self._buffer:
+                    self._cond.wait(1)
+                if not self._buffer:
+                    if not self.running:
+                        return
+                    continue
+
+                # Окно отсчитывается от прихода первого пакета батча
+                deadline = self._buffer[0].arrived + self.window_ms / 1000
+                while self.running and len(self._buffer) < self.max_packets:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                by_size = len(self._buffer) >= self.max_packets
+                batch = self._buffer[:self.max_packets]
+                del self._buffer[:self.max_packets]
+                self._cond.notify_all()
+
+            try:
+                if not self.write_batch(batch, by_size):
+                    self.metrics['lost_packets'] += sum(1 for item in batch if not item.done)
+            except Exception as e:
+                logger.error(f"Ingest flush error: {e}")
+
+    def write_batch(self, batch: List[PendingPacket], by_size: bool = False) -> bool:
+        """
+        Запись батча одной транзакцией и публикация обновлений
+
+        :return: False, если БД недоступна и батч записан не полностью. Батч можно
+            повторить целиком: пакеты, уже записанные поштучно, пропускаются
+        """
+        batch = [item for item in batch if not item.done]
+        if not batch:
+            return True
+        started = time.monotonic()
+        wait_ms = (started - batch[0].arrived) * 1000
+        result = self.db_manager.save_structured_data_packets([(item.data, item.id_session) for item in batch])
+        commit_ms = (time.monotonic() - started) * 1000
+
+        if result is None:
+            self.metrics['failed_flushes'] += 1
+            if not self.db_manager.is_available():
+                return False
+            # БД доступна - ошибка в данных: пишем пакеты по одному, чтобы один плохой пакет не терял остальные
+            result, complete = self._flush_one_by_one(batch)
+            if not complete:
+                # Записанное поштучно публикуется, остаток батча повторит вызывающий
+                self._publish([item for item in batch if item.done], result)
+                return False
+
+        metrics = self.metrics
+        metrics['flushes'] += 1
+        metrics['flushes_by_size' if by_size else 'flushes_by_time'] += 1
+        metrics['batch_packets_avg'] += (len(batch) - metrics['batch_packets_avg']) / metrics['flushes']
+        metrics['commit_ms_max'] = max(metrics['commit_ms_max'], commit_ms)
+        metrics['wait_ms_max'] = max(metrics['wait_ms_max'], wait_ms)
+        metrics['last_flush_at'] = datetime.now().isoformat()
+        self._adapt(len(batch), commit_ms, by_size)
+
+        for item in batch:
+            if item.trace:
+                item.trace.mark('db_commit')
+        self._publish(batch, result)
+        return True
+
+    def _flush_one_by_one(self, batch: List[PendingPacket]) -> Tuple[Dict[int, dict], bool]:
+        """
+        Поштучная запись батча
+
+        :return: (записанные точки по сессиям, False - БД стала недоступна и
+            необработанные пакеты нужно повторить)
+        """
+        result: Dict[int, dict] = {}
+        for item in batch:
+            saved = self.db_manager.save_structured_data_batch(item.data, item.id_session)
+            self.metrics['fallback_packets'] += 1
+            if not saved:
+                # Пакет отбрасывается, только если БД точно доступна (таймаут, deadlock
+                # или обрыв соединения - не ошибка в данных)
+                if not self.db_manager.is_available():
+                    return result, False
+                self.metrics['lost_packets'] += 1
+                item.done = True
+                continue
+            item.done = True
+            session_data = result.setdefault(item.id_session, {'points': [], 'time': saved['time']})
+            session_data['points'].extend(saved['points'])
+        return result, True
+
+    def _adapt(self, packets: int, commit_ms: float, by_size: bool):
+        """Подстройка окна по задержке commit"""
+        if self.commit_ms_ewma == 0.0:
+            self.commit_ms_ewma = commit_ms
+        else:
+            self.commit_ms_ewma += (commit_ms - self.commit_ms_ewma) * 0.2
+
+        # Бюджет окна: пакет должен успеть записаться за max_latency_ms
+        budget = max(self.min_window_ms, self.max_latency_ms - self.commit_ms_ewma)
+        if packets <= 1 and not by_size:
+            # Простой: пакет не должен ждать соседей
+            self.window_ms *= 0.5
+        elif by_size or commit_ms > self.window_ms:
+            # Нагрузка: крупнее батчи - меньше транзакций на пакет
+            self.window_ms = max(self.window_ms * 1.5, self.commit_ms_ewma, self.min_window_ms + 1)
+        self.window_ms = min(max(self.window_ms, self.min_window_ms), budget)
+
+    def _publish(self, batch: List[PendingPacket], result: Dict[int, dict]):
+        """Одно сообщение frontend_updates на сессию за сброс"""
+        traces_by_session: Dict[int, List[TraceContext]] = {}
+        for item in batch:
+            if item.trace:
+                traces_by_session.setdefault(item.id_session, []).append(item.trace)
+
+        for id_session, saved_data in result.items():
+            # Состояние обновляется до публикации: клиент, получивший обновление, увидит его в снимке
+            if self.live_state:
+                self.live_state.update(id_session, saved_data.get('points', []))
+            traces = traces_by_session.get(id_session, [])
+            for trace in traces:
+                trace.mark('frontend_publish')
+            frontend_message = {
+                'type': 'module_data',
+                'data': saved_data,
+                'id_session': id_session,
+                'timestamp': datetime.now().isoformat(),
+                'packets': sum(1 for item in batch if item.id_session == id_session),
+                'traces': [trace.to_dict() for trace in traces]
+            }
+            if self.redis_client.publish('frontend_updates', frontend_message):
+                self.metrics['published'] += 1
+            else:
+                logger.warning("Failed to forward batched data to frontend")
+                # Трассы не дойдут до моста - фиксируем путь до data-service
+                for trace in traces:
+                    record_trace(self.redis_client, trace)
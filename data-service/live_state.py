@@ -0,0 +1,230 @@
+# data-service/live_state.py
+"""
+Живое состояние модулей в Redis.
+
+Прием данных после commit обновляет для каждой сессии:
+  live:<сессия>              hash: модуль -> последнее сообщение (формат get_last_message)
+  live:<сессия>:coords       hash: модуль -> последние валидные координаты
+  live:<сессия>:trail:<модуль> sorted set: точки трека за последние LIVE_TRAIL_SECONDS
+                               (score - datetime_unix пакета)
+  live:<сессия>:complete     метка: в live:<сессия> есть все модули сессии
+
+Прием добавляет в hash только модули из своих пакетов, поэтому после
+истечения ключей или перезапуска hash содержит не все модули. Пока метки
+нет, снимок не отдается: API строит ответ по Postgres и дополняет им
+состояние (seed), после чего ставит метку.
+
+Снимок для открывающейся карты и недавние треки отдаются из Redis без
+запросов к Postgres; Postgres остается для исторических диапазонов.
+Ключи истекают через ttl после последнего обновления сессии.
+"""
+import logging
+from typing import Optional, Dict, Any, List, Iterable
+
+import orjson
+
+logger = logging.getLogger("data-service-live-state")
+
+
+def _state_key(id_session: int) -> str:
+    return f"live:{id_session}"
+
+
+def _coords_key(id_session: int) -> str:
+    return f"live:{id_session}:coords"
+
+
+def _complete_key(id_session: int) -> str:
+    return f"live:{id_session}:complete"
+
+
+def _trail_key(id_session: int, id_module: str) -> str:
+    return f"live:{id_session}:trail:{id_module}"
+
+
+def _message(point: Dict[str, Any]) -> Dict[str, Any]:
+    """Запись data (format_data_rows) в формат последнего сообщения (format_message_rows)"""
+    return {
+        'id': point['id'],
+        'id_module': point['id_module'],
+        'module_name': point.get('module_name'),
+        'module_color': point.get('module_color'),
+        'id_session': point.get('id_session'),
+        'id_message_type': point.get('message_type'),
+        'message_type': point.get('message_type_name'),
+        'datetime': point.get('datetime'),
+        'datetime_unix': point.get('datetime_unix'),
+        'coords': None,
+        'rssi': point.get('rssi'),
+        'snr': point.get('snr'),
+        'source': point.get('source'),
+        'jumps': point.get('jumps'),
+        'gps_ok': bool(point.get('gps_ok')),
+        'message_number': point.get('message_number')
+    }
+
+
+def _valid_coords(point: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    coords = point.get('coords') or {}
+    if not point.get('gps_ok') or coords.get('lat') is None or coords.get('lon') is None:
+        return None
+    alt = coords.get('alt')
+    return {'lat': coords['lat'], 'lon': coords['lon'], 'alt': alt if alt is not None else 0.0}
+
+
+class LiveStateCache:
+    """Последнее состояние модулей и недавние треки сессий в Redis"""
+
+    def __init__(self, redis_client, trail_seconds: int = 300, ttl_seconds: int = 6 * 3600):
+        self.redis_client = redis_client
+        self.trail_seconds = trail_seconds
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def _client(self):
+        return getattr(self.redis_client, 'client', None)
+
+    def update(self, id_session: int, points: Iterable[Dict[str, Any]]) -> bool:
+        """
+        Обновление после записи пакетов сессии (ошибки Redis не мешают приему)
+
+        Из нескольких точек модуля в батче в состояние попадает последняя.
+        """
+        client = self._client
+        if client is None:
+            return False
+
+        messages: Dict[str, Dict[str, Any]] = {}
+        coords: Dict[str, Dict[str, Any]] = {}
+        trails: Dict[str, Dict[bytes, int]] = {}
+        for point in points:
+            id_module = point['id_module']
+            messages[id_module] = _message(point)
+            valid = _valid_coords(point)
+            if valid is None:
+                continue
+            coords[id_module] = valid
+            if point.get('datetime_unix') is not None:
+                member = orjson.dumps([point['datetime_unix'], valid['lat'], valid['lon'], valid['alt'], point['id']])
+                trails.setdefault(id_module, {})[member] = point['datetime_unix']
+        if not messages:
+            return True
+
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(_state_key(id_session), mapping={
+                id_module: orjson.dumps(message) for id_module, message in messages.items()
+            })
+            pipe.expire(_state_key(id_session), self.ttl_seconds)
+            # Метка живет столько же, сколько состояние (если ее нет - не создается)
+            pipe.expire(_complete_key(id_session), self.ttl_seconds)
+            if coords:
+                pipe.hset(_coords_key(id_session), mapping={
+                    id_module: orjson.dumps(value) for id_module, value in coords.items()
+                })
+                pipe.expire(_coords_key(id_session), self.ttl_seconds)
+            for id_module, members in trails.items():
+                key = _trail_key(id_session, id_module)
+                pipe.zadd(key, members)
+                # Окно считается от последней точки модуля, а не от часов сервера
+                pipe.zremrangebyscore(key, '-inf', f"({max(members.values()) - self.trail_seconds}")
+                pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Live state update failed for session {id_session}: {e}")
+            return False
+
+    def snapshot(self, id_session: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Последнее сообщение каждого модуля (как get_last_message)
+
+        None - полного состояния сессии в Redis нет (данные нужно взять из
+        Postgres и передать в seed).
+        """
+        client = self._client
+        if client is None:
+            return None
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(_complete_key(id_session))
+        pipe.hgetall(_state_key(id_session))
+        pipe.hgetall(_coords_key(id_session))
+        complete, state, coords = pipe.execute()
+        if not complete or not state:
+            return None
+
+        result = []
+        for id_module, raw in state.items():
+            message = orjson.loads(raw)
+            # Последнее сообщение без GPS - координаты последнего валидного (effective_* в SQL)
+            raw_coords = coords.get(id_module)
+            message['coords'] = orjson.loads(raw_coords) if raw_coords else None
+            result.append(message)
+        result.sort(key=lambda message: message['id_module'])
+        return result
+
+    def seed(self, id_session: int, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Дополнение состояния последними сообщениями из Postgres (get_last_message)
+
+        Записи, которые прием уже обновил, не перезаписываются: они не старше
+        прочитанных из БД. После записи состояние считается полным.
+        """
+        client = self._client
+        if client is None or not messages:
+            return False
+        try:
+            pipe = client.pipeline(transaction=False)
+            for message in messages:
+                id_module = message['id_module']
+                pipe.hsetnx(_state_key(id_session), id_module, orjson.dumps(dict(message, coords=None)))
+                if message.get('coords'):
+                    pipe.hsetnx(_coords_key(id_session), id_module, orjson.dumps(message['coords']))
+            pipe.expire(_state_key(id_session), self.ttl_seconds)
+            pipe.expire(_coords_key(id_session), self.ttl_seconds)
+            pipe.set(_complete_key(id_session), 1, ex=self.ttl_seconds)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Live state seed failed for session {id_session}: {e}")
+            return False
+
+    def trails(self, id_session: int, modules: Optional[List[str]] = None,
+               seconds: Optional[int] = None) -> Dict[str, List[list]]:
+        """Недавние точки треков: модуль -> [[datetime_unix, lat, lon, alt, id], ...] по времени"""
+        client = self._client
+        if client is None:
+            return {}
+        if modules is None:
+            modules = sorted(client.hkeys(_state_key(id_session)))
+        seconds = min(seconds or self.trail_seconds, self.trail_seconds)
+
+        pipe = client.pipeline(transaction=False)
+        for id_module in modules:
+            key = _trail_key(id_session, id_module)
+            # Последняя точка задает конец окна
+            pipe.zrange(key, -1, -1, withscores=True)
+        last_points = pipe.execute()
+
+        pipe = client.pipeline(transaction=False)
+        requested = []
+        for id_module, last in zip(modules, last_points):
+            if not last:
+                continue
+            requested.append(id_module)
+            pipe.zrangebyscore(_trail_key(id_session, id_module), last[0][1] - seconds, '+inf')
+        return {
+            id_module: [orjson.loads(member) for member in members]
+            for id_module, members in zip(requested, pipe.execute())
+        }
+
+    def invalidate(self, id_session: int):
+        """Удаление состояния сессии (сессия скрыта или удалена)"""
+        client = self._client
+        if client is None:
+            return
+        try:
+            keys = list(client.scan_iter(match=f"live:{id_session}:trail:*", count=500))
+            client.delete(_state_key(id_session), _coords_key(id_session), _complete_key(id_session), *keys)
+        except Exception as e:
+            logger.warning(f"Live state invalidation failed for session {id_session}: {e}")
@@ -0,0 +1,187 @@
+# data-service/log_parser.py
+"""
+Парсер текстовых строк телеметрии форматов GV/GL (7 и 10 полей).
+
+Функции модуля чистые: не обращаются к БД и не держат блокировок,
+поэтому их можно вызывать из любого количества потоков.
+"""
+import math
+from typing import NamedTuple, Optional, List, Tuple, Dict, Iterable
+
+
+class ParsedRecord(NamedTuple):
+    message_type: int
+    module_id: int
+    lat: Optional[float]
+    lon: Optional[float]
+    alt: Optional[float]
+    gps_ok: bool
+    message_number: Optional[int]
+    rssi: Optional[int]
+    snr: Optional[int]
+    source: Optional[int]
+    jumps: Optional[int]
+
+
+class LogParseError(ValueError):
+    """Строка не может быть разобрана"""
+
+
+# Ограничение длины текста строки в отчете об ошибках
+ERROR_TEXT_LIMIT = 200
+
+# Диапазон колонок INTEGER таблицы data
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
+
+# Типы сообщений, заведенные в таблице message_type (0 - Mesh, 1 - Sim, 2 - Mesh / Sim)
+MESSAGE_TYPES = frozenset((0, 1, 2))
+
+
+def parse_message_type(type_str: str) -> int:
+    """Парсинг типа сообщения"""
+    if type_str == "GV":
+        return 1
+    elif type_str == "GL":
+        return 0
+    else:
+        try:
+            message_type = int(type_str)
+        except ValueError:
+            return 0  # По умолчанию Mesh
+        # Неизвестный тип нарушил бы внешний ключ data.id_message_type и отклонил весь COPY
+        if message_type not in MESSAGE_TYPES:
+            raise LogParseError(f"Неизвестный тип сообщения: {type_str}")
+        return message_type
+
+
+def parse_gps(lat: Optional[str], lon: Optional[str], alt: Optional[str]) -> Tuple[bool, Optional[float], Optional[float], Optional[float]]:
+    """Парсинг GPS данных"""
+    try:
+        values = float(lat), float(lon), float(alt)
+    except (ValueError, TypeError):
+        return False, None, None, None
+    # nan/inf в координатах - такой же невалидный GPS, как нечисловые поля
+    if not all(math.isfinite(value) for value in values):
+        return False, None, None, None
+    return (True,) + values
+
+
+def _check_int(value: int, name: str) -> int:
+    """Значение, помещающееся в колонку INTEGER (иначе COPY отклонит весь батч)"""
+    if not INT32_MIN <= value <= INT32_MAX:
+        raise LogParseError(f"Значение {name} вне диапазона integer: {value}")
+    return value
+
+
+def _round_half_up(value: float, name: str) -> int:
+    """Округление как при приведении numeric -> integer в PostgreSQL"""
+    if not math.isfinite(value):
+        raise LogParseError(f"Недопустимое значение {name}: {value}")
+    return _check_int(int(value + 0.5) if value >= 0 else -int(-value + 0.5), name)
+
+
+def _parse_link_info(field: str) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[int]]:
+    """Разбор поля вида 'rssi:snr' или 'sourceRjumps'"""
+    rssi = snr = source = jumps = None
+    if ':' in field:
+        rssi_str, snr_str = field.split(':')
+        rssi = _round_half_up(float(rssi_str), 'rssi') if rssi_str else None
+        snr = _round_half_up(float(snr_str), 'snr') if snr_str else None
+    elif 'R' in field:
+        source_str, jumps_str = field.split('R')
+        source = _check_int(int(source_str), 'source') if source_str else None
+        jumps = _check_int(int(jumps_str), 'jumps') if jumps_str else None
+    return rssi, snr, source, jumps
+
+
+def parse_log_line(data_string: str) -> ParsedRecord:
+    """
+    Разбор одной строки телеметрии
+
+    :param data_string: строка с данными
+    :return: ParsedRecord
+    :raises LogParseError: если строка не соответствует ни одному формату
+    """
+    parts = data_string.split()
+    if len(parts) < 6:
+        raise LogParseError(f"Недостаточно данных в строке: {len(parts)} частей")
+
+    lat = lon = alt = None
+    rssi = snr = source = jumps = None
+
+    try:
+        message_type = parse_message_type(parts[0])
+        module_id = _check_int(int(parts[1], 16), 'module_id')
+
+        if len(parts) == 7:
+            lat, lon, alt = parts[2:5]
+            message_number = _check_int(int(parts[5]), 'message_number')
+            rssi, snr, source, jumps = _parse_link_info(parts[6])
+        elif len(parts) == 10:
+            lat, lon, alt = parts[2:5]
+            message_number = _check_int(int(parts[9]), 'message_number')
+            rssi, snr, source, jumps = _parse_link_info(parts[6])
+        else:
+            # Общий формат: последний элемент - номер сообщения
+            lat, lon, alt = parts[2:5]
+            message_number = _check_int(int(parts[-1]), 'message_number')
+    except (ValueError, IndexError) as e:
+        raise LogParseError(f"Ошибка парсинга: {e}") from e
+
+    gps_ok, lat_val, lon_val, alt_val = parse_gps(lat, lon, alt)
+
+    return ParsedRecord(
+        message_type=message_type,
+        module_id=module_id,
+        lat=lat_val,
+        lon=lon_val,
+        alt=alt_val,
+        gps_ok=gps_ok,
+        message_number=message_number,
+        rssi=rssi,
+        snr=snr,
+        source=source,
+        jumps=jumps
+    )
+
+
+def parse_log_lines(lines: Iterable[str], first_line_no: int = 1) -> Tuple[List[Tuple[int, ParsedRecord]], List[Dict]]:
+    """
+    Пакетный разбор строк
+
+    :param lines: строки лога
+    :param first_line_no: номер первой строки в исходном файле
+    :return: (список пар (номер строки, ParsedRecord), список ошибок по строкам)
+    """
+    parsed = []
+    errors = []
+    append = parsed.append
+
+    for line_no, line in enumerate(lines, start=first_line_no):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            append((line_no, parse_log_line(line)))
+        except (LogParseError, ValueError, OverflowError) as e:
+            # Ошибка одной строки не должна срывать пакет и импорт файла
+            errors.append({
+                'line': line_no,
+                'error': str(e),
+                'text': line[:ERROR_TEXT_LIMIT]
+            })
+
+    return parsed, errors
+
+
+def to_data_row(record: ParsedRecord, id_session: int, datetime_str: str, datetime_unix: int) -> Tuple:
+    """Кортеж в порядке колонок таблицы data (см. DATA_COLUMNS)"""
+    return (
+        record.module_id, id_session, record.message_type,
+        datetime_str, datetime_unix,
+        record.lat, record.lon, record.alt, record.gps_ok,
+        record.message_number, record.rssi, record.snr,
+        record.source, record.jumps
+    )
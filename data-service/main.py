@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from contextlib import asynccontextmanager
 import requests
 import logging
@@ -15,10 +16,29 @@ from config import settings
 
 from models_postgres import PostgreSQLDatabaseManager
 from redis_subscriber import RedisSubscriber
+from bulk_import import BulkImporter
+from retention import RetentionService, build_policies
+from session_archive import SessionArchive
+from ingest_worker import create_ingest_pipeline, stop_ingest_pipeline, parse_shards, read_ingest_status, create_live_state
+from live_state import LiveStateCache
+from active_session import ActiveSession
+from coordination import (
+    LeaderElection, RedisJobStore, ProcessReporter, ControlListener, AdvisoryLock,
+    send_control, read_reports, process_id, LOCK_MIGRATION
+)
+from fast_response import FastJSONResponse
+from shared.redis_client import get_redis_client
+from shared.local_auth import LOCAL_AUTH_ENABLED, LocalAuthorizer, LocalAuthMiddleware, parse_prefixes
 
 # Глобальные переменные
 db_manager: Optional[PostgreSQLDatabaseManager] = None
 redis_subscriber: Optional[RedisSubscriber] = None
+bulk_importer: Optional[BulkImporter] = None
+retention_service: Optional[RetentionService] = None
+session_archive: Optional[SessionArchive] = None
+live_state: Optional[LiveStateCache] = None
+leader_election: Optional[LeaderElection] = None
+query_stats_reporter: Optional[ProcessReporter] = None
 logger = logging.getLogger("data-service")
 
 import time
@@ -65,30 +85,179 @@ def get_redis_subscriber() -> RedisSubscriber:
         raise HTTPException(status_code=500, detail="Redis service not available")
     return redis_subscriber
 
+def get_bulk_importer() -> BulkImporter:
+    """Безопасное получение сервиса пакетного импорта"""
+    if bulk_importer is None:
+        logger.error("Bulk importer accessed before initialization")
+        raise HTTPException(status_code=500, detail="Import service not available")
+    return bulk_importer
+
+def get_retention_service() -> RetentionService:
+    """Безопасное получение сервиса хранения данных"""
+    if retention_service is None:
+        logger.error("Retention service accessed before initialization")
+        raise HTTPException(status_code=500, detail="Retention service not available")
+    return retention_service
+
+def get_session_archive() -> SessionArchive:
+    """Безопасное получение холодного архива сессий"""
+    if session_archive is None:
+        logger.error("Session archive accessed before initialization")
+        raise HTTPException(status_code=500, detail="Archive service not available")
+    return session_archive
+
+def get_live_state() -> LiveStateCache:
+    """Безопасное получение кэша живого состояния сессий"""
+    if live_state is None:
+        raise HTTPException(status_code=404, detail="Live state is disabled")
+    return live_state
+
+# Ключи Redis общего состояния воркеров API
+IMPORT_JOBS_PREFIX = "import:job"
+ARCHIVE_JOBS_PREFIX = "archive:job"
+MIGRATION_STATE_PREFIX = "migration"
+RETENTION_REPORT_PREFIX = "retention:status"
+QUERY_STATS_PREFIX = "query_stats:process"
+QUERY_STATS_RESET_KEY = "query_stats:reset_at"
+
+def create_leader_election() -> LeaderElection:
+    """Фоновые службы, которые должны работать в одном процессе на все воркеры API"""
+    redis_client = get_redis_client()
+    control = ControlListener(redis_client, {
+        'retention_run': lambda message: retention_service.trigger()
+    })
+    retention_reporter = ProcessReporter(redis_client, RETENTION_REPORT_PREFIX, retention_service.status, interval=10)
+
+    def on_elected():
+        if settings.RETENTION_ENABLED:
+            retention_service.start()
+            control.start()
+            retention_reporter.start()
+        session_archive.resume(archive_hidden=settings.ARCHIVE_HIDDEN_ON_START)
+
+    def on_lost():
+        if settings.RETENTION_ENABLED:
+            retention_reporter.stop()
+            control.stop()
+            retention_service.stop()
+
+    return LeaderElection(settings.DATABASE_URL, on_elected, on_lost, interval=settings.LEADER_ELECTION_INTERVAL_SECONDS)
+
+def trigger_retention() -> bool:
+    """Внеочередной проход retention: в этом процессе или командой лидеру"""
+    service = get_retention_service()
+    if service.running:
+        service.trigger()
+        return True
+    return send_control(get_redis_client(), 'retention_run')
+
+def _query_stats_reset_at() -> Optional[float]:
+    """Время последнего общего сброса статистики запросов"""
+    client = get_redis_client().client
+    reset_at = client.get(QUERY_STATS_RESET_KEY) if client is not None else None
+    return float(reset_at) if reset_at else None
+
+def _query_stats_report() -> Dict[str, Any]:
+    """Отчет статистики запросов процесса; общий сброс применяется здесь же"""
+    from query_stats import query_stats
+    
+    reset_at = _query_stats_reset_at()
+    if reset_at and reset_at > query_stats.reset_at:
+        query_stats.reset(reset_at)
+    return query_stats.export()
+
+def _other_query_stats() -> List[Dict[str, Any]]:
+    """Статистика запросов остальных воркеров API (без отчетов, снятых до общего сброса)"""
+    own = process_id()
+    try:
+        reset_at = _query_stats_reset_at() or 0
+        reports = read_reports(get_redis_client(), QUERY_STATS_PREFIX)
+    except Exception as e:
+        logger.warning(f"Failed to read query stats of other workers: {e}")
+        return []
+    return [
+        report for report in reports
+        if report.get('process') != own and report.get('reset_at', 0) >= reset_at
+    ]
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Код при старте сервера
-    global db_manager, redis_subscriber, logger 
+    global db_manager, redis_subscriber, bulk_importer, retention_service, session_archive, live_state, logger
+    global leader_election, query_stats_reporter
 
     # Иницилизация менеджера БД
     db_manager = PostgreSQLDatabaseManager()
     logger.info(f"Main.py DB Manager instance: {id(db_manager)}")
-        
-    # Иницилизация подписчика Redis
-    redis_subscriber = RedisSubscriber(db_manager)
-    logger.info(f"RedisSubscriber instance: {id(redis_subscriber)}")
     
-    # Проверка подключения к Redis
-    if not redis_subscriber.redis_client:
-        logger.error("REDIS CLIENT IS NONE!")
-    elif not redis_subscriber.redis_client.is_connected():
-        logger.error("REDIS CLIENT NOT CONNECTED!")
+    # Текущая сессия приема: смена сессии в API доходит до процессов приема через Redis
+    active_session = ActiveSession(get_redis_client(), db_manager)
+    db_manager.on_session_change = active_session.publish
+    if db_manager.last_session:
+        active_session.publish(db_manager.last_session)
+        
+    # Прием данных: в процессе API только при INGEST_MODE=embedded,
+    # иначе подписчики работают в отдельных процессах ingest_worker.py
+    if settings.INGEST_MODE == "embedded":
+        redis_subscriber = create_ingest_pipeline(db_manager, parse_shards(""), active_session)
+        logger.info(f"RedisSubscriber instance: {id(redis_subscriber)}")
+        
+        # Проверка подключения к Redis
+        if not redis_subscriber.redis_client:
+            logger.error("REDIS CLIENT IS NONE!")
+        elif not redis_subscriber.redis_client.is_connected():
+            logger.error("REDIS CLIENT NOT CONNECTED!")
+        else:
+            logger.info("Redis client is connected")
+        
+        # Запуск подписчика Redis 
+        redis_subscriber.start()
+        logger.info("Redis subscriber started")
     else:
-        logger.info("Redis client is connected")
+        logger.info("Ingest runs in separate ingest_worker processes")
+
+    # Чтение живого состояния сессий, которое ведут процессы приема
+    live_state = create_live_state()
+    
+    # Иницилизация фонового импорта лог-файлов
+    bulk_importer = BulkImporter(
+        db_manager,
+        chunk_size=settings.IMPORT_CHUNK_SIZE,
+        max_errors=settings.IMPORT_MAX_ERRORS,
+        max_workers=settings.IMPORT_WORKERS,
+        job_store=RedisJobStore(get_redis_client(), IMPORT_JOBS_PREFIX)
+    )
+    
+    # Фоновое удаление данных по политикам хранения
+    retention_service = RetentionService(
+        db_manager,
+        build_policies(settings),
+        interval=settings.RETENTION_INTERVAL_SECONDS,
+        chunk_size=settings.RETENTION_CHUNK_SIZE,
+        chunk_pause_ms=settings.RETENTION_CHUNK_PAUSE_MS,
+        max_duty_cycle=settings.RETENTION_MAX_DUTY_CYCLE,
+        lock_timeout_ms=settings.RETENTION_LOCK_TIMEOUT_MS,
+        vacuum_threshold=settings.RETENTION_VACUUM_THRESHOLD,
+        vacuum_cost_delay_ms=settings.RETENTION_VACUUM_COST_DELAY_MS
+    )
     
-    # Запуск подписчика Redis 
-    redis_subscriber.start()
-    logger.info("Redis subscriber started")
+    # Холодный архив: задачи видны всем воркерам API через Redis
+    session_archive = SessionArchive(
+        db_manager,
+        chunk_size=settings.ARCHIVE_CHUNK_SIZE,
+        max_workers=settings.ARCHIVE_WORKERS,
+        lock_timeout_ms=settings.RETENTION_LOCK_TIMEOUT_MS,
+        database_url=settings.DATABASE_URL,
+        job_store=RedisJobStore(get_redis_client(), ARCHIVE_JOBS_PREFIX)
+    )
+    
+    # Планировщик retention и продолжение архиваций - только в процессе-лидере
+    leader_election = create_leader_election()
+    leader_election.start()
+    
+    # Статистика запросов процесса для сводки по всем воркерам API
+    query_stats_reporter = ProcessReporter(get_redis_client(), QUERY_STATS_PREFIX, _query_stats_report)
+    query_stats_reporter.start()
     
     logger.info(f"Application started! PID: {os.getpid()}")
     
@@ -96,9 +265,20 @@ async def lifespan(app: FastAPI):
     
     # Код при отключении сервера
     logger.info("Shutting down application...")
-    if redis_subscriber:
-        redis_subscriber.stop()
-        logger.info("Redis subscriber stopped")
+    stop_ingest_pipeline(redis_subscriber)
+    
+    if bulk_importer:
+        bulk_importer.shutdown()
+        logger.info("Bulk importer stopped")
+    
+    if query_stats_reporter:
+        query_stats_reporter.stop()
+    
+    if leader_election:
+        leader_election.stop()
+    
+    if session_archive:
+        session_archive.shutdown()
     
     logger.info("Application shutdown complete")
 
@@ -118,6 +298,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Локальная проверка доступа: без запроса к auth-service на каждый вызов API
+local_authorizer = None
+if LOCAL_AUTH_ENABLED:
+    local_authorizer = LocalAuthorizer(redis_client=get_redis_client())
+    app.add_middleware(
+        LocalAuthMiddleware,
+        authorizer=local_authorizer,
+        prefixes=parse_prefixes(settings.LOCAL_AUTH_PREFIXES)
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "data-service"}
@@ -426,6 +616,17 @@ async def create_session(session_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def rehydration_response(id_session: int) -> Optional[JSONResponse]:
+    """Если данные сессии в холодном архиве - запуск восстановления и ответ 202 с прогрессом"""
+    job = await asyncio.to_thread(get_session_archive().ensure_hot, id_session)
+    if job is None:
+        return None
+    return JSONResponse(status_code=202, content={
+        "message": "Данные сессии восстанавливаются из архива",
+        "job": job,
+        "status_url": f"/api/sessions/{id_session}/archive"
+    })
+
 def measure_operation(operation: callable, operation_name: str, *args, **kwargs):
     """Измеряет время выполнения операции и возвращает результат"""
     start_time = time.perf_counter()
@@ -442,15 +643,72 @@ def measure_operation(operation: callable, operation_name: str, *args, **kwargs)
 async def get_session_data(id_session: int):
     """Получение данных конкретной сессии"""
     try:
+        pending = await rehydration_response(id_session)
+        if pending:
+            return pending
+        
         current_db = get_db_manager()
         
         data = {}
         data["modules"] = measure_operation(current_db.get_last_message, "get_last_message", id_session)
         data["map"] = measure_operation(current_db.get_session_map_view, "get_session_map_view", id_session)
-        return data
+        return FastJSONResponse(content=data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/sessions/{id_session}/live")
+async def get_session_live(id_session: int):
+    """
+    Последнее состояние модулей сессии из Redis (без запросов к Postgres)
+
+    Если живого состояния нет или оно неполное (сессия давно без данных, ключи
+    истекли, кэш выключен или Redis недоступен), ответ строится по БД, как в
+    /api/sessions/{id_session}, и состояние в Redis дополняется им.
+    """
+    try:
+        modules = None
+        if live_state is not None:
+            try:
+                modules = await asyncio.to_thread(live_state.snapshot, id_session)
+            except Exception as e:
+                logger.warning(f"Live state read failed for session {id_session}: {e}")
+        if modules is not None:
+            return FastJSONResponse(content={"modules": modules, "source": "redis"})
+
+        modules = await asyncio.to_thread(get_db_manager().get_last_message, id_session)
+        if live_state is not None:
+            # Следующие запросы обслуживает Redis: прием дополняет уже полное состояние
+            await asyncio.to_thread(live_state.seed, id_session, modules)
+        return FastJSONResponse(content={"modules": modules, "source": "postgres"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/sessions/{id_session}/trail")
+async def get_session_trail(
+    id_session: int,
+    seconds: Optional[int] = Query(None, ge=1, description="Глубина трека, секунд (не больше LIVE_TRAIL_SECONDS)"),
+    modules: Optional[str] = Query(None, description="Модули через запятую (по умолчанию - все)")
+):
+    """
+    Недавние треки модулей из Redis: модуль -> [[datetime_unix, lat, lon, alt, id], ...]
+
+    Окно отсчитывается от последней точки модуля. Более давние диапазоны -
+    /api/table/users/datetime (Postgres).
+    """
+    cache = get_live_state()
+    module_list = [module.strip().upper() for module in modules.split(',') if module.strip()] if modules else None
+    try:
+        trails = await asyncio.to_thread(cache.trails, id_session, module_list, seconds)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Live state unavailable: {e}")
+    return FastJSONResponse(content={
+        "id_session": id_session,
+        "seconds": min(seconds or cache.trail_seconds, cache.trail_seconds),
+        "trails": trails
+    })
+
 @app.delete("/api/sessions/{id_session}")
 async def delete_session(id_session: int):
     """Удалить сессию"""
@@ -460,12 +718,145 @@ async def delete_session(id_session: int):
         if not current_db.hide_session(id_session):
             raise HTTPException(status_code=404, detail="Сессия не найдена")
         
+        if live_state is not None:
+            live_state.invalidate(id_session)
+        
+        # Данные скрытой сессии уходят в холодный архив в фоне
+        if settings.ARCHIVE_ON_HIDE:
+            get_session_archive().archive_session(id_session)
+        
         return {"message": "Сессия удалена"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+@app.post("/api/admin/sessions/{id_session}/restore")
+async def restore_session(id_session: int):
+    """Восстановить скрытую сессию (данные из архива возвращаются в фоне)"""
+    try:
+        current_db = get_db_manager()
+        
+        if not await asyncio.to_thread(current_db.unhide_session, id_session):
+            raise HTTPException(status_code=404, detail="Сессия не найдена")
+        
+        pending = await rehydration_response(id_session)
+        if pending:
+            return pending
+        return {"message": "Сессия восстановлена"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/sessions/{id_session}/archive")
+async def get_session_archive_status(id_session: int):
+    """Запись каталога архива и прогресс задачи архивации/восстановления"""
+    try:
+        return await asyncio.to_thread(get_session_archive().get_status, id_session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/sessions/{id_session}/archive")
+async def archive_session(id_session: int):
+    """Перенести данные скрытой сессии в холодный архив"""
+    job = get_session_archive().archive_session(id_session)
+    return JSONResponse(status_code=202, content={
+        "job": job,
+        "status_url": f"/api/sessions/{id_session}/archive"
+    })
+
+@app.get("/api/admin/archive")
+async def get_archive_catalog():
+    """Каталог холодного архива"""
+    try:
+        return await asyncio.to_thread(get_session_archive().list_catalog)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/sessions/{id_session}/purge")
+async def purge_session(id_session: int):
+    """Полное удаление сессии: сессия скрывается, данные удаляются в фоне порциями"""
+    if not settings.RETENTION_ENABLED:
+        # Очередь удаления разбирает только планировщик retention
+        raise HTTPException(status_code=409, detail="Retention is disabled: purge queue is not processed")
+    try:
+        current_db = get_db_manager()
+        
+        if not await asyncio.to_thread(current_db.delete_session_permanently, id_session):
+            raise HTTPException(status_code=404, detail="Сессия не найдена")
+        
+        if live_state is not None:
+            live_state.invalidate(id_session)
+        # Без лидера очередь будет разобрана на следующем плановом проходе
+        await asyncio.to_thread(trigger_retention)
+        return JSONResponse(status_code=202, content={
+            "message": "Сессия поставлена в очередь на удаление",
+            "status_url": "/api/admin/retention"
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/sessions/{id_session}/export")
+async def export_session(
+    id_session: int,
+    format: str = Query('parquet', description="Формат: arrow или parquet"),
+    target: str = Query('download', description="download - отдать файлом, directory - сохранить в EXPORT_DIR"),
+    batch_size: int = Query(None, description="Размер порции строк")
+):
+    """Колоночный экспорт данных сессии (Arrow IPC / Parquet)"""
+    try:
+        from session_export import (
+            EXPORT_FORMATS, validate_format, session_exists,
+            build_export_filename, iter_session_export, export_session_to_dir
+        )
+
+        fmt = validate_format(format)
+        if target not in ('download', 'directory'):
+            raise HTTPException(status_code=400, detail="target должен быть download или directory")
+
+        chunk_size = batch_size or settings.EXPORT_BATCH_SIZE
+        if chunk_size <= 0:
+            raise HTTPException(status_code=400, detail="batch_size должен быть положительным")
+
+        current_db = get_db_manager()
+
+        if not await asyncio.to_thread(session_exists, current_db, id_session):
+            raise HTTPException(status_code=404, detail="Сессия не найдена")
+
+        pending = await rehydration_response(id_session)
+        if pending:
+            return pending
+
+        if target == 'directory':
+            return await asyncio.to_thread(
+                export_session_to_dir, current_db, id_session, fmt, settings.EXPORT_DIR, chunk_size
+            )
+
+        filename = build_export_filename(id_session, fmt)
+        return StreamingResponse(
+            iter_session_export(current_db, id_session, fmt, chunk_size),
+            media_type=EXPORT_FORMATS[fmt]['media_type'],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Export error for session {id_session}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ==================== TABLE DATA ENDPOINTS ====================
 
+TABLE_LAYOUTS = ('rows', 'columnar')
+
 @app.get("/api/table/users/search")
 async def search_user(
     field: str = Query(..., description="Field to search"),
@@ -528,7 +919,8 @@ async def get_users_table(
     modules: str = Query(''),
     limit: int = Query(100),
     offset: int = Query(0),
-    direction: str = Query('down')
+    direction: str = Query('down'),
+    layout: str = Query('rows', description="rows - список объектов, columnar - колонки и словари модулей/типов")
 ):
     """API endpoint для получения данных с пагинацией"""
     try:
@@ -540,6 +932,9 @@ async def get_users_table(
         if offset < 0 or limit <= 0 or limit > 500:
             raise HTTPException(status_code=400, detail='Invalid parameters')
         
+        if layout not in TABLE_LAYOUTS:
+            raise HTTPException(status_code=400, detail=f'Invalid layout. Valid layouts: {TABLE_LAYOUTS}')
+        
         if direction == 'up':
             offset = offset - int((limit))
             if offset < 0:
@@ -551,7 +946,8 @@ async def get_users_table(
             id_session=id_session,
             module_ids=module_ids,
             limit=limit,
-            offset=offset
+            offset=offset,
+            columnar=layout == 'columnar'
         )
         
         if direction == 'up':
@@ -559,8 +955,9 @@ async def get_users_table(
         else:
             has_more = (offset + limit) > 1
             
-        return {
+        return FastJSONResponse(content={
             'success': True,
+            'layout': layout,
             'data': data,
             'total_count': total_count,
             'id_session': id_session,
@@ -569,8 +966,10 @@ async def get_users_table(
             'limit': limit,
             'offset': offset,
             'total_visible_count': modules_count,
-        }
+        })
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -582,7 +981,8 @@ async def get_users_datetime(
     modules: str = Query(''),
     limit: int = Query(100),
     datetime_unix: int = Query(0),
-    direction: str = Query('down')
+    direction: str = Query('down'),
+    layout: str = Query('rows', description="rows - список объектов, columnar - колонки и словари модулей/типов")
 ):
     """API endpoint для получения данных вокруг указанного datetime_unix"""
     try:
@@ -594,13 +994,17 @@ async def get_users_datetime(
         if datetime_unix <= 0 or limit <= 0 or limit > 500:
             raise HTTPException(status_code=400, detail='Invalid parameters')
         
+        if layout not in TABLE_LAYOUTS:
+            raise HTTPException(status_code=400, detail=f'Invalid layout. Valid layouts: {TABLE_LAYOUTS}')
+        
         current_db = get_db_manager()     
                 
         data, total_count, modules_count, position = current_db.get_session_data_centered_on_time(
             id_session=id_session,
             module_ids=module_ids,
             limit=limit,
-            target_datetime_unix=datetime_unix
+            target_datetime_unix=datetime_unix,
+            columnar=layout == 'columnar'
         )
         
         if direction == 'up':
@@ -608,8 +1012,9 @@ async def get_users_datetime(
         else:
             has_more = (datetime_unix + limit) > 1
             
-        return {
+        return FastJSONResponse(content={
             'success': True,
+            'layout': layout,
             'data': data,
             'total_count': total_count,
             'id_session': id_session,
@@ -619,8 +1024,10 @@ async def get_users_datetime(
             'datetime_unix': datetime_unix,
             'total_visible_count': modules_count,
             'target_id': position,
-        }
+        })
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -700,25 +1107,178 @@ async def get_database_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+migration_runner = None
+
+def get_migration_runner():
+    """Ленивое создание фонового запуска миграции"""
+    global migration_runner
+    if migration_runner is None:
+        from migrate_sqlite_to_postgres import MigrationRunner
+        # Миграция пересоздает таблицу modules - после успеха сбрасываем кэш модулей
+        # (остальные процессы сбрасывают свой при первом нарушении data_id_module_fkey)
+        # Блокировка и состояние в Redis: одна миграция на все воркеры API
+        migration_runner = MigrationRunner(
+            on_success=lambda: get_db_manager().invalidate_module_cache(),
+            lock=AdvisoryLock(settings.DATABASE_URL, LOCK_MIGRATION),
+            state_store=RedisJobStore(get_redis_client(), MIGRATION_STATE_PREFIX)
+        )
+    return migration_runner
+
 @app.get("/api/database/migrate-sqlite")
-async def migrate_sqlite_to_postgres():
-    """Миграция данных из SQLite в PostgreSQL"""
+async def migrate_sqlite_to_postgres(restart: bool = Query(False, description="Начать заново, игнорируя контрольные точки")):
+    """Запуск миграции данных из SQLite в PostgreSQL в фоне (прерванная миграция продолжается)"""
     try:
-        # Импортируем и запускаем миграцию
-        from migrate_sqlite_to_postgres import migrate_data, verify_migration
-        
-        logger.info("Starting SQLite to PostgreSQL migration...")
-        
-        if migrate_data():
-            verify_migration()
-            return {"message": "Migration completed successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Migration failed")
+        runner = get_migration_runner()
+        
+        if not runner.start(restart=restart):
+            return JSONResponse(status_code=409, content={
+                "message": "Migration already running",
+                "status_url": "/api/database/migrate-sqlite/status"
+            })
+        
+        logger.info(f"Starting SQLite to PostgreSQL migration (restart={restart})...")
+        return JSONResponse(status_code=202, content={
+            "message": "Migration started",
+            "status_url": "/api/database/migrate-sqlite/status"
+        })
             
     except Exception as e:
         logger.error(f"Migration error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/database/migrate-sqlite/status")
+async def get_migration_status():
+    """Состояние миграции и контрольные точки по таблицам"""
+    try:
+        return await asyncio.to_thread(get_migration_runner().status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/retention")
+async def get_retention_status():
+    """Политики хранения, прогресс удаления, очередь и метрики (планировщик работает в процессе-лидере)"""
+    try:
+        service = get_retention_service()
+        if not service.running:
+            reports = await asyncio.to_thread(read_reports, get_redis_client(), RETENTION_REPORT_PREFIX)
+            if reports:
+                return reports[0]
+        return await asyncio.to_thread(service.status)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/retention/run")
+async def run_retention():
+    """Внеочередной проход retention"""
+    if not settings.RETENTION_ENABLED:
+        raise HTTPException(status_code=409, detail="Retention scheduler is disabled")
+    if not await asyncio.to_thread(trigger_retention):
+        raise HTTPException(status_code=503, detail="Retention leader is not available")
+    return JSONResponse(status_code=202, content={"message": "Retention run scheduled"})
+
+@app.get("/api/admin/queries")
+async def get_query_stats(
+    sort: str = Query('total_ms', description="Поле сортировки: total_ms, avg_ms, max_ms, calls, errors, slow_calls"),
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """Статистика запросов по отпечаткам: гистограммы задержек, строки, ошибки, ожидание пула"""
+    from query_stats import query_stats
+    
+    others = await asyncio.to_thread(_other_query_stats)
+    snapshot = query_stats.snapshot(sort=sort, limit=limit, others=others)
+    snapshot['prepared_statements'] = get_db_manager().db.get_prepared_stats()
+    return snapshot
+
+@app.get("/api/admin/queries/slow")
+async def get_slow_queries(limit: int = Query(100, ge=1, le=1000)):
+    """Журнал медленных запросов (значения параметров не сохраняются)"""
+    from query_stats import query_stats
+    
+    others = await asyncio.to_thread(_other_query_stats)
+    return query_stats.slow_log(limit, others=others)
+
+@app.get("/api/admin/queries/explain")
+async def get_query_explains(
+    fingerprint: Optional[str] = Query(None, description="Отпечаток запроса"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Сохраненные планы EXPLAIN (ANALYZE, BUFFERS) медленных запросов"""
+    try:
+        return await asyncio.to_thread(get_db_manager().get_explain_samples, fingerprint, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/queries/reset")
+async def reset_query_stats():
+    """Сброс накопленной статистики запросов во всех воркерах API"""
+    from query_stats import query_stats
+    
+    query_stats.reset()
+    # Остальные воркеры сбрасывают счетчики при следующем отчете
+    client = get_redis_client().client
+    if client is not None:
+        try:
+            await asyncio.to_thread(client.set, QUERY_STATS_RESET_KEY, query_stats.reset_at, ex=86400 * 30)
+        except Exception as e:
+            logger.warning(f"Failed to propagate query stats reset: {e}")
+    return {"message": "Query statistics reset"}
+
+async def _ingest_processes() -> List[Dict[str, Any]]:
+    """Состояния процессов приема: свой подписчик или отчеты ingest_worker из Redis"""
+    if redis_subscriber is not None:
+        return [await asyncio.to_thread(redis_subscriber.status)]
+    return await asyncio.to_thread(read_ingest_status, get_redis_client())
+
+@app.get("/api/admin/ingest")
+async def get_ingest_status():
+    """Очереди воркеров приема данных из Redis и метрики обратного давления по процессам приема"""
+    try:
+        return {"mode": settings.INGEST_MODE, "processes": await _ingest_processes()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/spool")
+async def get_spool_status():
+    """Глубина журнала приема на диске, отставание воспроизведения в БД и метрики fsync"""
+    try:
+        spools = [
+            dict(process['spool'], channels=process.get('channels'))
+            for process in await _ingest_processes() if process.get('spool')
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not spools:
+        raise HTTPException(status_code=404, detail="Ingest spool is disabled")
+    return {"spools": spools}
+
+@app.get("/api/admin/auth")
+async def get_local_auth_status():
+    """Решения локальной проверки доступа, кэш токенов и версия правил"""
+    if local_authorizer is None:
+        raise HTTPException(status_code=404, detail="Local auth is disabled")
+    return local_authorizer.status()
+
+@app.get("/api/admin/latency")
+async def get_latency_breakdown(
+    window: int = Query(300, ge=1, le=86400, description="Скользящее окно, секунд")
+):
+    """Разбивка задержки пакета по этапам (TCP -> Redis -> БД -> WebSocket): p50/p95/p99"""
+    from shared.tracing import read_traces, latency_breakdown
+
+    try:
+        traces = await asyncio.to_thread(read_traces, get_redis_client(), window)
+        result = latency_breakdown(traces)
+        result['window_seconds'] = window
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/data/parse")
 async def parse_and_store_data(
     data_string: str,
@@ -728,91 +1288,100 @@ async def parse_and_store_data(
     """Парсинг и сохранение данных"""
     try:
         current_db = get_db_manager()  
-        result = current_db.parse_and_store_data(data_string, id_session, session_name)
+        # Запись выполняется в пуле потоков - параллельные запросы не блокируют event loop
+        result = await asyncio.to_thread(current_db.parse_and_store_data, data_string, id_session, session_name)
         if not result:
             raise HTTPException(status_code=400, detail="Failed to parse and store data")
         return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/data/parse/batch")
+async def parse_and_store_batch(batch_data: dict):
+    """Пакетный парсинг и сохранение строк: {"lines": [...], "id_session": ..., "session_name": ...}"""
+    try:
+        lines = batch_data.get('lines') if batch_data else None
+        if not isinstance(lines, list) or not lines:
+            raise HTTPException(status_code=400, detail="Необходимо передать непустой список lines")
+        
+        current_db = get_db_manager()
+        result = await asyncio.to_thread(
+            current_db.parse_and_store_batch,
+            [str(line) for line in lines],
+            batch_data.get('id_session'),
+            batch_data.get('session_name', "")
+        )
+        if not result['success']:
+            raise HTTPException(status_code=500, detail=result.get('message', "Failed to store data"))
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 import urllib.parse
 
 @app.api_route("/api/database/upload", methods=["GET", "POST"])
 async def upload_file(request: Request):
-    return None
-    # """Комбинированный GET/POST метод для загрузки файла (аналог Flask)"""
-    
-    # if request.method == "POST":
-    #     form_data = await request.form()
-    #     file = form_data.get("file")
-    #     session_name = form_data.get("session_name", "default_session")
-        
-    #     if not file or not hasattr(file, 'filename'):
-    #         return RedirectResponse(url="/api/database/upload", status_code=303)
-        
-    #     if file.filename == '':
-    #         return RedirectResponse(url="/api/database/upload", status_code=303)
-        
-    #     if file and allowed_file(file.filename):
-    #         # Сохраняем файл во временную директорию
-    #         with NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-    #             content = await file.read()
-    #             temp_file.write(content)
-    #             temp_file_path = temp_file.name
-            
-    #         try:
-    #             # Создаем сессию
-    #            current_db = get_db_manager()  
-    #             id_session = current_db._get_or_create_session(None, session_name)
-                
-    #             # Читаем и обрабатываем файл
-    #             with open(temp_file_path, 'r', encoding='utf-8') as f:
-    #                 lines = f.readlines()
-    #                 success_count = 0
-    #                 error_count = 0
-                    
-    #                 for line in lines:
-    #                     line = line.strip()
-    #                     if line:
-    #                        current_db = get_db_manager()  
-    #                         result = current_db.parse_and_store_data(line, id_session, session_name)
-    #                         if result:
-    #                             success_count += 1
-    #                         else:
-    #                             error_count += 1
-                
-    #             # Возвращаем HTML с JavaScript alert как в оригинале
-    #             html_response = f'''
-    #             <script>
-    #                 alert('Файл успешно обработан! Успешно: {success_count}, Ошибок: {error_count}');
-    #                 window.location.href = '/';
-    #             </script>
-    #             '''
-    #             return HTMLResponse(content=html_response)
-                
-    #         except Exception as e:
-    #             html_response = f'''
-    #             <script>
-    #                 alert('Ошибка при обработке файла: {str(e)}');
-    #                 window.location.href = '/';
-    #             </script>
-    #             '''
-    #             return HTMLResponse(content=html_response)
-    #         finally:
-    #             # Удаляем временный файл
-    #             if os.path.exists(temp_file_path):
-    #                 os.remove(temp_file_path)
+    """Загрузка лог-файла для фонового пакетного импорта (GET - форма, POST - постановка в очередь)"""
+    if request.method == "POST":
+        form_data = await request.form()
+        file = form_data.get("file")
+        session_name = form_data.get("session_name", "default_session")
+        id_session = form_data.get("id_session")
+        
+        if not file or not hasattr(file, 'filename') or file.filename == '':
+            raise HTTPException(status_code=400, detail="Файл не передан")
+        
+        from bulk_import import allowed_file, save_upload_file
+        
+        if not allowed_file(file.filename):
+            raise HTTPException(status_code=400, detail="Недопустимый тип файла")
+        
+        try:
+            id_session = int(id_session) if id_session else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="id_session должен быть числом")
+        
+        try:
+            importer = get_bulk_importer()
+            temp_file_path = await asyncio.to_thread(
+                save_upload_file, file.file, settings.IMPORT_DIR, os.path.splitext(file.filename)[1]
+            )
+            job = importer.submit(temp_file_path, file.filename, id_session, session_name)
+            job['status_url'] = f"/api/database/upload/{job['job_id']}"
+            return JSONResponse(status_code=202, content=job)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Upload error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
     
-    # # GET метод - показываем форму
-    # html_form = '''
-    # <form method="post" enctype="multipart/form-data">
-    #     <input type="file" name="file">
-    #     <input type="text" name="session_name" placeholder="Session name" value="default_session">
-    #     <input type="submit" value="Upload">
-    # </form>
-    # '''
-    # return HTMLResponse(content=html_form)
+    # GET метод - показываем форму
+    html_form = '''
+    <form method="post" enctype="multipart/form-data">
+        <input type="file" name="file">
+        <input type="text" name="session_name" placeholder="Session name" value="default_session">
+        <input type="submit" value="Upload">
+    </form>
+    '''
+    return HTMLResponse(content=html_form)
+
+@app.get("/api/database/upload/jobs")
+async def get_upload_jobs():
+    """Список задач импорта"""
+    return get_bulk_importer().list_jobs()
+
+@app.get("/api/database/upload/{job_id}")
+async def get_upload_status(job_id: str):
+    """Статус задачи импорта: прогресс и ошибки по строкам"""
+    job = get_bulk_importer().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача импорта не найдена")
+    return job
 
 # ==================== USER ENDPOINTS (для auth-service) ====================
 
@@ -845,11 +1414,17 @@ async def authenticate_user(auth_data: dict):
 
 if __name__ == "__main__":
     import uvicorn
+    # Каждый воркер uvicorn выполняет lifespan: со встроенным приемом воркер один,
+    # иначе пакеты записывались бы каждым воркером
+    workers = settings.API_WORKERS
+    if settings.INGEST_MODE == "embedded" and workers > 1:
+        logger.warning("API_WORKERS > 1 requires INGEST_MODE=external, starting a single worker")
+        workers = 1
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8004,
-        workers=1,
+        workers=workers,
         log_level="info",
         reload=False
     )
@@ -0,0 +1,423 @@
+# data-service/query_stats.py
+"""
+Статистика SQL-запросов data-service.
+
+Каждый запрос приводится к отпечатку (литералы и параметры заменяются на ?),
+по отпечатку копятся гистограмма задержек, количество строк и ошибок.
+Медленные запросы попадают в журнал без значений параметров, а их выборка
+может быть разобрана EXPLAIN (ANALYZE, BUFFERS) в фоне с сохранением плана
+в таблицу query_explain_samples.
+
+Замер делается в курсоре пула (InstrumentedCursor), поэтому учитываются
+и execute(), и прямые обращения через get_cursor().
+"""
+import re
+import json
+import time
+import queue
+import random
+import hashlib
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger("data-service-queries")
+
+# Верхние границы корзин гистограммы, мс (последняя - все, что больше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Служебные команды, которые не учитываются
+_SKIP_PREFIXES = ('PREPARE ', 'DEALLOCATE ', 'EXPLAIN ', 'SELECT SET_CONFIG(')
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%\(\w+\)s|%s|\$\d+')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ROWS_RE = re.compile(r'\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+')
+_SPACE_RE = re.compile(r'\s+')
+_EXECUTE_RE = re.compile(r'^EXECUTE\s+(\w+)', re.I)
+# Изменение данных внутри SELECT/WITH: DML в CTE, блокировки строк, последовательности
+_WRITE_RE = re.compile(
+    r'\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|NEXTVAL|SETVAL)\b'
+    r'|\bFOR\s+(?:KEY\s+)?SHARE\b',
+    re.I
+)
+
+
+# Длинные запросы (VALUES на тысячи строк) нормализуются по префиксу и не кэшируются
+FINGERPRINT_MAX_LENGTH = 4096
+
+
+def fingerprint(query: str) -> Tuple[str, str]:
+    """
+    Нормализованный текст запроса и его короткий идентификатор
+
+    :return: (id отпечатка, нормализованный SQL)
+    """
+    if len(query) > FINGERPRINT_MAX_LENGTH:
+        return _normalize(query[:FINGERPRINT_MAX_LENGTH])
+    return _normalize_cached(query)
+
+
+def _normalize(query: str) -> Tuple[str, str]:
+    normalized = _COMMENT_RE.sub(' ', query)
+    normalized = _STRING_RE.sub('?', normalized)
+    normalized = _PARAM_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _LIST_RE.sub('(?...)', normalized)
+    normalized = _ROWS_RE.sub('(?...), ...', normalized)
+    normalized = _SPACE_RE.sub(' ', normalized).strip()
+    return hashlib.md5(normalized.encode()).hexdigest()[:16], normalized
+
+
+_normalize_cached = lru_cache(maxsize=4096)(_normalize)
+
+
+def describe_params(params) -> Any:
+    """Параметры без значений: только типы (и длины коллекций)"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: describe_params(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_describe_value(value) for value in params]
+    return _describe_value(params)
+
+
+def _describe_value(value) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def _percentile(buckets: List[int], count: int, q: float) -> Optional[float]:
+    """Оценка перцентиля по гистограмме (верхняя граница корзины)"""
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS_MS, buckets):
+        seen += bucket_count
+        if seen >= rank:
+            return bound if bound != float('inf') else None
+    return None
+
+
+class _QueryEntry:
+    __slots__ = ('fingerprint', 'query', 'label', 'calls', 'errors', 'rows', 'total_ms',
+                 'max_ms', 'buckets', 'slow_calls', 'last_seen')
+
+    def __init__(self, fp: str, query: str, label: Optional[str]):
+        self.fingerprint = fp
+        self.query = query
+        self.label = label
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.slow_calls = 0
+        self.last_seen = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'label': self.label,
+            'query': self.query,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'rows_per_call': round(self.rows / self.calls, 2) if self.calls else 0,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else None,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': _percentile(self.buckets, self.calls, 0.50),
+            'p95_ms': _percentile(self.buckets, self.calls, 0.95),
+            'p99_ms': _percentile(self.buckets, self.calls, 0.99),
+            'slow_calls': self.slow_calls,
+            'histogram': {
+                ('+inf' if bound == float('inf') else f"le_{bound}"): count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)
+            },
+            'last_seen': self.last_seen
+        }
+
+
+class QueryStats:
+    """Агрегатор статистики запросов (один на процесс)"""
+
+    def __init__(self):
+        self.slow_query_ms = 500.0
+        self.explain_sample_rate = 0.0
+        self.explain_min_interval = 300.0
+        self.explain_exclude = ('users',)
+        self._entries: Dict[str, _QueryEntry] = {}
+        self._slow_log: deque = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._prepared_sql: Dict[str, str] = {}
+        self.pool = {'acquired': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'errors': 0}
+
+        self._executor = None
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=20)
+        self._explain_thread: Optional[threading.Thread] = None
+        self._last_explain: Dict[str, float] = {}
+        self.explain_stats = {'captured': 0, 'dropped': 0, 'failed': 0}
+        self.reset_at = time.time()
+
+    def configure(self, slow_query_ms: float = 500.0, explain_sample_rate: float = 0.0,
+                  explain_min_interval: float = 300.0, slow_log_size: int = 200):
+        self.slow_query_ms = slow_query_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_min_interval = explain_min_interval
+        with self._lock:
+            self._slow_log = deque(self._slow_log, maxlen=slow_log_size)
+
+    def attach_executor(self, executor):
+        """Исполнитель, через пул которого выполняются EXPLAIN и сохраняются планы"""
+        self._executor = executor
+        if self.explain_sample_rate > 0 and self._explain_thread is None:
+            self._explain_thread = threading.Thread(target=self._explain_worker, daemon=True, name="query-explain")
+            self._explain_thread.start()
+
+    def register_prepared(self, name: str, query: str):
+        """Исходный SQL именованного выражения - для отпечатка и EXPLAIN вместо EXECUTE name(...)"""
+        self._prepared_sql[name.lower()] = query
+
+    # ==================== ЗАПИСЬ ====================
+
+    def record(self, query, params, duration_ms: float, rows: int, error: bool = False):
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', errors='replace')
+        elif not isinstance(query, str):
+            query = str(query)
+        head = query.lstrip()[:20].upper()
+        if head.startswith(_SKIP_PREFIXES):
+            return
+
+        label = None
+        source_query = query
+        match = _EXECUTE_RE.match(query.lstrip())
+        if match:
+            label = match.group(1).lower()
+            source_query = self._prepared_sql.get(label, query)
+
+        fp, normalized = fingerprint(source_query)
+        slow = duration_ms >= self.slow_query_ms
+
+        with self._lock:
+            entry = self._entries.get(fp)
+            if entry is None:
+                entry = self._entries[fp] = _QueryEntry(fp, normalized, label)
+            entry.calls += 1
+            entry.total_ms += duration_ms
+            if duration_ms > entry.max_ms:
+                entry.max_ms = duration_ms
+            if rows > 0:
+                entry.rows += rows
+            if error:
+                entry.errors += 1
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if duration_ms <= bound:
+                    entry.buckets[i] += 1
+                    break
+            entry.last_seen = time.time()
+            if slow:
+                entry.slow_calls += 1
+                self._slow_log.append({
+                    'at': datetime.now().isoformat(),
+                    'fingerprint': fp,
+                    'label': label,
+                    'query': normalized,
+                    'params': describe_params(params),
+                    'duration_ms': round(duration_ms, 3),
+                    'rows': rows,
+                    'error': error
+                })
+
+        if slow:
+            logger.warning(f"Slow query {fp} ({label or 'sql'}) {duration_ms:.1f} ms: {normalized[:300]}")
+            if not error:
+                self._maybe_explain(fp, source_query, params, duration_ms)
+
+    def record_pool_wait(self, wait_ms: float, error: bool = False):
+        pool = self.pool
+        if error:
+            pool['errors'] += 1
+            return
+        pool['acquired'] += 1
+        pool['wait_ms_total'] += wait_ms
+        if wait_ms > pool['wait_ms_max']:
+            pool['wait_ms_max'] = wait_ms
+
+    # ==================== EXPLAIN ====================
+
+    def _maybe_explain(self, fp: str, query: str, params, duration_ms: float):
+        if self._executor is None or self.explain_sample_rate <= 0:
+            return
+        statement = query.lstrip()[:10].upper()
+        # EXPLAIN ANALYZE выполняет запрос - только чтение
+        if not statement.startswith(('SELECT', 'WITH')):
+            return
+        if _WRITE_RE.search(_STRING_RE.sub('', _COMMENT_RE.sub('', query))):
+            return
+        lowered = query.lower()
+        if any(table in lowered for table in self.explain_exclude):
+            return
+        now = time.time()
+        if now - self._last_explain.get(fp, 0) < self.explain_min_interval:
+            return
+        if random.random() >= self.explain_sample_rate:
+            return
+        self._last_explain[fp] = now
+        try:
+            self._explain_queue.put_nowait((fp, query, params, duration_ms))
+        except queue.Full:
+            self.explain_stats['dropped'] += 1
+
+    def _explain_worker(self):
+        while True:
+            fp, query, params, duration_ms = self._explain_queue.get()
+            try:
+                with self._executor.get_cursor() as cursor:
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params or ())
+                    plan = list(cursor.fetchone().values())[0]
+                    # Запрос только читает, но откатываем на всякий случай до сохранения плана
+                    cursor.connection.rollback()
+                    cursor.execute(
+                        """
+                        INSERT INTO query_explain_samples (fingerprint, query, duration_ms, plan)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (fp, fingerprint(query)[1], duration_ms, json.dumps(plan))
+                    )
+                self.explain_stats['captured'] += 1
+            except Exception as e:
+                self.explain_stats['failed'] += 1
+                logger.error(f"EXPLAIN capture for {fp} failed: {e}")
+
+    # ==================== ЧТЕНИЕ ====================
+
+    def export(self) -> Dict[str, Any]:
+        """Счетчики процесса для сводки по всем воркерам API (см. snapshot(others=...))"""
+        with self._lock:
+            entries = [entry.to_dict() for entry in self._entries.values()]
+            slow_log = list(self._slow_log)
+        return {
+            'queries': entries,
+            'slow_log': slow_log,
+            'pool': dict(self.pool),
+            'explain': dict(self.explain_stats),
+            'reset_at': self.reset_at
+        }
+
+    def snapshot(self, sort: str = 'total_ms', limit: int = 50,
+                 others: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Сводка по запросам
+
+        :param others: export() других процессов - счетчики суммируются с локальными
+        """
+        exports = [self.export()] + list(others or [])
+        entries = _merge_entries(exports)
+        entries.sort(key=lambda item: item.get(sort) or 0, reverse=True)
+
+        pool = {'acquired': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'errors': 0}
+        explain = {'captured': 0, 'dropped': 0, 'failed': 0}
+        for export in exports:
+            for key in ('acquired', 'wait_ms_total', 'errors'):
+                pool[key] += export['pool'].get(key, 0)
+            pool['wait_ms_max'] = max(pool['wait_ms_max'], export['pool'].get('wait_ms_max', 0))
+            for key in explain:
+                explain[key] += export['explain'].get(key, 0)
+        pool['wait_ms_avg'] = round(pool['wait_ms_total'] / pool['acquired'], 4) if pool['acquired'] else None
+        return {
+            'slow_query_ms': self.slow_query_ms,
+            'processes': len(exports),
+            'fingerprints': len(entries),
+            'queries': entries[:limit],
+            'pool': pool,
+            'explain': dict(explain, sample_rate=self.explain_sample_rate)
+        }
+
+    def slow_log(self, limit: int = 100, others: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = list(self._slow_log)
+        for export in others or ():
+            records.extend(export.get('slow_log', ()))
+        records.sort(key=lambda record: record['at'], reverse=True)
+        return records[:limit]
+
+    def reset(self, reset_at: Optional[float] = None):
+        """Сброс счетчиков; reset_at - время общего сброса, полученное от другого процесса"""
+        with self._lock:
+            self._entries.clear()
+            self._slow_log.clear()
+        self.pool = {'acquired': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'errors': 0}
+        self.reset_at = reset_at or time.time()
+
+
+def _merge_entries(exports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Суммирование статистики одинаковых отпечатков из нескольких процессов"""
+    if len(exports) == 1:
+        return exports[0]['queries']
+    merged: Dict[str, _QueryEntry] = {}
+    for export in exports:
+        for item in export['queries']:
+            entry = merged.get(item['fingerprint'])
+            if entry is None:
+                entry = merged[item['fingerprint']] = _QueryEntry(item['fingerprint'], item['query'], item['label'])
+            entry.calls += item['calls']
+            entry.errors += item['errors']
+            entry.rows += item['rows']
+            entry.total_ms += item['total_ms']
+            entry.max_ms = max(entry.max_ms, item['max_ms'])
+            entry.slow_calls += item['slow_calls']
+            entry.buckets = [a + b for a, b in zip(entry.buckets, item['histogram'].values())]
+            if item['last_seen'] and (entry.last_seen is None or item['last_seen'] > entry.last_seen):
+                entry.last_seen = item['last_seen']
+    return [entry.to_dict() for entry in merged.values()]
+
+
+query_stats = QueryStats()
+
+
+class _InstrumentedMixin:
+    """Замер времени каждого запроса курсора"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        error = False
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            error = True
+            raise
+        finally:
+            query_stats.record(query, vars, (time.perf_counter() - started) * 1000, self.rowcount, error)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        error = False
+        try:
+            return super().executemany(query, vars_list)
+        except Exception:
+            error = True
+            raise
+        finally:
+            query_stats.record(query, None, (time.perf_counter() - started) * 1000, self.rowcount, error)
+
+
+class InstrumentedCursor(_InstrumentedMixin, RealDictCursor):
+    """RealDictCursor с замером времени каждого запроса"""
+
+
+class InstrumentedTupleCursor(_InstrumentedMixin, psycopg2.extensions.cursor):
+    """Курсор с замером времени, строки приходят кортежами (без dict на строку)"""
@@ -1,17 +1,68 @@
 # data-service/redis_subscriber.py
 import threading
+import queue
+import time
 import logging
+from typing import Any, Dict, List, Optional
 from shared.redis_client import get_redis_client
+from shared.tracing import TraceContext, record_trace
+from shared.ingest_partition import INGEST_CHANNELS, base_channel, partition
+from active_session import ACTIVE_SESSION_CHANNEL
 from datetime import datetime
 
 logger = logging.getLogger("data-service-redis")
 
+# Сигнал остановки воркера
+_STOP = object()
+
+
 class RedisSubscriber:
-    def __init__(self, db_manager):
+    """
+    Подписчик каналов приема данных
+
+    Одно pubsub-соединение на все каналы, сообщения раскладываются по
+    ограниченным очередям воркеров. Очередь выбирается по модулю-источнику
+    пакета, поэтому сообщения одного модуля обрабатываются по порядку одним
+    воркером. При заполнении очереди чтение из Redis приостанавливается
+    (обратное давление), время ожидания учитывается в метриках.
+    """
+
+    def __init__(self, db_manager, workers: int = 4, queue_size: int = 1000, writer=None, spool=None,
+                 channels: Optional[List[str]] = None, live_state=None, active_session=None):
         self.redis_client = get_redis_client()
         self.db_manager = db_manager
+        # Каналы приема (каналы своих шардов, см. shared.ingest_partition)
+        self.channels = list(channels or INGEST_CHANNELS)
+        # IngestWriter: пакеты копятся и пишутся микро-батчами (None - транзакция на пакет)
+        self.writer = writer
+        # IngestSpool: пакеты сначала пишутся в журнал на диске, в БД - при воспроизведении
+        self.spool = spool
+        # LiveStateCache для записи без микро-батчинга (у IngestWriter - свой)
+        self.live_state = live_state
+        # ActiveSession: сессия для пакетов, общая с API (None - last_session своего db_manager)
+        self.active_session = active_session
         self.running = False
         self.thread = None
+        self.worker_count = max(1, workers)
+        self.queue_size = queue_size
+        self.queues: List[queue.Queue] = []
+        self.workers: List[threading.Thread] = []
+        
+        self._metrics_lock = threading.Lock()
+        self.metrics: Dict[str, Any] = {
+            'received': {channel: 0 for channel in INGEST_CHANNELS},
+            'processed': 0,
+            'errors': 0,
+            'process_ms_avg': 0.0,
+            'process_ms_max': 0.0,
+            'enqueue_blocked': 0,
+            'enqueue_blocked_seconds': 0.0,
+            'queue_high_watermark': 0,
+            'dropped_on_stop': 0,
+            'reconnects': 0,
+            'last_error': None,
+            'connected_since': None
+        }
         
         logger.info(f"RedisSubscriber initialized with shared DB Manager: {id(self.db_manager)}")
         
@@ -24,7 +75,7 @@ class RedisSubscriber:
                 logger.info(f"Redis connected: {self.redis_client.is_connected()}")
     
     def start(self):
-        """Запуск подписчика Redis"""
+        """Запуск подписчика Redis и воркеров обработки"""
         if self.running:
             return
         
@@ -33,56 +84,168 @@ class RedisSubscriber:
             return
         
         self.running = True
-        self.thread = threading.Thread(target=self._listen_messages, daemon=True)
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in range(self.worker_count)]
+        self.workers = [
+            threading.Thread(target=self._worker, args=(q,), daemon=True, name=f"ingest-worker-{i}")
+            for i, q in enumerate(self.queues)
+        ]
+        for worker in self.workers:
+            worker.start()
+        
+        self.thread = threading.Thread(target=self._listen_messages, daemon=True, name="ingest-listener")
         self.thread.start()
-        logger.info("Redis subscriber started")
+        logger.info(f"Redis subscriber started: {self.worker_count} workers, queue size {self.queue_size}")
     
     def stop(self):
-        """Остановка подписчика Redis"""
+        """Остановка подписчика Redis (уже принятые сообщения дообрабатываются)"""
         self.running = False
         if self.thread:
             self.thread.join(timeout=5)
+        
+        for q in self.queues:
+            try:
+                q.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+        for worker in self.workers:
+            worker.join(timeout=10)
+        
+        dropped = sum(q.qsize() for q in self.queues)
+        if dropped:
+            self.metrics['dropped_on_stop'] += dropped
+            logger.warning(f"Redis subscriber stopped with {dropped} unprocessed messages")
         logger.info("Redis subscriber stopped")
     
+    def status(self) -> Dict[str, Any]:
+        """Состояние очередей и метрики обратного давления"""
+        with self._metrics_lock:
+            metrics = dict(self.metrics, received=dict(self.metrics['received']))
+        depths = [q.qsize() for q in self.queues]
+        return {
+            'running': self.running,
+            'listener_alive': bool(self.thread and self.thread.is_alive()),
+            'channels': self.channels,
+            'workers': self.worker_count,
+            'workers_alive': sum(1 for worker in self.workers if worker.is_alive()),
+            'queue_size': self.queue_size,
+            'queue_depths': depths,
+            'queued_total': sum(depths),
+            'metrics': metrics,
+            'writer': self.writer.status() if self.writer else None,
+            'spool': self.spool.status() if self.spool else None
+        }
+    
     def _listen_messages(self):
-        """Прослушивание сообщений из Redis"""
+        """Чтение всех каналов приема через одно pubsub-соединение с переподключением"""
+        backoff = 1
+        channels = list(self.channels)
+        if self.active_session:
+            channels.append(ACTIVE_SESSION_CHANNEL)
         while self.running:
             try:
-                logger.info("Listening for Redis messages on channels: 'module_data', 'corrupted_data'")
-
-                # Слушаем оба канала поочередно
-                for message in self.redis_client.listen_messages('module_data', timeout=1):
-                    if not self.running:
-                        break
-                    logger.info(f"RECEIVED valid data message")
-                    self._process_valid_message(message)
-
-                for message in self.redis_client.listen_messages('corrupted_data', timeout=1):
-                    if not self.running:
-                        break
-                    logger.warning(f"RECEIVED corrupted data message")
-                    self._process_corrupted_message(message)
-
+                logger.info(f"Listening for Redis messages on channels: {channels}")
+                self.metrics['connected_since'] = datetime.now().isoformat()
+                
+                # Генератор закрывает свое pubsub-соединение при выходе - соединения не копятся
+                for channel, message in self.redis_client.listen_channels(
+                    channels, timeout=1, is_running=lambda: self.running
+                ):
+                    backoff = 1
+                    if channel == ACTIVE_SESSION_CHANNEL:
+                        self.active_session.on_message(message)
+                        continue
+                    self._enqueue(channel, message)
+            
             except Exception as e:
-                logger.error(f"Redis listener error: {e}")
-                import time
-                time.sleep(5)
+                self.metrics['reconnects'] += 1
+                self.metrics['last_error'] = str(e)
+                self.metrics['connected_since'] = None
+                logger.error(f"Redis listener error: {e}, reconnecting in {backoff}s")
+                deadline = time.time() + backoff
+                while self.running and time.time() < deadline:
+                    time.sleep(0.1)
+                backoff = min(backoff * 2, 30)
     
-    def _process_valid_message(self, message: dict):
-        """Обработка ВАЛИДНЫХ данных"""
+    def _enqueue(self, channel: str, message: dict):
+        """Передача сообщения воркеру модуля; при полной очереди чтение из Redis ждет"""
+        channel = base_channel(channel)
+        with self._metrics_lock:
+            self.metrics['received'][channel] = self.metrics['received'].get(channel, 0) + 1
+        
+        target = self.queues[partition(message, self.worker_count, nested=True)]
+        item = (channel, message)
+        try:
+            target.put_nowait(item)
+        except queue.Full:
+            started = time.perf_counter()
+            with self._metrics_lock:
+                self.metrics['enqueue_blocked'] += 1
+            while self.running:
+                try:
+                    target.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                self.metrics['dropped_on_stop'] += 1
+            with self._metrics_lock:
+                self.metrics['enqueue_blocked_seconds'] += time.perf_counter() - started
+        
+        depth = target.qsize()
+        if depth > self.metrics['queue_high_watermark']:
+            self.metrics['queue_high_watermark'] = depth
+    
+    def _worker(self, work_queue: queue.Queue):
+        """Последовательная обработка сообщений своей очереди"""
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                break
+            
+            channel, message = item
+            started = time.perf_counter()
+            if channel == 'module_data':
+                logger.info(f"RECEIVED valid data message")
+                ok = self._process_valid_message(message)
+            else:
+                logger.warning(f"RECEIVED corrupted data message")
+                ok = self._process_corrupted_message(message)
+            self._record_processed(time.perf_counter() - started, ok)
+    
+    def _record_processed(self, elapsed: float, ok: bool):
+        elapsed_ms = elapsed * 1000
+        with self._metrics_lock:
+            metrics = self.metrics
+            metrics['processed'] += 1
+            if not ok:
+                metrics['errors'] += 1
+            metrics['process_ms_avg'] += (elapsed_ms - metrics['process_ms_avg']) / metrics['processed']
+            metrics['process_ms_max'] = max(metrics['process_ms_max'], elapsed_ms)
+    
+    def _process_valid_message(self, message: dict) -> bool:
+        """Обработка ВАЛИДНЫХ данных (False - сообщение не обработано)"""
         try:
             message_type = message.get('type')
 
             if message_type == 'valid_module_data':
-                data = message.get('data', {})
-                self._process_valid_module_data(data)
+                trace = TraceContext.from_message(message)
+                if trace:
+                    trace.mark('subscribe')
+                # provider и timestamp публикуются на верхнем уровне сообщения,
+                # а не внутри data - без этого время пакета подменялось временем записи
+                data = dict(message.get('data', {}))
+                data.setdefault('timestamp', message.get('timestamp'))
+                data.setdefault('provider', message.get('provider'))
+                return self._process_valid_module_data(data, trace)
             else:
                 logger.warning(f"Unknown valid message type: {message_type}")
+                return False
 
         except Exception as e:
             logger.error(f"Error processing valid message: {e}")
+            return False
 
-    def _process_corrupted_message(self, message: dict):
+    def _process_corrupted_message(self, message: dict) -> bool:
         """Обработка НЕВАЛИДНЫХ/битых данных"""
         try:
             message_type = message.get('type')
@@ -97,9 +260,9 @@ class RedisSubscriber:
                 'parsed_attempt': data.get('parsed_attempt', {}),
                 'errors': data.get('errors', []),
                 'error_reason': error_reason,
-                'provider': data.get('provider', ''),
+                'provider': message.get('provider') or data.get('provider', ''),
                 'packet_number': data.get('packet_number', 0),
-                'timestamp': data.get('timestamp', datetime.now().isoformat()),
+                'timestamp': message.get('timestamp') or data.get('timestamp', datetime.now().isoformat()),
                 'message_type': message_type
             }
 
@@ -107,11 +270,13 @@ class RedisSubscriber:
             # self.db_manager.save_corrupted_data(corrupted_record)
 
             logger.info(f"Corrupted data saved to database: {error_reason}")
+            return True
 
         except Exception as e:
             logger.error(f"Error processing corrupted data: {e}")
+            return False
     
-    def _process_valid_module_data(self, data: dict):
+    def _process_valid_module_data(self, data: dict, trace: TraceContext = None) -> bool:
         """Обработка ВАЛИДНЫХ данных модуля"""
         try:
             hops = data.get('hops', [])
@@ -140,14 +305,17 @@ class RedisSubscriber:
 
             if not valid_hops:
                 logger.warning("No valid hops after filtering")
-                return
+                return True
 
             # Обновляем данные с отфильтрованными хопами
             filtered_data = data.copy()
             filtered_data['hops'] = valid_hops
 
             # Получаем сессию
-            id_session = self.db_manager.last_session
+            if self.active_session:
+                id_session = self.active_session.get()
+            else:
+                id_session = self.db_manager.last_session
             if not id_session or id_session == 0:
                 sessions = self.db_manager.get_all_sessions()
                 if sessions:
@@ -155,14 +323,30 @@ class RedisSubscriber:
                     self.db_manager.last_session = id_session
                 else:
                     logger.error("No sessions available in database")
-                    return
+                    return False
+
+            if self.spool:
+                # Подтверждение после fsync журнала; запись в БД - потоком воспроизведения
+                self.spool.append(filtered_data, id_session, trace)
+                return True
+
+            if self.writer:
+                # Запись и публикация frontend_updates - при сбросе микро-батча
+                self.writer.submit(filtered_data, id_session, trace)
+                return True
 
             # Сохраняем данные
             saved_data = self.db_manager.save_structured_data_batch(filtered_data, id_session)
 
             if not saved_data:
                 logger.error("Failed to save data to database")
-                return
+                return False
+
+            if trace:
+                trace.mark('db_commit')
+
+            if self.live_state:
+                self.live_state.update(id_session, saved_data.get('points', []))
 
             # Подготовка сообщения
             frontend_message = {
@@ -172,6 +356,9 @@ class RedisSubscriber:
                 'timestamp': data.get('timestamp'),
                 'test_diagnostic': True
             }
+            if trace:
+                trace.mark('frontend_publish')
+                frontend_message['trace'] = trace.to_dict()
 
             # Публикация с перехватом исключений
             try:
@@ -197,6 +384,12 @@ class RedisSubscriber:
 
             if not success:
                 logger.warning("Failed to forward valid data to frontend")
+                # Трасса не дойдет до моста - фиксируем путь до data-service
+                if trace:
+                    record_trace(self.redis_client, trace)
+
+            return True
 
         except Exception as e:
-            logger.error(f"Error in _process_valid_module_data: {e}")
\ No newline at end of file
+            logger.error(f"Error in _process_valid_module_data: {e}")
+            return False
\ No newline at end of file
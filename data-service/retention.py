@@ -0,0 +1,277 @@
+# data-service/retention.py
+"""
+Фоновое хранение (retention) и удаление данных телеметрии.
+
+Политики задают, данные каких сессий (скрытых или видимых) и какого возраста
+удаляются. Удаление идет короткими транзакциями фиксированного размера по
+возрастанию id с паузами между порциями, чтобы не держать длинные блокировки
+и не создавать всплесков WAL. После крупных удалений запускается
+VACUUM (ANALYZE) с ограничением нагрузки на ввод-вывод.
+"""
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Dict, Any, List
+
+import psycopg2.errors
+
+logger = logging.getLogger("data-service-retention")
+
+ACTION_DELETE_DATA = 'delete_data'
+ACTION_PURGE_SESSION = 'purge_session'
+
+# Таблицы, которые обслуживаются VACUUM после удалений
+MAINTENANCE_TABLES = ('data', 'sessions')
+
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    hidden: bool        # к скрытым или видимым сессиям применяется политика
+    max_age_days: int
+    action: str         # ACTION_DELETE_DATA - удалить старые строки, ACTION_PURGE_SESSION - удалить сессию целиком
+
+
+def build_policies(settings) -> List[RetentionPolicy]:
+    """Политики из настроек (значение 0 отключает политику)"""
+    candidates = [
+        RetentionPolicy('hidden_data', True, settings.RETENTION_HIDDEN_DATA_DAYS, ACTION_DELETE_DATA),
+        RetentionPolicy('hidden_sessions', True, settings.RETENTION_HIDDEN_SESSION_DAYS, ACTION_PURGE_SESSION),
+        RetentionPolicy('visible_data', False, settings.RETENTION_VISIBLE_DATA_DAYS, ACTION_DELETE_DATA),
+    ]
+    return [policy for policy in candidates if policy.max_age_days > 0]
+
+
+class RetentionService:
+    """Планировщик политик хранения, очереди полного удаления сессий и VACUUM"""
+
+    def __init__(self, db_manager, policies: List[RetentionPolicy], interval: int = 3600,
+                 chunk_size: int = 5000, chunk_pause_ms: int = 50, max_duty_cycle: float = 0.5,
+                 lock_timeout_ms: int = 1000, vacuum_threshold: int = 100000,
+                 vacuum_cost_delay_ms: int = 10):
+        self.db_manager = db_manager
+        self.policies = policies
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause_ms / 1000.0
+        self.max_duty_cycle = min(max(max_duty_cycle, 0.05), 1.0)
+        self.lock_timeout_ms = lock_timeout_ms
+        self.vacuum_threshold = vacuum_threshold
+        self.vacuum_cost_delay_ms = vacuum_cost_delay_ms
+
+        self.running = False
+        self.thread = None
+        self._wakeup = threading.Event()
+        self._run_lock = threading.Lock()
+
+        self.metrics: Dict[str, Any] = {
+            'runs': 0,
+            'last_run_started': None,
+            'last_run_finished': None,
+            'last_run_seconds': None,
+            'last_error': None,
+            'rows_deleted_total': 0,
+            'rows_deleted_by_policy': {},
+            'sessions_purged_total': 0,
+            'chunks_total': 0,
+            'chunk_ms_avg': 0.0,
+            'chunk_ms_max': 0.0,
+            'lock_timeouts': 0,
+            'throttle_seconds_total': 0.0,
+            'rows_since_vacuum': 0,
+            'vacuum_runs': 0,
+            'analyze_runs': 0,
+            'last_vacuum_at': None
+        }
+        self.current: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        """Запуск планировщика"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True, name="retention")
+        self.thread.start()
+        logger.info(f"Retention scheduler started, policies: {[p.name for p in self.policies]}")
+
+    def stop(self):
+        """Остановка планировщика (текущая порция дописывается)"""
+        self.running = False
+        self._wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+        logger.info("Retention scheduler stopped")
+
+    def trigger(self):
+        """Внеочередной запуск"""
+        self._wakeup.set()
+
+    def status(self) -> Dict[str, Any]:
+        """Политики, текущий прогресс и метрики"""
+        try:
+            purge_queue = self.db_manager.get_purge_queue()
+            for item in purge_queue:
+                if item.get('requested_at'):
+                    item['requested_at'] = item['requested_at'].isoformat()
+        except Exception as e:
+            purge_queue = {'error': str(e)}
+
+        return {
+            'running': self.running,
+            'busy': self._run_lock.locked(),
+            'interval_seconds': self.interval,
+            'policies': [policy._asdict() for policy in self.policies],
+            'current': dict(self.current) if self.current else None,
+            'purge_queue': purge_queue,
+            'metrics': dict(self.metrics, rows_deleted_by_policy=dict(self.metrics['rows_deleted_by_policy']))
+        }
+
+    def _loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.metrics['last_error'] = str(e)
+                logger.error(f"Retention run failed: {e}")
+
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def run_once(self):
+        """Один проход: политики, очередь удаления сессий, обслуживание таблиц"""
+        with self._run_lock:
+            started = time.time()
+            self.metrics['runs'] += 1
+            self.metrics['last_run_started'] = datetime.now().isoformat()
+            self.metrics['last_error'] = None
+            deleted_before = self.metrics['rows_deleted_total']
+
+            for policy in self.policies:
+                if not self.running:
+                    break
+                self._apply_policy(policy)
+
+            if self.running:
+                self._drain_purge_queue()
+            if self.running:
+                self._maintenance(self.metrics['rows_deleted_total'] - deleted_before)
+
+            self.current = None
+            self.metrics['last_run_finished'] = datetime.now().isoformat()
+            self.metrics['last_run_seconds'] = round(time.time() - started, 3)
+
+    def _apply_policy(self, policy: RetentionPolicy):
+        cutoff = datetime.now().astimezone() - timedelta(days=policy.max_age_days)
+
+        if policy.action == ACTION_PURGE_SESSION:
+            session_ids = self.db_manager.get_expired_sessions(policy.hidden, cutoff)
+            queued = self.db_manager.enqueue_session_purge(session_ids, policy.name)
+            if queued:
+                logger.info(f"Policy {policy.name}: {queued} sessions queued for purge")
+            return
+
+        for id_session in self.db_manager.get_sessions_with_data_older_than(policy.hidden, cutoff):
+            if not self.running:
+                return
+            self._delete_session_rows(policy.name, id_session, cutoff)
+
+    def _drain_purge_queue(self):
+        for item in self.db_manager.get_purge_queue():
+            if not self.running:
+                return
+            id_session = item['id_session']
+            if self._delete_session_rows(f"purge:{item['reason']}", id_session, None):
+                if self.db_manager.finish_session_purge(id_session):
+                    self.metrics['sessions_purged_total'] += 1
+                    logger.info(f"Session {id_session} purged ({item['reason']})")
+
+    def _delete_session_rows(self, label: str, id_session: int, older_than: Optional[datetime]) -> bool:
+        """
+        Порционное удаление строк сессии
+
+        :return: True если все подходящие строки удалены
+        """
+        self.current = {'policy': label, 'id_session': id_session, 'rows_deleted': 0, 'last_id': 0}
+        after_id = 0
+        lock_retries = 0
+
+        while self.running:
+            chunk_started = time.perf_counter()
+            try:
+                deleted, last_id = self.db_manager.delete_data_chunk(
+                    id_session, after_id, self.chunk_size, older_than, self.lock_timeout_ms
+                )
+            except (psycopg2.errors.LockNotAvailable, psycopg2.errors.QueryCanceled) as e:
+                # Конфликт с записью - уступаем и пробуем позже
+                self.metrics['lock_timeouts'] += 1
+                lock_retries += 1
+                if lock_retries > 3:
+                    logger.warning(f"{label}: session {id_session} skipped after lock timeouts: {e}")
+                    return False
+                self._sleep(self.chunk_pause * (2 ** lock_retries))
+                continue
+
+            elapsed = time.perf_counter() - chunk_started
+            if not deleted:
+                return True
+
+            lock_retries = 0
+            after_id = last_id
+            self._record_chunk(label, deleted, elapsed)
+            self.current['rows_deleted'] += deleted
+            self.current['last_id'] = last_id
+            self._throttle(elapsed)
+
+        return False
+
+    def _record_chunk(self, label: str, deleted: int, elapsed: float):
+        metrics = self.metrics
+        chunk_ms = elapsed * 1000
+        metrics['chunks_total'] += 1
+        metrics['chunk_ms_avg'] += (chunk_ms - metrics['chunk_ms_avg']) / metrics['chunks_total']
+        metrics['chunk_ms_max'] = max(metrics['chunk_ms_max'], chunk_ms)
+        metrics['rows_deleted_total'] += deleted
+        metrics['rows_since_vacuum'] += deleted
+        by_policy = metrics['rows_deleted_by_policy']
+        policy_name = label.split(':')[0]
+        by_policy[policy_name] = by_policy.get(policy_name, 0) + deleted
+
+    def _throttle(self, elapsed: float):
+        """Пауза между порциями: доля времени под удалением не выше max_duty_cycle"""
+        pause = max(self.chunk_pause, elapsed * (1 - self.max_duty_cycle) / self.max_duty_cycle)
+        self.metrics['throttle_seconds_total'] += pause
+        self._sleep(pause)
+
+    def _sleep(self, seconds: float):
+        # Прерывается при остановке сервиса
+        deadline = time.time() + seconds
+        while self.running and time.time() < deadline:
+            time.sleep(min(0.1, deadline - time.time()))
+
+    def _maintenance(self, deleted_this_run: int):
+        """VACUUM (ANALYZE) после крупных удалений, иначе ANALYZE, если в проходе что-то удалено"""
+        rows = self.metrics['rows_since_vacuum']
+        vacuum = rows >= self.vacuum_threshold
+        if not vacuum and deleted_this_run == 0:
+            return
+
+        command = "VACUUM (ANALYZE)" if vacuum else "ANALYZE"
+        for table in MAINTENANCE_TABLES:
+            try:
+                self.current = {'policy': 'maintenance', 'command': command, 'table': table}
+                self.db_manager.db.execute_maintenance(
+                    f"{command} {table}",
+                    settings={'vacuum_cost_delay': self.vacuum_cost_delay_ms}
+                )
+            except Exception as e:
+                self.metrics['last_error'] = str(e)
+                logger.error(f"{command} {table} failed: {e}")
+                return
+
+        if vacuum:
+            self.metrics['vacuum_runs'] += 1
+            self.metrics['last_vacuum_at'] = datetime.now().isoformat()
+            self.metrics['rows_since_vacuum'] = 0
+        else:
+            self.metrics['analyze_runs'] += 1
+        logger.info(f"{command} completed after {rows} deleted rows")
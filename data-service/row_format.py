@@ -0,0 +1,191 @@
+# data-service/row_format.py
+"""
+Быстрое форматирование строк data для ответов API.
+
+Строки приходят из БД кортежами (InstrumentedTupleCursor), индексы колонок
+вычисляются один раз по cursor.description, шестнадцатеричные id модулей
+берутся из кэша. Сериализация в JSON - через orjson сразу в bytes.
+Для больших страниц таблицы есть колоночный формат со словарями (to_columnar).
+"""
+from decimal import Decimal
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Any, Sequence, Tuple
+
+import orjson
+
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+@lru_cache(maxsize=65536)
+def module_hex(id_module: int) -> str:
+    """Шестнадцатеричный id модуля (модулей немного, строки повторяются в каждой записи)"""
+    return format(id_module, 'X')
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в bytes (datetime сериализуется в ISO 8601, как isoformat())"""
+    return orjson.dumps(content, default=_default, option=_DUMPS_OPTIONS)
+
+
+def column_index(columns: Sequence[str]) -> Dict[str, int]:
+    """Индексы колонок результата по имени"""
+    return {name: i for i, name in enumerate(columns)}
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def format_data_rows(columns: Sequence[str], rows: List[Tuple]) -> List[Dict[str, Any]]:
+    """
+    Записи data с модулем, типом сообщения и сессией
+    (SELECT d.*, module_name, module_color, message_type, session_name)
+    """
+    ix = column_index(columns)
+    i_id, i_module, i_module_name, i_module_color = ix['id'], ix['id_module'], ix['module_name'], ix['module_color']
+    i_session, i_session_name = ix['id_session'], ix['session_name']
+    i_type, i_type_name = ix['id_message_type'], ix['message_type']
+    i_datetime, i_unix, i_created = ix['datetime'], ix['datetime_unix'], ix['created_at']
+    i_lat, i_lon, i_alt = ix['lat'], ix['lon'], ix['alt']
+    i_rssi, i_snr, i_source, i_jumps = ix['rssi'], ix['snr'], ix['source'], ix['jumps']
+    i_gps, i_number = ix['gps_ok'], ix['message_number']
+
+    return [
+        {
+            'id': row[i_id],
+            'id_module': module_hex(row[i_module]),
+            'module_name': row[i_module_name],
+            'module_color': row[i_module_color],
+            'id_session': row[i_session],
+            'session_name': row[i_session_name],
+            'message_type': row[i_type],
+            'message_type_name': row[i_type_name],
+            'datetime': _iso(row[i_datetime]),
+            'datetime_unix': row[i_unix],
+            'coords': {
+                'lat': row[i_lat],
+                'lon': row[i_lon],
+                'alt': row[i_alt]
+            },
+            'rssi': row[i_rssi],
+            'snr': row[i_snr],
+            'source': row[i_source],
+            'jumps': row[i_jumps],
+            'gps_ok': bool(row[i_gps]),
+            'message_number': row[i_number],
+            'created_at': _iso(row[i_created])
+        }
+        for row in rows
+    ]
+
+
+def format_message_rows(columns: Sequence[str], rows: List[Tuple]) -> List[Dict[str, Any]]:
+    """
+    Последние сообщения модулей (запрос last_messages)
+
+    Если все координаты NULL - coords: null
+    """
+    ix = column_index(columns)
+    i_id, i_module, i_module_name, i_module_color = ix['id'], ix['id_module'], ix['module_name'], ix['module_color']
+    i_session, i_type, i_type_name = ix['id_session'], ix['id_message_type'], ix['message_type']
+    i_datetime, i_unix = ix['datetime'], ix['datetime_unix']
+    i_lat, i_lon, i_alt = ix['effective_lat'], ix['effective_lon'], ix['effective_alt']
+    i_rssi, i_snr, i_source, i_jumps = ix['rssi'], ix['snr'], ix['source'], ix['jumps']
+    i_gps, i_number = ix['gps_ok'], ix['message_number']
+
+    result = []
+    append = result.append
+    for row in rows:
+        lat, lon = row[i_lat], row[i_lon]
+        if lat is None and lon is None:
+            coords_value = None
+        else:
+            alt = row[i_alt]
+            coords_value = {'lat': lat, 'lon': lon, 'alt': alt if alt is not None else 0.0}
+
+        append({
+            'id': row[i_id],
+            'id_module': module_hex(row[i_module]),
+            'module_name': row[i_module_name],
+            'module_color': row[i_module_color],
+            'id_session': row[i_session],
+            'id_message_type': row[i_type],
+            'message_type': row[i_type_name],
+            'datetime': _iso(row[i_datetime]),
+            'datetime_unix': row[i_unix],
+            'coords': coords_value,
+            'rssi': row[i_rssi],
+            'snr': row[i_snr],
+            'source': row[i_source],
+            'jumps': row[i_jumps],
+            'gps_ok': bool(row[i_gps]),
+            'message_number': row[i_number]
+        })
+    return result
+
+
+def rows_to_dicts(columns: Sequence[str], rows: List[Tuple]) -> List[Dict[str, Any]]:
+    """Кортежи в dict без преобразования значений (datetime сериализует orjson)"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+# Колонки страницы таблицы, кодируемые словарем: колонка-ссылка -> колонки значения
+TABLE_DICTIONARIES = {
+    'module': ('module_id', 'module_name', 'module_color'),
+    'message_type': ('message_type_id', 'message_type_name'),
+}
+
+
+def to_columnar(columns: Sequence[str], rows: List[Tuple],
+                dictionaries: Dict[str, Tuple[str, ...]] = TABLE_DICTIONARIES) -> Dict[str, Any]:
+    """
+    Колоночное представление страницы: имена колонок один раз, строки - массивы
+
+    Повторяющиеся группы колонок (модуль, тип сообщения) передаются словарем
+    один раз на страницу, в строке остается только индекс в словаре:
+    {'columns': [...], 'rows': [[...]], 'dictionaries': {'module': {'columns': [...], 'values': [[...]]}}}
+    """
+    ix = column_index(columns)
+    groups = [(name, group) for name, group in dictionaries.items() if all(column in ix for column in group)]
+    encoded = {ix[column] for _, group in groups for column in group}
+    plain = [i for i in range(len(columns)) if i not in encoded]
+
+    # itemgetter с одним индексом возвращает значение, а не кортеж - оборачиваем явно
+    plain_getter = itemgetter(*plain) if len(plain) > 1 else (lambda row, i=plain[0]: (row[i],))
+    group_getters = [itemgetter(*(ix[column] for column in group)) for _, group in groups]
+    lookups = [{} for _ in groups]
+    values = [[] for _ in groups]
+
+    result_rows = []
+    append = result_rows.append
+    for row in rows:
+        out = list(plain_getter(row))
+        for getter, lookup, group_values in zip(group_getters, lookups, values):
+            key = getter(row)
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(group_values)
+                group_values.append(key)
+            out.append(code)
+        append(out)
+
+    return {
+        'columns': [columns[i] for i in plain] + [name for name, _ in groups],
+        'rows': result_rows,
+        'dictionaries': {
+            name: {
+                'columns': list(group),
+                'values': [list(key) if isinstance(key, tuple) else [key] for key in group_values]
+            }
+            for (name, group), group_values in zip(groups, values)
+        }
+    }
@@ -0,0 +1,539 @@
+# data-service/session_archive.py
+"""
+Холодный архив скрытых сессий.
+
+Строки скрытой сессии переносятся из горячей таблицы data в порции
+Arrow IPC (zstd) в таблице session_archive_chunks, каталог сессий ведется
+в session_archive. Каждая порция архивируется и удаляется из data в одной
+транзакции, поэтому прерванная задача безопасно продолжается. Горячие
+индексы после архивации покрывают только живые сессии.
+
+При восстановлении сессии или чтении ее данных порции в фоне
+возвращаются в data через COPY с исходными id.
+
+Задачи одной сессии из разных воркеров API сериализуются advisory-блокировкой
+Postgres, состояние задач дублируется в Redis (job_store).
+"""
+import io
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from coordination import AdvisoryLock, LOCK_ARCHIVE_SESSION
+
+logger = logging.getLogger("data-service-archive")
+
+STATUS_ARCHIVING = 'archiving'
+STATUS_ARCHIVED = 'archived'
+STATUS_REHYDRATING = 'rehydrating'
+STATUS_REHYDRATED = 'rehydrated'
+
+# Сессии в этих статусах (частично) лежат в архиве
+COLD_STATUSES = (STATUS_ARCHIVING, STATUS_ARCHIVED, STATUS_REHYDRATING)
+
+# Задача другого процесса без обновлений дольше этого срока считается прерванной
+SHARED_JOB_STALE_SECONDS = 120
+
+# Схема без потерь: типы совпадают с колонками таблицы data
+ARCHIVE_SCHEMA = pa.schema([
+    pa.field('id', pa.int64(), nullable=False),
+    pa.field('id_module', pa.int32()),
+    pa.field('id_session', pa.int32()),
+    pa.field('id_message_type', pa.int32()),
+    pa.field('datetime', pa.timestamp('us', tz='UTC')),
+    pa.field('datetime_unix', pa.int64()),
+    pa.field('lat', pa.float64()),
+    pa.field('lon', pa.float64()),
+    pa.field('alt', pa.float64()),
+    pa.field('gps_ok', pa.bool_()),
+    pa.field('message_number', pa.int32()),
+    pa.field('rssi', pa.int32()),
+    pa.field('snr', pa.int32()),
+    pa.field('source', pa.int32()),
+    pa.field('jumps', pa.int32()),
+    pa.field('created_at', pa.timestamp('us', tz='UTC')),
+])
+
+ARCHIVE_COLUMNS = ', '.join(ARCHIVE_SCHEMA.names)
+
+_IPC_OPTIONS = pa.ipc.IpcWriteOptions(compression='zstd')
+_CSV_OPTIONS = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+
+
+def encode_chunk(rows: List[Tuple]) -> Tuple[bytes, int]:
+    """
+    Кортежи строк data -> Arrow IPC поток со сжатием zstd
+
+    :return: (сжатые байты, размер несжатых колонок)
+    """
+    columns = list(zip(*rows))
+    table = pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, ARCHIVE_SCHEMA)],
+        schema=ARCHIVE_SCHEMA
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, ARCHIVE_SCHEMA, options=_IPC_OPTIONS) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), table.nbytes
+
+
+def decode_chunk(payload) -> pa.Table:
+    """Arrow IPC поток -> таблица"""
+    return pa.ipc.open_stream(pa.py_buffer(bytes(payload))).read_all()
+
+
+def table_to_copy_csv(table: pa.Table) -> io.BytesIO:
+    """Таблица -> CSV для COPY (пустое поле - NULL)"""
+    buffer = io.BytesIO()
+    pa_csv.write_csv(table, buffer, _CSV_OPTIONS)
+    buffer.seek(0)
+    return buffer
+
+
+class ArchiveJob:
+    """Состояние задачи архивации или восстановления одной сессии"""
+
+    def __init__(self, id_session: int, kind: str):
+        self.id = uuid.uuid4().hex
+        self.id_session = id_session
+        self.kind = kind
+        self.status = 'queued'
+        self.rows_total: Optional[int] = None
+        self.rows_done = 0
+        self.chunks_done = 0
+        self.cancelled = False
+        self.message = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        progress = 100.0 if self.status == 'completed' else 0.0
+        if self.rows_total and self.status != 'completed':
+            progress = round(min(self.rows_done * 100.0 / self.rows_total, 100.0), 2)
+
+        return {
+            'job_id': self.id,
+            'id_session': self.id_session,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': progress,
+            'rows_total': self.rows_total,
+            'rows_done': self.rows_done,
+            'chunks_done': self.chunks_done,
+            'message': self.message,
+            'created_at': self.created_at.isoformat(),
+            'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None
+        }
+
+
+class SessionArchive:
+    """Архивация скрытых сессий и восстановление по требованию"""
+
+    def __init__(self, db_manager, chunk_size: int = 20000, max_workers: int = 1,
+                 lock_timeout_ms: int = 1000, database_url: Optional[str] = None, job_store=None):
+        self.db = db_manager.db
+        # Соединения advisory-блокировок сессий (None - блокировка только внутри процесса)
+        self.database_url = database_url
+        # RedisJobStore: задачи, видимые другим воркерам API
+        self.job_store = job_store
+        self.chunk_size = chunk_size
+        self.lock_timeout_ms = lock_timeout_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-archive")
+        self._lock = threading.Lock()
+        self._session_locks: Dict[int, threading.Lock] = {}
+        self._jobs: Dict[int, ArchiveJob] = {}
+
+    def resume(self, archive_hidden: bool = False):
+        """
+        Продолжение прерванных задач после перезапуска
+
+        :param archive_hidden: также поставить в очередь все скрытые сессии, которых нет в каталоге
+        """
+        rows = self.db.execute(
+            "SELECT id_session, status FROM session_archive WHERE status IN (%s, %s)",
+            params=(STATUS_ARCHIVING, STATUS_REHYDRATING),
+            fetch=True
+        ) or []
+        for row in rows:
+            if row['status'] == STATUS_ARCHIVING:
+                self.archive_session(row['id_session'])
+            else:
+                self.rehydrate_session(row['id_session'])
+
+        if archive_hidden:
+            hidden = self.db.execute(
+                """
+                SELECT s.id FROM sessions s
+                WHERE s.hidden = true
+                AND NOT EXISTS (SELECT 1 FROM session_archive a WHERE a.id_session = s.id)
+                ORDER BY s.id
+                """,
+                fetch=True
+            ) or []
+            for row in hidden:
+                self.archive_session(row['id'])
+
+    def shutdown(self):
+        """Остановка: текущие задачи прерываются после порции и продолжатся при следующем запуске"""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancelled = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ==================== ПУБЛИЧНЫЕ МЕТОДЫ ====================
+
+    def is_cold(self, id_session: int) -> bool:
+        """
+        Данные сессии (частично) в архиве
+
+        Состояние читается из каталога (поиск по первичному ключу), а не из
+        памяти процесса: архивировать сессию мог другой воркер API.
+        """
+        row = self.db.execute(
+            "SELECT 1 FROM session_archive WHERE id_session = %s AND status = ANY(%s)",
+            params=(id_session, list(COLD_STATUSES)),
+            fetch_one=True
+        )
+        return row is not None
+
+    def archive_session(self, id_session: int) -> Dict[str, Any]:
+        """Постановка сессии в очередь на архивацию"""
+        with self._lock:
+            job = self._jobs.get(id_session)
+            if job and job.active:
+                return job.to_dict()
+            job = ArchiveJob(id_session, 'archive')
+            self._jobs[id_session] = job
+        self._save(job)
+        self._executor.submit(self._run, job, self._archive)
+        return job.to_dict()
+
+    def rehydrate_session(self, id_session: int) -> Dict[str, Any]:
+        """Постановка сессии в очередь на восстановление (идущая архивация отменяется)"""
+        with self._lock:
+            job = self._jobs.get(id_session)
+            if job and job.active:
+                if job.kind == 'rehydrate':
+                    return job.to_dict()
+                job.cancelled = True
+            job = ArchiveJob(id_session, 'rehydrate')
+            self._jobs[id_session] = job
+        self._save(job)
+        self._executor.submit(self._run, job, self._rehydrate)
+        return job.to_dict()
+
+    def ensure_hot(self, id_session: int) -> Optional[Dict[str, Any]]:
+        """
+        Проверка перед чтением: если данные сессии в архиве, запускается восстановление
+
+        :return: None - данные в горячей таблице, иначе статус задачи восстановления
+        """
+        if not self.is_cold(id_session):
+            return None
+        if id_session not in self._jobs and self.job_store:
+            # Восстановление уже идет в другом воркере - повторная задача только ждала бы его
+            shared = self.job_store.get(id_session)
+            if (shared and shared['kind'] == 'rehydrate' and shared['status'] in ('queued', 'running')
+                    and time.time() - shared.get('saved_at', 0) < SHARED_JOB_STALE_SECONDS):
+                return shared
+        return self.rehydrate_session(id_session)
+
+    def get_status(self, id_session: int) -> Dict[str, Any]:
+        """Запись каталога и последняя задача по сессии"""
+        entry = self.db.execute(
+            "SELECT * FROM session_archive WHERE id_session = %s",
+            params=(id_session,),
+            fetch_one=True
+        )
+        job = self._jobs.get(id_session)
+        if job:
+            job_info = job.to_dict()
+        else:
+            job_info = self.job_store.get(id_session) if self.job_store else None
+        return {
+            'id_session': id_session,
+            'catalog': self._format_entry(entry) if entry else None,
+            'job': job_info
+        }
+
+    def list_catalog(self) -> List[Dict[str, Any]]:
+        """Каталог архива с активными задачами"""
+        entries = self.db.execute(
+            "SELECT * FROM session_archive ORDER BY id_session",
+            fetch=True
+        ) or []
+        jobs = {info['id_session']: info for info in (self.job_store.list() if self.job_store else [])}
+        with self._lock:
+            jobs.update((id_session, job.to_dict()) for id_session, job in self._jobs.items())
+        result = []
+        for entry in entries:
+            item = self._format_entry(entry)
+            item['job'] = jobs.get(entry['id_session'])
+            result.append(item)
+        return result
+
+    @staticmethod
+    def _format_entry(entry: Dict) -> Dict[str, Any]:
+        item = dict(entry)
+        for key in ('archived_at', 'rehydrated_at', 'updated_at'):
+            if item.get(key):
+                item[key] = item[key].isoformat()
+        if item.get('compressed_bytes'):
+            item['compression_ratio'] = round(item['raw_bytes'] / item['compressed_bytes'], 2)
+        return item
+
+    # ==================== ВЫПОЛНЕНИЕ ЗАДАЧ ====================
+
+    def _session_lock(self, id_session: int) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(id_session, threading.Lock())
+
+    def _run(self, job: ArchiveJob, handler):
+        # Задачи одной сессии выполняются строго по очереди
+        with self._session_lock(job.id_session):
+            lock = None
+            try:
+                lock = self._wait_process_lock(job)
+                if job.cancelled:
+                    job.status = 'cancelled'
+                    return
+                job.status = 'running'
+                job.message = None
+                job.started_at = time.time()
+                self._save(job)
+                handler(job)
+                if job.status == 'running':
+                    job.status = 'completed'
+                logger.info(f"{job.kind} of session {job.id_session} {job.status}: {job.rows_done} rows")
+            except Exception as e:
+                job.status = 'failed'
+                job.message = str(e)
+                logger.error(f"{job.kind} of session {job.id_session} failed: {e}")
+                self._set_error(job.id_session, str(e))
+            finally:
+                job.finished_at = time.time()
+                self._save(job)
+                if lock is not None:
+                    lock.release()
+
+    def _wait_process_lock(self, job: ArchiveJob) -> Optional[AdvisoryLock]:
+        """Блокировка сессии между процессами: ждем, пока задачу сессии не закончит другой воркер"""
+        if not self.database_url:
+            return None
+        lock = AdvisoryLock(self.database_url, LOCK_ARCHIVE_SESSION, job.id_session)
+        while not job.cancelled:
+            if lock.try_acquire():
+                return lock
+            if job.message is None:
+                job.message = "Ожидание задачи этой сессии в другом процессе"
+                self._save(job)
+            time.sleep(1)
+        return None
+
+    def _save(self, job: ArchiveJob):
+        if self.job_store:
+            self.job_store.save(job.id_session, job.to_dict(), job.created_at.timestamp())
+
+    def _set_error(self, id_session: int, error: str):
+        try:
+            self.db.execute(
+                "UPDATE session_archive SET error = %s, updated_at = NOW() WHERE id_session = %s",
+                params=(error, id_session)
+            )
+        except Exception as e:
+            logger.error(f"Failed to record archive error for session {id_session}: {e}")
+
+    def _archive(self, job: ArchiveJob):
+        id_session = job.id_session
+
+        with self.db.get_cursor() as cursor:
+            cursor.execute("SELECT hidden FROM sessions WHERE id = %s", (id_session,))
+            session = cursor.fetchone()
+            if not session or not session['hidden']:
+                job.status = 'skipped'
+                job.message = "Архивируются только скрытые сессии"
+                return
+
+            cursor.execute(
+                """
+                INSERT INTO session_archive (id_session, status) VALUES (%s, %s)
+                ON CONFLICT (id_session) DO UPDATE SET status = EXCLUDED.status, error = NULL, updated_at = NOW()
+                """,
+                (id_session, STATUS_ARCHIVING)
+            )
+            cursor.execute(
+                "SELECT COALESCE(MAX(chunk_no), -1) + 1 AS next_chunk FROM session_archive_chunks WHERE id_session = %s",
+                (id_session,)
+            )
+            chunk_no = cursor.fetchone()['next_chunk']
+            cursor.execute("SELECT COUNT(*) AS total FROM data WHERE id_session = %s", (id_session,))
+            job.rows_total = cursor.fetchone()['total']
+
+        while not job.cancelled:
+            if not self._is_hidden(id_session):
+                # Сессию восстановили (возможно, в другом процессе) - ее данные вернет rehydrate
+                job.status = 'cancelled'
+                job.message = "Сессия восстановлена во время архивации"
+                return
+            archived = self._archive_chunk(id_session, chunk_no)
+            if not archived:
+                break
+            chunk_no += 1
+            job.rows_done += archived
+            job.chunks_done += 1
+            self._save(job)
+
+        if job.cancelled:
+            job.status = 'cancelled'
+            return
+
+        self.db.execute(
+            """
+            UPDATE session_archive SET status = %s, archived_at = NOW(), updated_at = NOW()
+            WHERE id_session = %s
+            """,
+            params=(STATUS_ARCHIVED, id_session)
+        )
+
+    def _is_hidden(self, id_session: int) -> bool:
+        session = self.db.execute(
+            "SELECT hidden FROM sessions WHERE id = %s",
+            params=(id_session,),
+            fetch_one=True
+        )
+        return bool(session and session['hidden'])
+
+    def _archive_chunk(self, id_session: int, chunk_no: int) -> int:
+        """Перенос одной порции строк из data в архив (одна транзакция)"""
+        with self.db.get_cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", (f"{self.lock_timeout_ms}ms",))
+            cursor.execute(
+                f"""
+                SELECT {ARCHIVE_COLUMNS} FROM data
+                WHERE id_session = %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE
+                """,
+                (id_session, self.chunk_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+
+            payload, raw_bytes = encode_chunk(rows)
+            ids = [row[0] for row in rows]
+
+            cursor.execute(
+                """
+                INSERT INTO session_archive_chunks (id_session, chunk_no, row_count, min_id, max_id, payload)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (id_session, chunk_no, len(rows), ids[0], ids[-1], psycopg2.Binary(payload))
+            )
+            cursor.execute("DELETE FROM data WHERE id = ANY(%s)", (ids,))
+            cursor.execute(
+                """
+                UPDATE session_archive
+                SET row_count = row_count + %s, chunk_count = chunk_count + 1,
+                    raw_bytes = raw_bytes + %s, compressed_bytes = compressed_bytes + %s,
+                    updated_at = NOW()
+                WHERE id_session = %s
+                """,
+                (len(rows), raw_bytes, len(payload), id_session)
+            )
+            return len(rows)
+
+    def _rehydrate(self, job: ArchiveJob):
+        id_session = job.id_session
+
+        entry = self.db.execute(
+            """
+            UPDATE session_archive SET status = %s, error = NULL, updated_at = NOW()
+            WHERE id_session = %s
+            RETURNING row_count
+            """,
+            params=(STATUS_REHYDRATING, id_session),
+            fetch_one=True
+        )
+        if not entry:
+            # Сессии нет в каталоге (не архивировалась или удалена)
+            job.rows_total = 0
+            return
+        job.rows_total = entry['row_count']
+
+        while not job.cancelled:
+            restored = self._rehydrate_chunk(id_session)
+            if not restored:
+                break
+            job.rows_done += restored
+            job.chunks_done += 1
+            self._save(job)
+
+        if job.cancelled:
+            job.status = 'cancelled'
+            return
+
+        self.db.execute(
+            """
+            UPDATE session_archive
+            SET status = %s, row_count = 0, chunk_count = 0, raw_bytes = 0, compressed_bytes = 0,
+                rehydrated_at = NOW(), updated_at = NOW()
+            WHERE id_session = %s
+            """,
+            params=(STATUS_REHYDRATED, id_session)
+        )
+
+    def _rehydrate_chunk(self, id_session: int) -> int:
+        """Возврат одной порции из архива в data через COPY (одна транзакция)"""
+        with self.db.get_cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute(
+                """
+                SELECT chunk_no, payload FROM session_archive_chunks
+                WHERE id_session = %s
+                ORDER BY chunk_no
+                LIMIT 1
+                FOR UPDATE
+                """,
+                (id_session,)
+            )
+            chunk = cursor.fetchone()
+            if not chunk:
+                return 0
+
+            chunk_no, payload = chunk
+            table = decode_chunk(payload)
+            cursor.copy_expert(
+                f"COPY data ({ARCHIVE_COLUMNS}) FROM STDIN WITH (FORMAT csv)",
+                table_to_copy_csv(table)
+            )
+            cursor.execute(
+                "DELETE FROM session_archive_chunks WHERE id_session = %s AND chunk_no = %s",
+                (id_session, chunk_no)
+            )
+            cursor.execute(
+                """
+                UPDATE session_archive
+                SET row_count = row_count - %s, chunk_count = chunk_count - 1, updated_at = NOW()
+                WHERE id_session = %s
+                """,
+                (table.num_rows, id_session)
+            )
+            return table.num_rows
@@ -0,0 +1,242 @@
+# data-service/session_export.py
+"""
+Колоночный экспорт данных сессии в Apache Arrow IPC / Parquet.
+
+Строки читаются серверным курсором порциями и сразу превращаются в
+RecordBatch, поэтому сессия любого размера экспортируется без загрузки
+всех данных в память.
+"""
+import os
+import logging
+from datetime import datetime
+from typing import Iterator, Dict, Any
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger("data-service-export")
+
+EXPORT_FORMATS = {
+    'arrow': {'extension': 'arrows', 'media_type': 'application/vnd.apache.arrow.stream'},
+    'parquet': {'extension': 'parquet', 'media_type': 'application/vnd.apache.parquet'},
+}
+
+# Порядок полей схемы совпадает с порядком колонок EXPORT_QUERY
+EXPORT_SCHEMA = pa.schema([
+    pa.field('id', pa.int64(), nullable=False),
+    pa.field('id_module', pa.int32()),
+    pa.field('module_name', pa.string()),
+    pa.field('module_color', pa.string()),
+    pa.field('id_session', pa.int32()),
+    pa.field('id_message_type', pa.int32()),
+    pa.field('message_type', pa.string()),
+    pa.field('datetime', pa.timestamp('us', tz='UTC')),
+    pa.field('datetime_unix', pa.int64()),
+    pa.field('lat', pa.float32()),
+    pa.field('lon', pa.float32()),
+    pa.field('alt', pa.float32()),
+    pa.field('gps_ok', pa.bool_()),
+    pa.field('message_number', pa.int32()),
+    pa.field('rssi', pa.int32()),
+    pa.field('snr', pa.int32()),
+    pa.field('source', pa.int32()),
+    pa.field('jumps', pa.int32()),
+    pa.field('created_at', pa.timestamp('us', tz='UTC')),
+])
+
+EXPORT_QUERY = """
+    SELECT
+        d.id,
+        d.id_module,
+        m.name as module_name,
+        m.color as module_color,
+        d.id_session,
+        d.id_message_type,
+        mt.type as message_type,
+        d.datetime,
+        d.datetime_unix,
+        d.lat,
+        d.lon,
+        d.alt,
+        d.gps_ok,
+        d.message_number,
+        d.rssi,
+        d.snr,
+        d.source,
+        d.jumps,
+        d.created_at
+    FROM data d
+    LEFT JOIN modules m ON d.id_module = m.id
+    LEFT JOIN message_type mt ON d.id_message_type = mt.id
+    WHERE d.id_session = %s
+    ORDER BY d.id
+"""
+
+
+class _ChunkSink:
+    """Файлоподобный приемник, из которого можно забирать записанные байты порциями"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        size = memoryview(data).nbytes
+        self._buffer += data
+        self._position += size
+        return size
+
+    def tell(self) -> int:
+        # Позиция считается от начала потока, а не буфера - она нужна writer'у для футера Parquet
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return False
+
+    def seekable(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        """Забрать накопленные байты и очистить буфер"""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class _BatchWriter:
+    """Единый интерфейс записи RecordBatch для Arrow IPC и Parquet"""
+
+    def __init__(self, fmt: str, sink):
+        self.fmt = fmt
+        if fmt == 'arrow':
+            options = pa.ipc.IpcWriteOptions(compression='zstd')
+            self._writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA, options=options)
+        elif fmt == 'parquet':
+            self._writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression='zstd')
+        else:
+            raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+    def write(self, batch: pa.RecordBatch):
+        if self.fmt == 'arrow':
+            self._writer.write_batch(batch)
+        else:
+            # Каждая порция становится отдельной row group
+            self._writer.write_table(pa.Table.from_batches([batch], schema=EXPORT_SCHEMA))
+
+    def close(self):
+        self._writer.close()
+
+
+def validate_format(fmt: str) -> str:
+    """Проверка формата экспорта"""
+    fmt = (fmt or '').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}. Доступные: {list(EXPORT_FORMATS)}")
+    return fmt
+
+
+def session_exists(db_manager, id_session: int) -> bool:
+    """Проверка существования сессии (включая скрытые)"""
+    result = db_manager.db.execute(
+        "SELECT 1 as found FROM sessions WHERE id = %s",
+        params=(id_session,),
+        fetch_one=True
+    )
+    return result is not None
+
+
+def build_export_filename(id_session: int, fmt: str) -> str:
+    """Имя файла экспорта"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"session_{id_session}_{timestamp}.{EXPORT_FORMATS[fmt]['extension']}"
+
+
+def iter_record_batches(db_manager, id_session: int, batch_size: int) -> Iterator[pa.RecordBatch]:
+    """Чтение данных сессии порциями и сборка типизированных RecordBatch"""
+    for _, rows in db_manager.db.stream(EXPORT_QUERY, (id_session,), chunk_size=batch_size):
+        # Транспонируем порцию строк в колонки
+        columns = list(zip(*rows))
+        arrays = [
+            pa.array(column, type=field.type)
+            for column, field in zip(columns, EXPORT_SCHEMA)
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+
+def iter_session_export(db_manager, id_session: int, fmt: str, batch_size: int) -> Iterator[bytes]:
+    """
+    Потоковый экспорт сессии для отдачи в HTTP-ответе
+
+    :return: генератор порций байт готового файла
+    """
+    sink = _ChunkSink()
+    writer = _BatchWriter(fmt, pa.PythonFile(sink, mode='w'))
+    rows_total = 0
+
+    try:
+        for batch in iter_record_batches(db_manager, id_session, batch_size):
+            writer.write(batch)
+            rows_total += batch.num_rows
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+    logger.info(f"Session {id_session} streamed as {fmt}: {rows_total} rows")
+
+
+def export_session_to_dir(db_manager, id_session: int, fmt: str,
+                          export_dir: str, batch_size: int) -> Dict[str, Any]:
+    """
+    Экспорт сессии в файл в каталоге export_dir
+
+    Файл пишется под временным именем и переименовывается после успешного завершения,
+    поэтому в каталоге никогда не появляются недописанные файлы.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    filename = build_export_filename(id_session, fmt)
+    path = os.path.join(export_dir, filename)
+    temp_path = f"{path}.part"
+
+    rows_total = 0
+    try:
+        with pa.OSFile(temp_path, 'wb') as sink:
+            writer = _BatchWriter(fmt, sink)
+            try:
+                for batch in iter_record_batches(db_manager, id_session, batch_size):
+                    writer.write(batch)
+                    rows_total += batch.num_rows
+            finally:
+                writer.close()
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    size = os.path.getsize(path)
+    logger.info(f"Session {id_session} exported to {path}: {rows_total} rows, {size} bytes")
+
+    return {
+        'id_session': id_session,
+        'format': fmt,
+        'path': path,
+        'filename': filename,
+        'rows': rows_total,
+        'bytes': size
+    }
@@ -0,0 +1,7 @@
+# data-service/tests/conftest.py
+import os
+import sys
+
+# Модули data-service лежат плоско и импортируются по имени, как в контейнере
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,67 @@
+# data-service/tests/test_log_parser.py
+import pytest
+
+from log_parser import LogParseError, parse_log_line, parse_log_lines
+
+
+def test_parse_seven_field_line():
+    record = parse_log_line("GV 1A 55.75 37.61 150.0 42 -87.5:9.5")
+    assert record.message_type == 1
+    assert record.module_id == 0x1A
+    assert (record.lat, record.lon, record.alt) == (55.75, 37.61, 150.0)
+    assert record.gps_ok
+    assert record.message_number == 42
+    # Половины округляются от нуля, как numeric -> integer в PostgreSQL
+    assert (record.rssi, record.snr) == (-88, 10)
+
+
+def test_parse_relay_link_info():
+    record = parse_log_line("GL 2B 0 0 0 7 3R2")
+    assert (record.source, record.jumps) == (3, 2)
+    assert record.rssi is None
+
+
+@pytest.mark.parametrize("type_str, expected", [("0", 0), ("1", 1), ("2", 2), ("XX", 0)])
+def test_known_numeric_message_types(type_str, expected):
+    assert parse_log_line(f"{type_str} 1A 55.75 37.61 150.0 5 -80:5").message_type == expected
+
+
+def test_invalid_gps_is_not_an_error():
+    record = parse_log_line("GV 1A NA NA NA 5 -80:5")
+    assert not record.gps_ok
+    assert record.lat is None
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf"])
+def test_non_finite_gps_marks_gps_invalid(value):
+    record = parse_log_line(f"GV 1A {value} 37.61 150.0 5 -80:5")
+    assert not record.gps_ok
+    assert (record.lat, record.lon, record.alt) == (None, None, None)
+
+
+@pytest.mark.parametrize("line", [
+    "GV 1A 55.75 37.61 150.0 5 inf:5",
+    "GV 1A 55.75 37.61 150.0 5 -80:nan",
+    "GV 1A 55.75 37.61 150.0 5 1e12:5",
+    "GV 1FFFFFFFF 55.75 37.61 150.0 5 -80:5",
+    "GV 1A 55.75 37.61 150.0 99999999999 -80:5",
+    "GV 1A 55.75 37.61 150.0 5 99999999999R1",
+    "GV 1A 55.75",
+    "3 1A 55.75 37.61 150.0 5 -80:5",
+    "-1 1A 55.75 37.61 150.0 5 -80:5",
+    "99999999999 1A 55.75 37.61 150.0 5 -80:5",
+])
+def test_invalid_values_raise_parse_error(line):
+    with pytest.raises(LogParseError):
+        parse_log_line(line)
+
+
+def test_batch_collects_errors_per_line():
+    parsed, errors = parse_log_lines([
+        "GV 1A 55.75 37.61 150.0 1 -80:5",
+        "",
+        "GV 1A 55.75 37.61 150.0 2 inf:5",
+        "GV 1B 55.75 37.61 150.0 3 -81:4",
+    ], first_line_no=10)
+    assert [line_no for line_no, _ in parsed] == [10, 13]
+    assert [error['line'] for error in errors] == [12]
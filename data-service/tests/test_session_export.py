@@ -0,0 +1,51 @@
+# data-service/tests/test_session_export.py
+import io
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from session_export import EXPORT_SCHEMA, iter_session_export
+
+
+class StreamingDb:
+    """Источник строк вместо серверного курсора Postgres"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def stream(self, query, params, chunk_size):
+        for start in range(0, len(self.rows), chunk_size):
+            yield None, self.rows[start:start + chunk_size]
+
+
+class ExportDbManager:
+    def __init__(self, rows):
+        self.db = StreamingDb(rows)
+
+
+def make_row(id_row, rssi, jumps):
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return (id_row, 0x1A, 'Module 26', '#ff0000', 1, 2, 'Mesh / Sim', now, 1767225600,
+            55.75, 37.61, 150.0, True, 7, rssi, -2 ** 31, 3, jumps, now)
+
+
+def read_back(fmt, chunks):
+    data = b''.join(chunks)
+    if fmt == 'arrow':
+        return pa.ipc.open_stream(data).read_all()
+    return pq.read_table(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("fmt", ['arrow', 'parquet'])
+def test_export_keeps_full_integer_range(fmt):
+    # Значения вне int16: колонки data - INTEGER, парсер допускает весь диапазон int32
+    rows = [make_row(1, 40000, 2 ** 31 - 1), make_row(2, -87, 0), make_row(3, None, None)]
+
+    table = read_back(fmt, iter_session_export(ExportDbManager(rows), 1, fmt, batch_size=2))
+
+    assert table.schema.equals(EXPORT_SCHEMA)
+    assert table.column('rssi').to_pylist() == [40000, -87, None]
+    assert table.column('jumps').to_pylist() == [2 ** 31 - 1, 0, None]
+    assert table.column('snr').to_pylist() == [-2 ** 31] * 3
@@ -5,11 +5,17 @@ from auth import get_password_hash, verify_password
 
 logger = logging.getLogger("data-service")
 
+# Поиск пользователя выполняется на каждый запрос аутентификации - подготовленные выражения
+USER_QUERIES = {
+    'user_by_email': "SELECT * FROM users WHERE email = %s",
+    'user_by_username': "SELECT * FROM users WHERE username = %s",
+    'user_by_id': "SELECT * FROM users WHERE id = %s",
+}
+
 def get_user_by_email(db_manager, email: str) -> Optional[dict]:
     """Получение пользователя по email"""
     try:
-        query = "SELECT * FROM users WHERE email = %s"
-        result = db_manager.db.execute(query, (email,), fetch_one=True)
+        result = db_manager.db.execute_prepared('user_by_email', (email,), fetch_one=True)
         return result
     except Exception as e:
         logger.error(f"Error getting user by email {email}: {str(e)}")
@@ -18,8 +24,7 @@ def get_user_by_email(db_manager, email: str) -> Optional[dict]:
 def get_user_by_username(db_manager, username: str) -> Optional[dict]:
     """Получение пользователя по username"""
     try:
-        query = "SELECT * FROM users WHERE username = %s"
-        result = db_manager.db.execute(query, (username,), fetch_one=True)
+        result = db_manager.db.execute_prepared('user_by_username', (username,), fetch_one=True)
         return result
     except Exception as e:
         logger.error(f"Error getting user by username {username}: {str(e)}")
@@ -28,8 +33,7 @@ def get_user_by_username(db_manager, username: str) -> Optional[dict]:
 def get_user_by_id_db(db_manager, user_id: int) -> Optional[dict]:
     """Получение пользователя по ID"""
     try:
-        query = "SELECT * FROM users WHERE id = %s"
-        result = db_manager.db.execute(query, (user_id,), fetch_one=True)
+        result = db_manager.db.execute_prepared('user_by_id', (user_id,), fetch_one=True)
         return result
     except Exception as e:
         logger.error(f"Error getting user by ID {user_id}: {str(e)}")
@@ -1,6 +1,6 @@
 # frontend/app/__init__.py
-from flask import Flask
-from flask_socketio import SocketIO
+from flask import Flask, request
+from flask_socketio import SocketIO, emit
 import os
 import logging
 import time
@@ -40,13 +40,34 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SECURE'] = False  # True в production
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Статика с отпечатками содержимого, сжатыми вариантами и долгим кэшем (asset_url в шаблонах)
+from .assets import AssetPipeline
+assets = AssetPipeline(app)
+
+# threading - разработка; eventlet/gevent - production: тысячи соединений на процесс
+# (monkey patching выполняет run.py до импорта приложения)
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+# Несколько экземпляров frontend: события Socket.IO, адресованные клиентам
+# других экземпляров, передаются через Redis (пусто - один экземпляр)
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
+
 socketio = SocketIO(app, 
                     cors_allowed_origins="*", 
                     ping_interval=25, 
                     ping_timeout=5,
-                    async_mode='threading',
+                    async_mode=SOCKETIO_ASYNC_MODE,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE,
+                    channel='frontend-socketio',
                     manage_session=False)  # Важно для cookies
 
+# Локальная проверка JWT и правил auth_rules.yml для путей LOCAL_AUTH_PREFIXES (вместо forwardAuth)
+from shared.local_auth import LOCAL_AUTH_ENABLED, LocalAuthorizer, LocalAuthWSGIMiddleware, parse_prefixes
+LOCAL_AUTH_PREFIXES = parse_prefixes(os.getenv('LOCAL_AUTH_PREFIXES', ''))
+if LOCAL_AUTH_ENABLED and LOCAL_AUTH_PREFIXES:
+    from shared.redis_client import get_redis_client
+    app.wsgi_app = LocalAuthWSGIMiddleware(app.wsgi_app, LocalAuthorizer(redis_client=get_redis_client()),
+                                           LOCAL_AUTH_PREFIXES)
+
 # Инициализация Redis-WebSocket моста
 redis_bridge = None
 app_initialized = False
@@ -104,6 +125,9 @@ def debug_bridge():
         'bridge_exists': redis_bridge is not None,
         'bridge_running': redis_bridge.running if redis_bridge else False,
         'redis_connected': redis_bridge.is_connected() if redis_bridge else False,
+        'emitter': redis_bridge.status() if redis_bridge else None,
+        'async_mode': SOCKETIO_ASYNC_MODE,
+        'message_queue': bool(SOCKETIO_MESSAGE_QUEUE),
     }
     return status
 
@@ -111,8 +135,12 @@ def debug_bridge():
 @socketio.on('connect')
 def handle_connect():
     logger.info('Client connected via WebSocket')
+    if redis_bridge:
+        redis_bridge.add_client(request.sid)
     try:
-        socketio.emit('status', {'message': 'Connected to server', 'type': 'connection'})
+        # Только подключившемуся клиенту: рассылка всем при каждом подключении
+        # превращала волну переподключений в O(N^2) сообщений
+        emit('status', {'message': 'Connected to server', 'type': 'connection'})
         
     except Exception as e:
         logger.error(f"Error in connect handler: {e}")
@@ -120,11 +148,45 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     logger.info('Client disconnected')
+    if redis_bridge:
+        redis_bridge.remove_client(request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    Вход в комнату сессии:
+    {'id_session': 1, 'modules': ['A1', ...] | null,
+     'protocol': 'delta-msgpack', 'last_seq': 42, 'epoch': '...'}  - протокол дельт и возобновление
+    """
+    if not redis_bridge:
+        return {'success': False, 'error': 'Bridge not available'}
+    try:
+        id_session = int((data or {})['id_session'])
+        modules = data.get('modules')
+        if modules is not None and not isinstance(modules, list):
+            raise ValueError('modules must be a list')
+        last_seq = data.get('last_seq')
+        last_seq = int(last_seq) if last_seq is not None else None
+    except (KeyError, TypeError, ValueError) as e:
+        return {'success': False, 'error': f'Invalid subscription: {e}'}
+    
+    protocol = data.get('protocol', 'json')
+    redis_bridge.subscribe(request.sid, id_session, modules, protocol=protocol,
+                           last_seq=last_seq, epoch=data.get('epoch'))
+    logger.info(f"Client {request.sid} subscribed to session {id_session}, modules: {modules or 'all'}, "
+                f"protocol: {protocol}")
+    return {'success': True, 'id_session': id_session, 'epoch': redis_bridge.streams.get(id_session).epoch}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data=None):
+    if redis_bridge:
+        redis_bridge.unsubscribe(request.sid)
+    return {'success': True}
 
 @socketio.on('message')
 def handle_message(data):
     logger.info(f'Received message: {data}')
-    socketio.emit('response', {'message': 'Message received'})
+    emit('response', {'message': 'Message received'})
 
 # Обработчик ошибок
 @app.errorhandler(404)
@@ -0,0 +1,231 @@
+# frontend/app/assets.py
+"""
+Сборка и раздача статических ресурсов с отпечатками содержимого.
+
+Сборка (при старте приложения или в Dockerfile: python app/assets.py)
+копирует файлы static/ в ASSETS_BUILD_DIR под именами с хэшем
+содержимого (leaflet.js -> leaflet.3f2a9c1b0d4e.js), рядом кладет
+сжатые варианты .gz и .br и пишет manifest.json: логический путь -> путь
+с отпечатком. Шаблоны получают URL через asset_url('libs/leaflet/leaflet.js').
+
+Путь с отпечатком лежит в том же каталоге URL, что и исходный файл, поэтому
+относительные ссылки внутри CSS и sourceMappingURL продолжают работать.
+Такие URL отдаются с Cache-Control: immutable и сжатым вариантом по
+Accept-Encoding; прочие файлы static/ - как раньше, с повторной проверкой.
+Сборка инкрементальная: файлы с уже собранным хэшем не пересжимаются.
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+from typing import Dict, Optional, Tuple
+
+from flask import request, send_file, abort, current_app
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('frontend-assets')
+
+ASSETS_ENABLED = os.getenv('ASSETS_ENABLED', 'true').lower() == 'true'
+ASSETS_BUILD_DIR = os.getenv('ASSETS_BUILD_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static_build')
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+FINGERPRINT_EXTENSIONS = {'.js', '.mjs', '.css', '.map', '.json', '.svg', '.png', '.jpg', '.jpeg', '.gif',
+                          '.ico', '.woff', '.woff2', '.ttf'}
+COMPRESS_EXTENSIONS = {'.js', '.mjs', '.css', '.map', '.json', '.svg', '.ttf'}
+COMPRESS_MIN_BYTES = 1024
+# Вариант, сжатый хуже чем до 90% исходного, не сохраняется
+COMPRESS_MAX_RATIO = 0.9
+
+_FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{%d}(\.[^./]+)$' % HASH_LENGTH)
+
+
+def fingerprint(path: str, digest: str) -> str:
+    """libs/leaflet/leaflet.js -> libs/leaflet/leaflet.<hash>.js"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _compress_variants(target: str, data: bytes) -> Dict[str, int]:
+    """Файлы target.gz и target.br; возвращает размеры сохраненных вариантов"""
+    sizes = {}
+    variants = [('gzip', '.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', '.br', lambda raw: brotli.compress(raw, quality=11)))
+    for encoding, suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) <= len(data) * COMPRESS_MAX_RATIO:
+            _write(target + suffix, compressed)
+            sizes[encoding] = len(compressed)
+    return sizes
+
+
+def build_assets(static_dir: str, build_dir: str = ASSETS_BUILD_DIR) -> Dict[str, dict]:
+    """
+    Сборка ресурсов static_dir в build_dir
+
+    Манифест: {логический путь: {'path': путь с отпечатком, 'size': байт,
+    'encodings': {'gzip': байт, 'br': байт}}}.
+    """
+    previous = load_manifest(build_dir)
+    manifest: Dict[str, dict] = {}
+    built = 0
+
+    for root, dirs, files in os.walk(static_dir):
+        dirs.sort()
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in FINGERPRINT_EXTENSIONS:
+                continue
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = fingerprint(logical, hashlib.sha256(data).hexdigest())
+            target = os.path.join(build_dir, hashed)
+
+            entry = previous.get(logical)
+            if entry and entry['path'] == hashed and os.path.exists(target):
+                manifest[logical] = entry
+                continue
+
+            _write(target, data)
+            encodings = {}
+            if ext in COMPRESS_EXTENSIONS and len(data) >= COMPRESS_MIN_BYTES:
+                encodings = _compress_variants(target, data)
+            manifest[logical] = {'path': hashed, 'size': len(data), 'encodings': encodings}
+            built += 1
+
+    _write(os.path.join(build_dir, MANIFEST_NAME),
+           json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    logger.info(f"Assets: {len(manifest)} files in manifest, {built} rebuilt (brotli: {brotli is not None})")
+    return manifest
+
+
+def load_manifest(build_dir: str = ASSETS_BUILD_DIR) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), 'rb') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _accepted_encodings() -> set:
+    """Кодировки из Accept-Encoding (q=0 - запрещена)"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if token and quality > 0:
+            accepted.add(token.lower())
+    return accepted
+
+
+class AssetPipeline:
+    """Манифест ресурсов, asset_url для шаблонов и раздача /static с учетом сжатия"""
+
+    def __init__(self, app=None, build_dir: str = ASSETS_BUILD_DIR, enabled: bool = ASSETS_ENABLED):
+        self.build_dir = build_dir
+        self.enabled = enabled
+        self.manifest: Dict[str, dict] = {}
+        # путь с отпечатком -> логический путь
+        self._by_hashed: Dict[str, str] = {}
+        self.static_dir: Optional[str] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_dir = app.static_folder
+        if self.enabled:
+            try:
+                self._set_manifest(build_assets(self.static_dir, self.build_dir))
+            except OSError as e:
+                # Каталог сборки недоступен для записи - используем собранный в образе
+                logger.error(f"Asset build failed, using existing manifest: {e}")
+                self._set_manifest(load_manifest(self.build_dir))
+
+        app.jinja_env.globals['asset_url'] = self.url
+        app.view_functions['static'] = self.serve
+        app.extensions['assets'] = self
+
+    def _set_manifest(self, manifest: Dict[str, dict]):
+        self.manifest = manifest
+        self._by_hashed = {entry['path']: logical for logical, entry in manifest.items()}
+
+    def url(self, path: str) -> str:
+        """URL ресурса static/ для шаблона (с отпечатком, если файл собран)"""
+        path = path.lstrip('/')
+        entry = self.manifest.get(path) if self.enabled else None
+        return '/static/' + (entry['path'] if entry else path)
+
+    def serve(self, filename: str):
+        """Замена стандартного static: сжатые варианты и долгий кэш для путей с отпечатком"""
+        logical = self._by_hashed.get(filename)
+        if logical is not None:
+            entry = self.manifest[logical]
+            return self._send(os.path.join(self.build_dir, entry['path']), logical, entry)
+
+        if _FINGERPRINT_RE.search(filename) and not os.path.exists(os.path.join(self.static_dir, filename)):
+            # Отпечаток прежней сборки: страницы, открытые до обновления, получают прежнее содержимое
+            path = safe_join(self.build_dir, filename)
+            if path is None or not os.path.isfile(path):
+                abort(404)
+            encodings = {encoding: 0 for encoding, suffix in (('gzip', '.gz'), ('br', '.br'))
+                         if os.path.isfile(path + suffix)}
+            return self._send(path, filename, {'encodings': encodings})
+        return current_app.send_static_file(filename)
+
+    def _send(self, path: str, logical: str, entry: dict):
+        encoding, suffix = self._choose_encoding(entry)
+        mimetype = mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype in ('application/javascript', 'application/json'):
+            mimetype += '; charset=utf-8'
+
+        response = send_file(path + suffix, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE
+        return response
+
+    def _choose_encoding(self, entry: dict) -> Tuple[Optional[str], str]:
+        if not entry['encodings']:
+            return None, ''
+        accepted = _accepted_encodings()
+        if 'br' in entry['encodings'] and 'br' in accepted:
+            return 'br', '.br'
+        if 'gzip' in entry['encodings'] and 'gzip' in accepted:
+            return 'gzip', '.gz'
+        return None, ''
+
+
+if __name__ == '__main__':
+    # Сборка при создании образа: python app/assets.py
+    logging.basicConfig(level=logging.INFO)
+    build_assets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
@@ -1,9 +1,14 @@
 # frontend/app/redis_websocket_bridge.py
+import os
 import threading
 import logging
 import json
 import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple, Set, Iterable
 from shared.redis_client import get_redis_client
+from shared.tracing import TraceContext, record_trace
+from .update_protocol import UpdateStreams, PROTOCOL_NAME, encode_frame, select_modules, subscription_frame
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,12 +21,84 @@ logging.basicConfig(
 
 logger = logging.getLogger('frontend-redis-bridge')
 
+# Частота отправки накопленных обновлений клиентам (кадров в секунду)
+EMIT_RATE_HZ = float(os.getenv('EMIT_RATE_HZ', '10'))
+# Кадров в очереди клиента; при переполнении отбрасываются самые старые
+CLIENT_QUEUE_MAX = int(os.getenv('CLIENT_QUEUE_MAX', '20'))
+# Кадр без подтверждения дольше этого времени считается потерянным
+CLIENT_ACK_TIMEOUT = float(os.getenv('CLIENT_ACK_TIMEOUT', '5'))
+# Кадров сессии в буфере повтора для возобновления после переподключения
+REPLAY_FRAMES = int(os.getenv('REPLAY_FRAMES', '600'))
+# Поток сессии без подписчиков и обновлений дольше этого времени удаляется (память моста)
+STREAM_IDLE_SECONDS = float(os.getenv('STREAM_IDLE_SECONDS', '1800'))
+
+
+class ClientQueue:
+    """
+    Очередь кадров одного клиента
+
+    Следующий кадр отправляется после подтверждения (ack) предыдущего, поэтому
+    медленный клиент не копит неотправленные кадры в буфере сервера: кадры
+    ждут в ограниченной очереди, старые вытесняются новыми. Клиенту протокола
+    дельт вместо вытеснения отправляется снимок (resync): дельты без
+    пропусков применимы только подряд.
+    """
+
+    __slots__ = ('sid', 'id_session', 'modules', 'protocol', 'resync', 'frames', 'in_flight_since',
+                 'sent', 'dropped', 'lock')
+
+    def __init__(self, sid: str, max_frames: int):
+        self.sid = sid
+        # Подписка: сессия и необязательный набор модулей (None - все модули сессии)
+        self.id_session: Optional[int] = None
+        self.modules: Optional[frozenset] = None
+        # 'json' - полные записи (moduleUpdate), PROTOCOL_NAME - msgpack-дельты (moduleDelta)
+        self.protocol = 'json'
+        self.resync = False
+        # Элементы очереди: (событие, данные)
+        self.frames = deque(maxlen=max_frames)
+        self.in_flight_since: Optional[float] = None
+        self.sent = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+
 class RedisWebSocketBridge:
-    def __init__(self, socketio):
+    def __init__(self, socketio, emit_rate_hz: float = EMIT_RATE_HZ, client_queue_max: int = CLIENT_QUEUE_MAX):
         self.socketio = socketio
         self.redis_client = get_redis_client()
         self.running = False
         self.thread = None
+        self.flush_thread = None
+        self.flush_interval = 1.0 / max(emit_rate_hz, 0.1)
+        self.client_queue_max = max(1, client_queue_max)
+
+        # Последнее обновление модуля за интервал: (сессия, модуль) -> точка
+        self._latest: Dict[Tuple[Any, Any], dict] = {}
+        self._latest_traces: List[TraceContext] = []
+        self._latest_lock = threading.Lock()
+        self._clients: Dict[str, ClientQueue] = {}
+        # Комнаты сессий: id сессии -> sid подписанных клиентов
+        self._rooms: Dict[int, Set[str]] = {}
+        self._clients_lock = threading.Lock()
+        self.streams = UpdateStreams(REPLAY_FRAMES, STREAM_IDLE_SECONDS)
+
+        self.metrics: Dict[str, Any] = {
+            'messages_received': 0,
+            'points_received': 0,
+            'points_coalesced': 0,
+            'points_unrouted': 0,
+            'frames': 0,
+            'frames_sent': 0,
+            'frames_dropped': 0,
+            'ack_timeouts': 0,
+            'delta_bytes': 0,
+            'snapshots': 0,
+            'resumes': 0,
+            'resume_snapshots': 0,
+            'queue_high_watermark': 0,
+            'flush_ms_max': 0.0
+        }
         
         logger.info("RedisWebSocketBridge INITIALIZED")
         logger.info(f"Redis connected: {self.is_connected()}")
@@ -39,10 +116,12 @@ class RedisWebSocketBridge:
         self.running = True
         self.thread = threading.Thread(target=self._listen_redis, daemon=True)
         self.thread.start()
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True, name="bridge-flush")
+        self.flush_thread.start()
         
         logger.info("🎯 Redis-WebSocket bridge STARTED successfully")
         logger.info(f"🎯 Bridge thread alive: {self.thread.is_alive()}")
-        logger.info("🎯 Now listening on channel 'frontend_updates'")
+        logger.info(f"🎯 Now listening on channel 'frontend_updates', emitting at {1 / self.flush_interval:g} Hz")
         
         # Немедленная проверка подписки
         self._test_subscription()
@@ -60,7 +139,100 @@ class RedisWebSocketBridge:
         """Проверка соединения с Redis"""
         return self.redis_client.is_connected()
     
+    # ==================== КЛИЕНТЫ ====================
     
+    def add_client(self, sid: str):
+        """Регистрация подключенного клиента"""
+        with self._clients_lock:
+            self._clients[sid] = ClientQueue(sid, self.client_queue_max)
+
+    def remove_client(self, sid: str):
+        with self._clients_lock:
+            client = self._clients.pop(sid, None)
+            if client:
+                self._leave_room(client)
+
+    def subscribe(self, sid: str, id_session: int, modules: Optional[Iterable[str]] = None,
+                  protocol: str = 'json', last_seq: Optional[int] = None, epoch: Optional[str] = None):
+        """
+        Подписка клиента на обновления сессии (вход в комнату сессии)
+
+        modules - id модулей (hex), которые нужны клиенту; None - все модули сессии.
+        Кадры, уже стоящие в очереди клиента для прежней подписки, отбрасываются.
+        Клиент протокола дельт с last_seq и epoch этого экземпляра получает
+        пропущенные кадры из буфера повтора, иначе - снимок состояния.
+        """
+        with self._clients_lock:
+            client = self._clients.get(sid)
+            if client is None:
+                client = self._clients[sid] = ClientQueue(sid, self.client_queue_max)
+            self._leave_room(client)
+            client.id_session = id_session
+            client.modules = frozenset(str(module).upper() for module in modules) if modules is not None else None
+            client.protocol = PROTOCOL_NAME if protocol == PROTOCOL_NAME else 'json'
+            self._rooms.setdefault(id_session, set()).add(sid)
+
+        with client.lock:
+            client.frames.clear()
+            client.resync = False
+            if client.protocol != PROTOCOL_NAME:
+                return
+            missed = None
+            stream = self.streams.get(id_session)
+            if last_seq is not None and epoch == stream.epoch:
+                self.metrics['resumes'] += 1
+                missed = stream.missed_since(int(last_seq))
+            if missed is None:
+                if last_seq is not None:
+                    self.metrics['resume_snapshots'] += 1
+                client.resync = True
+            elif len(missed) > self.client_queue_max:
+                client.resync = True
+            else:
+                for frame in missed:
+                    client.frames.append(('moduleDelta', self._delta_payload(frame, client.modules)))
+            if client.in_flight_since is None:
+                self._send_next(client)
+
+    def unsubscribe(self, sid: str):
+        """Выход клиента из комнаты сессии"""
+        with self._clients_lock:
+            client = self._clients.get(sid)
+            if client:
+                self._leave_room(client)
+                client.id_session = None
+                client.modules = None
+
+    def _leave_room(self, client: ClientQueue):
+        """Удаление клиента из комнаты (вызывается под _clients_lock)"""
+        room = self._rooms.get(client.id_session)
+        if room is not None:
+            room.discard(client.sid)
+            if not room:
+                del self._rooms[client.id_session]
+
+    def status(self) -> Dict[str, Any]:
+        """Клиенты, глубина их очередей и метрики объединения"""
+        with self._clients_lock:
+            clients = list(self._clients.values())
+            rooms = {id_session: set(sids) for id_session, sids in self._rooms.items()}
+        depths = [len(client.frames) for client in clients]
+        with self._latest_lock:
+            pending_modules = len(self._latest)
+        return {
+            'emit_rate_hz': round(1 / self.flush_interval, 2),
+            'client_queue_max': self.client_queue_max,
+            'clients': len(clients),
+            'rooms': {str(id_session): len(sids) for id_session, sids in rooms.items()},
+            'clients_in_flight': sum(1 for client in clients if client.in_flight_since is not None),
+            'queued_frames': sum(depths),
+            'queue_depth_max': max(depths, default=0),
+            'pending_modules': pending_modules,
+            'protocol_epoch': self.streams.epoch,
+            'sessions_tracked': self.streams.sessions(),
+            'sessions_evicted': self.streams.evicted,
+            'metrics': dict(self.metrics)
+        }
     
     def _listen_redis(self):
         """Прослушивание Redis и отправка через WebSocket"""
@@ -83,14 +255,24 @@ class RedisWebSocketBridge:
                     if not self.running:
                         break
                     
+                    traces = TraceContext.all_from_message(message)
+                    for trace in traces:
+                        trace.mark('bridge_receive')
                     message_count += 1
-                    logger.info(f"RECEIVED message #{message_count}: {message.get('type', 'unknown')}")
-                    logger.info(f"📦 Message content keys: {list(message.keys())}")
-                    
-                    self._send_to_websocket(message)
+                    self.metrics['messages_received'] += 1
+                    logger.debug(f"RECEIVED message #{message_count}: {message.get('type', 'unknown')}")
+
+                    if message.get('type') == 'module_data':
+                        # Отправка - в потоке сброса, вместе с остальными обновлениями интервала
+                        self._coalesce(message, traces)
+                    else:
+                        self._send_to_websocket(message)
+                        for trace in traces:
+                            trace.mark('emit')
+                            record_trace(self.redis_client, trace)
                     
-                    # Логируем каждые 10 сообщений или если прошло 30 секунд
-                    if message_count % 10 == 0 or time.time() - start_time > 30:
+                    # Логируем каждые 100 сообщений или если прошло 30 секунд
+                    if message_count % 100 == 0 or time.time() - start_time > 30:
                         logger.info(f"📊 Total messages received: {message_count}")
                         start_time = time.time()
                         
@@ -99,18 +281,165 @@ class RedisWebSocketBridge:
                 time.sleep(5)
         
         logger.info("🛑 Redis WebSocket bridge listener stopped")
+
+    def _coalesce(self, message: dict, traces: List[TraceContext]):
+        """Сохранение только последней точки каждого модуля до следующего сброса"""
+        points = (message.get('data') or {}).get('points') or []
+        with self._latest_lock:
+            for point in points:
+                key = (point.get('id_session'), point.get('id_module'))
+                if key in self._latest:
+                    self.metrics['points_coalesced'] += 1
+                self._latest[key] = point
+            self._latest_traces.extend(traces)
+        self.metrics['points_received'] += len(points)
+
+    def _flush_loop(self):
+        """Отправка накопленных обновлений одним кадром с частотой EMIT_RATE_HZ"""
+        next_flush = time.monotonic()
+        next_eviction = next_flush + 60
+        while self.running:
+            next_flush += self.flush_interval
+            try:
+                self._flush()
+                if time.monotonic() >= next_eviction:
+                    next_eviction = time.monotonic() + 60
+                    with self._clients_lock:
+                        active = set(self._rooms)
+                    self.streams.evict_idle(active)
+            except Exception as e:
+                logger.error(f"Bridge flush error: {e}")
+            delay = next_flush - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Сброс не уложился в интервал - не пытаемся догнать пропущенные
+                next_flush = time.monotonic()
+
+    def _flush(self):
+        with self._latest_lock:
+            if not self._latest:
+                return
+            points, self._latest = list(self._latest.values()), {}
+            traces, self._latest_traces = self._latest_traces, []
+
+        started = time.perf_counter()
+        now = time.time()
+        by_session: Dict[Any, List[dict]] = {}
+        for point in points:
+            by_session.setdefault(point.get('id_session'), []).append(point)
+
+        # Кадры получают только клиенты комнаты сессии: стоимость рассылки
+        # зависит от числа заинтересованных клиентов, а не от всех подключенных
+        for id_session, session_points in by_session.items():
+            # Состояние и буфер повтора ведутся и без клиентов - для возобновления
+            delta = self.streams.get(id_session).apply(session_points, now)
+            with self._clients_lock:
+                sids = self._rooms.get(id_session)
+                clients = [self._clients[sid] for sid in sids] if sids else []
+            if not clients:
+                self.metrics['points_unrouted'] += len(session_points)
+                continue
+
+            self.metrics['frames'] += 1
+            frame = {'points': session_points, 'time': now, 'id_session': id_session}
+            # Кодированные кадры по наборам модулей: одинаковые подписки кодируются один раз
+            encoded: Dict[Optional[frozenset], bytes] = {}
+            for client in clients:
+                if client.protocol == PROTOCOL_NAME:
+                    if delta is None:
+                        continue
+                    if client.modules not in encoded:
+                        encoded[client.modules] = self._delta_payload(delta, client.modules)
+                    self._enqueue(client, 'moduleDelta', encoded[client.modules])
+                    continue
+                if client.modules is None:
+                    self._enqueue(client, 'moduleUpdate', frame)
+                    continue
+                selected = [point for point in session_points if point.get('id_module') in client.modules]
+                if selected:
+                    self._enqueue(client, 'moduleUpdate', {'points': selected, 'time': now, 'id_session': id_session})
+
+        flush_ms = (time.perf_counter() - started) * 1000
+        self.metrics['flush_ms_max'] = max(self.metrics['flush_ms_max'], flush_ms)
+
+        for trace in traces:
+            trace.mark('emit')
+            record_trace(self.redis_client, trace)
+
+    def _delta_payload(self, frame: Dict[str, Any], modules: Optional[frozenset]) -> bytes:
+        """Кадр протокола дельт для подписки (без модулей подписки - пустой, ради номера кадра)"""
+        return encode_frame(subscription_frame(frame, modules))
+
+    def _enqueue(self, client: ClientQueue, event: str, payload: Any):
+        """Постановка кадра в очередь клиента (при переполнении вытесняется самый старый)"""
+        with client.lock:
+            if len(client.frames) == client.frames.maxlen:
+                client.dropped += 1
+                self.metrics['frames_dropped'] += 1
+                if client.protocol == PROTOCOL_NAME:
+                    # Пропуск дельты нарушил бы состояние клиента - вместо очереди отправим снимок
+                    client.dropped += len(client.frames) - 1
+                    self.metrics['frames_dropped'] += len(client.frames) - 1
+                    client.frames.clear()
+                    client.resync = True
+            if not client.resync:
+                client.frames.append((event, payload))
+            if len(client.frames) > self.metrics['queue_high_watermark']:
+                self.metrics['queue_high_watermark'] = len(client.frames)
+
+            if client.in_flight_since is not None:
+                if time.monotonic() - client.in_flight_since < CLIENT_ACK_TIMEOUT:
+                    return
+                # Подтверждение не пришло - кадр считаем потерянным, продолжаем отправку
+                self.metrics['ack_timeouts'] += 1
+            self._send_next(client)
+
+    def _send_next(self, client: ClientQueue):
+        """Отправка следующего кадра клиенту (вызывается под client.lock)"""
+        if client.resync and client.id_session is not None:
+            # Снимок включает все изменения из очереди - очередь больше не нужна
+            client.resync = False
+            client.frames.clear()
+            snapshot = self.streams.get(client.id_session).snapshot(time.time())
+            event, payload = 'moduleDelta', encode_frame(dict(snapshot, modules=select_modules(
+                snapshot['modules'], client.modules)))
+            self.metrics['snapshots'] += 1
+        elif client.frames:
+            event, payload = client.frames.popleft()
+        else:
+            client.in_flight_since = None
+            return
+
+        client.in_flight_since = time.monotonic()
+        client.sent += 1
+        self.metrics['frames_sent'] += 1
+        if event == 'moduleDelta':
+            self.metrics['delta_bytes'] += len(payload)
+        try:
+            # Клиент подключен к этому экземпляру: очередь сообщений между экземплярами не нужна
+            self.socketio.emit(event, payload, to=client.sid, ignore_queue=True,
+                               callback=lambda *_: self._on_ack(client))
+        except Exception as e:
+            client.in_flight_since = None
+            logger.error(f"WebSocket emit error for {client.sid}: {e}")
+
+    def _on_ack(self, client: ClientQueue):
+        with client.lock:
+            self._send_next(client)
     
     def _send_to_websocket(self, message: dict):
         """Отправка сообщения через WebSocket"""
         try:
             message_type = message.get('type')
             
+            # Мост каждого экземпляра получает сообщение из Redis сам - рассылка только своим клиентам
             if message_type == 'module_data':
                 data = message.get('data', {})
-                self.socketio.emit('moduleUpdate', data)
+                self.socketio.emit('moduleUpdate', data, ignore_queue=True)
                 logger.debug(f"WebSocket emit: moduleUpdate for {len(data.get('hops', []))} modules")
             else:
-                self.socketio.emit('dataUpdate', message)
+                self.socketio.emit('dataUpdate', message, ignore_queue=True)
                 logger.debug(f"WebSocket emit: dataUpdate - {message_type}")
                 
         except Exception as e:
@@ -119,4 +448,4 @@ class RedisWebSocketBridge:
 # Альтернативная простая версия для отправки данных
 def send_new_module_data(data):
     """Заглушка для обратной совместимости"""
-    logger.warning("Direct WebSocket emission deprecated, use Redis instead")
\ No newline at end of file
+    logger.warning("Direct WebSocket emission deprecated, use Redis instead")
@@ -0,0 +1,166 @@
+# frontend/app/update_protocol.py
+"""
+Протокол обновлений модулей с дельтами и возобновлением (версия 1).
+
+Кадр - msgpack-карта:
+    {'v': 1, 'type': 'delta' | 'snapshot', 'epoch': str, 'seq': int,
+     'id_session': int, 'time': float, 'modules': {id_module: {поле: значение}}}
+
+Для каждой сессии мост ведет последнее состояние модулей и номер кадра.
+В дельте только поля, изменившиеся с предыдущего кадра сессии (значения
+полные, поэтому повторное применение кадра безопасно). Клиент с подпиской
+на часть модулей получает все кадры сессии, без изменений его модулей -
+с пустым 'modules', чтобы номера кадров шли без пропусков. Последние кадры
+хранятся в ограниченном буфере: клиент, переподключившийся с номером
+последнего кадра, получает пропущенные дельты, а если отстал дальше
+буфера или мост перезапускался (другой epoch) - снимок состояния.
+Поток сессии без подписчиков, не обновлявшийся idle_seconds, удаляется;
+пересозданный поток получает новый epoch, поэтому клиенты прежнего потока
+тоже получают снимок.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterable, Collection
+
+import msgpack
+
+PROTOCOL_VERSION = 1
+PROTOCOL_NAME = 'delta-msgpack'
+
+
+def encode_frame(frame: Dict[str, Any]) -> bytes:
+    return msgpack.packb(frame, use_bin_type=True)
+
+
+def select_modules(modules: Dict[str, dict], selected: Optional[frozenset]) -> Dict[str, dict]:
+    """Модули кадра из подписки клиента (None - все)"""
+    if selected is None:
+        return modules
+    return {id_module: fields for id_module, fields in modules.items() if id_module in selected}
+
+
+def subscription_frame(frame: Dict[str, Any], selected: Optional[frozenset]) -> Dict[str, Any]:
+    """
+    Кадр для подписки на часть модулей
+
+    Номера кадров общие для сессии, поэтому клиент получает каждый кадр:
+    если модули подписки не менялись, в кадре пустой 'modules'. Иначе
+    пропущенный номер выглядел бы для клиента как потеря кадра.
+    """
+    modules = select_modules(frame['modules'], selected)
+    if modules is frame['modules']:
+        return frame
+    return dict(frame, modules=modules)
+
+
+class SessionStream:
+    """Состояние модулей, номера кадров и буфер повтора одной сессии"""
+
+    def __init__(self, epoch: str, id_session: Any, replay_frames: int):
+        self.epoch = epoch
+        self.id_session = id_session
+        self.seq = 0
+        self.state: Dict[str, dict] = {}
+        self.replay = deque(maxlen=replay_frames)
+        self.lock = threading.Lock()
+        self.updated_at = time.monotonic()
+
+    def apply(self, points: Iterable[dict], now: float) -> Optional[Dict[str, Any]]:
+        """Новые точки модулей -> кадр-дельта (None, если ничего не изменилось)"""
+        with self.lock:
+            changed: Dict[str, dict] = {}
+            for point in points:
+                id_module = point.get('id_module')
+                previous = self.state.get(id_module)
+                if previous is None:
+                    delta = dict(point)
+                    self.state[id_module] = dict(point)
+                else:
+                    delta = {field: value for field, value in point.items() if previous.get(field) != value}
+                    previous.update(delta)
+                if delta:
+                    changed.setdefault(id_module, {}).update(delta)
+            self.updated_at = time.monotonic()
+            if not changed:
+                return None
+
+            self.seq += 1
+            frame = self._frame('delta', changed, now)
+            self.replay.append(frame)
+            return frame
+
+    def missed_since(self, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """Кадры после last_seq из буфера; None - буфера не хватает, нужен снимок"""
+        with self.lock:
+            if last_seq > self.seq:
+                return None
+            if last_seq == self.seq:
+                return []
+            if not self.replay or self.replay[0]['seq'] > last_seq + 1:
+                return None
+            return [frame for frame in self.replay if frame['seq'] > last_seq]
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        """Полное известное состояние модулей на текущий номер кадра"""
+        with self.lock:
+            return self._frame('snapshot', {id_module: dict(fields) for id_module, fields in self.state.items()}, now)
+
+    def _frame(self, frame_type: str, modules: Dict[str, dict], now: float) -> Dict[str, Any]:
+        return {
+            'v': PROTOCOL_VERSION,
+            'type': frame_type,
+            'epoch': self.epoch,
+            'seq': self.seq,
+            'id_session': self.id_session,
+            'time': now,
+            'modules': modules
+        }
+
+
+class UpdateStreams:
+    """Потоки кадров всех сессий одного экземпляра моста"""
+
+    def __init__(self, replay_frames: int, idle_seconds: float = 1800):
+        # epoch меняется при перезапуске: номера кадров прежнего экземпляра недействительны
+        self.epoch = uuid.uuid4().hex[:12]
+        self.replay_frames = replay_frames
+        self.idle_seconds = idle_seconds
+        self._streams: Dict[Any, SessionStream] = {}
+        self._lock = threading.Lock()
+        # Номер потока в epoch: пересозданный после удаления поток начинает номера кадров заново
+        self._generation = 0
+        self.evicted = 0
+
+    def get(self, id_session: Any) -> SessionStream:
+        with self._lock:
+            stream = self._streams.get(id_session)
+            if stream is None:
+                self._generation += 1
+                stream = self._streams[id_session] = SessionStream(
+                    f"{self.epoch}.{self._generation}", id_session, self.replay_frames
+                )
+            return stream
+
+    def evict_idle(self, active: Collection[Any]) -> int:
+        """
+        Удаление потоков без подписчиков, не обновлявшихся idle_seconds
+
+        :param active: сессии, у которых есть подписчики (их потоки сохраняются)
+        :return: число удаленных потоков
+        """
+        deadline = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [
+                id_session for id_session, stream in self._streams.items()
+                if stream.updated_at < deadline and id_session not in active
+            ]
+            for id_session in idle:
+                del self._streams[id_session]
+            self.evicted += len(idle)
+        return len(idle)
+
+    def sessions(self) -> int:
+        with self._lock:
+            return len(self._streams)
@@ -0,0 +1,212 @@
+# frontend/loadtest_socketio.py
+"""
+Нагрузочный тест real-time слоя frontend: тысячи клиентов Socket.IO.
+
+Клиенты подключаются с заданным темпом, подписываются на сессию (JSON или
+протокол дельт), подтверждают кадры как браузер и считают задержку от
+сброса кадра мостом до получения. Генератор (--publish-rate) публикует в
+frontend_updates синтетические обновления модулей, поэтому ingest для
+теста не нужен. Для проверки нескольких экземпляров укажите адрес
+балансировщика (Traefik) - клиенты распределятся по экземплярам.
+
+Требуется: pip install "python-socketio[asyncio_client]" aiohttp redis msgpack
+
+Запуск:
+    python loadtest_socketio.py --url http://localhost --clients 5000 \\
+        --ramp 200 --duration 60 --publish-rate 50 --modules 200 --protocol delta-msgpack
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+from datetime import datetime
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+import msgpack
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failed = 0
+        self.disconnects = 0
+        self.connect_ms = []
+        self.frames = 0
+        self.snapshots = 0
+        self.bytes = 0
+        self.delay_ms = []
+
+    def frame(self, sent_at: float, size: int, snapshot: bool = False):
+        self.frames += 1
+        self.bytes += size
+        if snapshot:
+            self.snapshots += 1
+        elif sent_at:
+            self.delay_ms.append((time.time() - sent_at) * 1000)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+async def run_client(index: int, args, stats: Stats, stop: asyncio.Event):
+    client = socketio.AsyncClient(reconnection=False)
+
+    @client.on('moduleUpdate')
+    async def on_update(frame):
+        stats.frame(frame.get('time', 0), len(json.dumps(frame)))
+        return True  # ack - сервер отправит следующий кадр
+
+    @client.on('moduleDelta')
+    async def on_delta(payload):
+        frame = msgpack.unpackb(payload)
+        stats.frame(frame.get('time', 0), len(payload), frame.get('type') == 'snapshot')
+        return True
+
+    @client.event
+    async def disconnect():
+        stats.disconnects += 1
+
+    started = time.perf_counter()
+    try:
+        await client.connect(args.url, transports=['websocket'], wait_timeout=30)
+    except Exception:
+        stats.connect_failed += 1
+        return
+    stats.connected += 1
+    stats.connect_ms.append((time.perf_counter() - started) * 1000)
+
+    modules = None
+    if args.module_filter:
+        modules = [format(random.randint(1, args.modules), 'X') for _ in range(args.module_filter)]
+    await client.emit('subscribe', {'id_session': args.session, 'modules': modules, 'protocol': args.protocol})
+
+    await stop.wait()
+    await client.disconnect()
+
+
+def make_update(args, seq: int) -> dict:
+    """Синтетическое сообщение frontend_updates (формат IngestWriter._publish)"""
+    now = datetime.now()
+    points = []
+    for _ in range(args.points_per_message):
+        id_module = random.randint(1, args.modules)
+        points.append({
+            'id': seq,
+            'id_module': format(id_module, 'X'),
+            'module_name': f"Module {id_module}",
+            'module_color': '#FF8800',
+            'id_session': args.session,
+            'session_name': 'Load test',
+            'message_type': 0,
+            'message_type_name': 'GPS',
+            'datetime': now.isoformat(),
+            'datetime_unix': int(now.timestamp()),
+            'coords': {'lat': 56.45 + random.random() / 100, 'lon': 84.96 + random.random() / 100, 'alt': 150.0},
+            'rssi': -random.randint(40, 120),
+            'snr': round(random.random() * 10, 2),
+            'source': 1,
+            'jumps': random.randint(0, 3),
+            'gps_ok': True,
+            'message_number': seq,
+            'created_at': now.isoformat()
+        })
+    return {'type': 'module_data', 'data': {'points': points, 'time': now.isoformat()},
+            'id_session': args.session, 'timestamp': now.isoformat()}
+
+
+async def publish(args, stop: asyncio.Event):
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(args.redis_url)
+    interval = 1 / args.publish_rate
+    seq = 0
+    try:
+        while not stop.is_set():
+            seq += 1
+            await client.publish('frontend_updates', json.dumps(make_update(args, seq)))
+            await asyncio.sleep(interval)
+    finally:
+        await client.aclose() if hasattr(client, 'aclose') else await client.close()
+
+
+async def report(stats: Stats, stop: asyncio.Event):
+    last_frames = 0
+    while not stop.is_set():
+        await asyncio.sleep(5)
+        print(f"  connected {stats.connected}, failed {stats.connect_failed}, disconnects {stats.disconnects}, "
+              f"frames/s {(stats.frames - last_frames) / 5:,.0f}, "
+              f"delay p95 {percentile(stats.delay_ms[-10000:], 0.95)} ms")
+        last_frames = stats.frames
+
+
+async def main_async(args):
+    stats = Stats()
+    stop = asyncio.Event()
+    tasks = []
+
+    background = [asyncio.create_task(report(stats, stop))]
+    if args.publish_rate:
+        background.append(asyncio.create_task(publish(args, stop)))
+
+    started = time.time()
+    for index in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(index, args, stats, stop)))
+        await asyncio.sleep(1 / args.ramp)
+    ramp_seconds = time.time() - started
+    print(f"{args.clients} clients started in {ramp_seconds:.1f}s")
+
+    frames_before = stats.frames
+    await asyncio.sleep(args.duration)
+    frames = stats.frames - frames_before
+    stop.set()
+    await asyncio.gather(*tasks, *background, return_exceptions=True)
+
+    print("Results:")
+    print(f"  clients connected     {stats.connected} / {args.clients} (failed {stats.connect_failed})")
+    print(f"  connect ms p50/p95    {percentile(stats.connect_ms, 0.5)} / {percentile(stats.connect_ms, 0.95)}")
+    print(f"  frames                {stats.frames:,} ({frames / args.duration:,.0f}/s steady), "
+          f"snapshots {stats.snapshots}")
+    print(f"  bytes per frame       {stats.bytes / max(stats.frames, 1):,.0f}")
+    print(f"  delay ms p50/p95/p99  {percentile(stats.delay_ms, 0.5)} / {percentile(stats.delay_ms, 0.95)} / "
+          f"{percentile(stats.delay_ms, 0.99)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO load test for the frontend real-time layer")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--ramp', type=float, default=200, help="Connections per second")
+    parser.add_argument('--duration', type=int, default=60, help="Steady-state seconds after ramp-up")
+    parser.add_argument('--session', type=int, default=1)
+    parser.add_argument('--protocol', choices=('json', 'delta-msgpack'), default='delta-msgpack')
+    parser.add_argument('--module-filter', type=int, default=0, help="Subscribe to N random modules (0 - all)")
+    parser.add_argument('--publish-rate', type=float, default=0, help="Synthetic frontend_updates per second")
+    parser.add_argument('--points-per-message', type=int, default=10)
+    parser.add_argument('--modules', type=int, default=200)
+    parser.add_argument('--redis-url', default=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    args = parser.parse_args()
+
+    if socketio is None:
+        raise SystemExit('python-socketio[asyncio_client] and aiohttp are required for the load test')
+
+    # Тысячи соединений в одном процессе упираются в лимит дескрипторов
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.clients + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, args.clients + 1000), hard))
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
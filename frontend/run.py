@@ -1,4 +1,15 @@
 # frontend/run.py
+import os
+
+# Асинхронный сервер: monkey patching до импорта приложения (redis, threading, socket)
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 from app import socketio, app
 import logging
 
@@ -9,15 +20,18 @@ logger = logging.getLogger('frontend-run')
 if __name__ == '__main__':
     logger.info("Starting Flask-SocketIO server...")
     
-    # Для разработки используем allow_unsafe_werkzeug
+    # threading - сервер разработки werkzeug (allow_unsafe_werkzeug),
+    # eventlet/gevent - собственный WSGI-сервер с WebSocket
+    options = {'allow_unsafe_werkzeug': True} if ASYNC_MODE == 'threading' else {}
+    logger.info(f"Socket.IO async mode: {ASYNC_MODE}")
     try:
         socketio.run(
             app, 
             host='0.0.0.0', 
             port=5000, 
-            allow_unsafe_werkzeug=True,
             debug=False,
-            log_output=True
+            log_output=ASYNC_MODE == 'threading',
+            **options
         )
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
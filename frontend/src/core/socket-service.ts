@@ -1,9 +1,15 @@
 // frontend/src/core/socket-service.ts
 import { eventBus } from './event-bus.js';
 import { EventTypes } from './constants.js';
+import { UpdateDecoder, UPDATE_PROTOCOL } from './update-protocol.js';
 
 export class SocketService {
     private socket: any;
+    // Текущая подписка на комнату сессии (повторяется после переподключения)
+    private subscription: { id_session: number; modules: string[] | null } | null = null;
+    private decoder = new UpdateDecoder();
+    // Запрос возобновления отправлен, ждем пропущенные кадры или снимок
+    private resyncing = false;
 
     constructor() {
         this.init();
@@ -27,6 +33,10 @@ export class SocketService {
     private setupEventHandlers(): void {
         this.socket.on('connect', () => {
             console.log('✅ Connected to server (TypeScript)');
+            if (this.subscription) {
+                // Возобновление: сервер дошлет пропущенные кадры или снимок
+                this.sendSubscription();
+            }
         });
 
         this.socket.on('disconnect', (reason: string) => {
@@ -37,9 +47,35 @@ export class SocketService {
             console.error('Connection error:', error.message);
         });
 
-        // Перенаправление событий от сервера в EventBus
-        this.socket.on(EventTypes.SOCKET.NEW_DATA_MODULE, (data: any) => {
+        // Перенаправление событий от сервера в EventBus.
+        // Подтверждение (ack) разрешает серверу отправить следующий кадр
+        this.socket.on(EventTypes.SOCKET.NEW_DATA_MODULE, (data: any, ack?: () => void) => {
             eventBus.emit(EventTypes.SOCKET.NEW_DATA_MODULE, data);
+            if (typeof ack === 'function') ack();
+        });
+
+        // Бинарные кадры с дельтами: декодер восстанавливает полные записи модулей
+        this.socket.on('moduleDelta', (payload: ArrayBuffer, ack?: () => void) => {
+            const { update, gap } = this.decoder.apply(payload);
+            if (typeof ack === 'function') ack();
+            if (gap) {
+                if (!this.resyncing) {
+                    this.resyncing = true;
+                    this.sendSubscription();
+                }
+                return;
+            }
+            this.resyncing = false;
+            if (update) {
+                eventBus.emit(EventTypes.SOCKET.NEW_DATA_MODULE, update);
+            }
+        });
+
+        // Обновления приходят только по выбранной сессии
+        eventBus.on(EventTypes.SESSION.SELECTED, (session: any) => {
+            if (session?.id != null) {
+                this.subscribe(session.id, this.subscription?.modules ?? null);
+            }
         });
 
         this.socket.on('session_updated', (data: any) => {
@@ -53,6 +89,27 @@ export class SocketService {
         });
     }
 
+    // Подписка на обновления сессии; modules - только эти модули (null - все)
+    public subscribe(idSession: number, modules: string[] | null = null): void {
+        this.subscription = { id_session: idSession, modules };
+        this.decoder.reset(idSession);
+        this.sendSubscription();
+    }
+
+    private sendSubscription(): void {
+        const request = {
+            ...this.subscription,
+            protocol: UPDATE_PROTOCOL,
+            last_seq: this.decoder.lastSeq,
+            epoch: this.decoder.epoch,
+        };
+        this.socket.emit('subscribe', request, (response: any) => {
+            if (!response?.success) {
+                console.error('Subscription failed:', response?.error);
+            }
+        });
+    }
+
     public emit(event: string, data?: any): void {
         this.socket.emit(event, data);
     }
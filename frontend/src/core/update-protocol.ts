@@ -0,0 +1,81 @@
+// frontend/src/core/update-protocol.ts
+import { decode } from '@msgpack/msgpack';
+
+// Протокол обновлений модулей: msgpack-кадры с дельтами полей и номерами кадров
+export const UPDATE_PROTOCOL = 'delta-msgpack';
+export const UPDATE_PROTOCOL_VERSION = 1;
+
+interface UpdateFrame {
+    v: number;
+    type: 'delta' | 'snapshot';
+    epoch: string;
+    seq: number;
+    id_session: number;
+    time: number;
+    modules: Record<string, Record<string, any>>;
+}
+
+export interface DecodedUpdate {
+    // Полные записи измененных модулей в формате moduleUpdate
+    update: { points: any[]; time: number; id_session: number } | null;
+    // Пропущены кадры - нужно переподписаться с lastSeq (сервер дошлет пропуск или снимок)
+    gap: boolean;
+}
+
+export class UpdateDecoder {
+    private modules = new Map<string, Record<string, any>>();
+    private idSession: number | null = null;
+    public epoch: string | null = null;
+    public lastSeq: number | null = null;
+
+    // Новая сессия: состояние прежней не применимо
+    public reset(idSession: number): void {
+        if (this.idSession === idSession) return;
+        this.idSession = idSession;
+        this.modules.clear();
+        this.epoch = null;
+        this.lastSeq = null;
+    }
+
+    public apply(payload: ArrayBuffer | Uint8Array): DecodedUpdate {
+        const frame = decode(payload instanceof Uint8Array ? payload : new Uint8Array(payload)) as UpdateFrame;
+        if (frame.v !== UPDATE_PROTOCOL_VERSION) {
+            console.warn('Unsupported update protocol version:', frame.v);
+            return { update: null, gap: false };
+        }
+        if (frame.id_session !== this.idSession) {
+            return { update: null, gap: false };
+        }
+
+        if (frame.type === 'delta') {
+            if (frame.epoch !== this.epoch || this.lastSeq === null) {
+                // Сервер перезапущен или снимка еще не было
+                return { update: null, gap: true };
+            }
+            if (frame.seq <= this.lastSeq) {
+                // Уже примененный кадр (пришел после снимка)
+                return { update: null, gap: false };
+            }
+            if (frame.seq > this.lastSeq + 1) {
+                return { update: null, gap: true };
+            }
+        } else if (this.epoch === frame.epoch && this.lastSeq !== null && frame.seq < this.lastSeq) {
+            return { update: null, gap: false };
+        }
+
+        // Кадр без модулей (подписка на часть модулей, они не менялись) только продвигает lastSeq
+        const points: any[] = [];
+        for (const [idModule, fields] of Object.entries(frame.modules)) {
+            const record = { ...(this.modules.get(idModule) || {}), ...fields, id_session: frame.id_session };
+            this.modules.set(idModule, record);
+            points.push(record);
+        }
+        this.epoch = frame.epoch;
+        this.lastSeq = frame.seq;
+
+        return {
+            update: points.length ? { points, time: frame.time, id_session: frame.id_session } : null,
+            gap: false,
+        };
+    }
+}
@@ -0,0 +1,7 @@
+# frontend/tests/conftest.py
+import os
+import sys
+
+# Пакет app при импорте создает приложение Flask - модули без зависимостей
+# от Flask импортируются напрямую по имени
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
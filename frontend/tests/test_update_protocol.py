@@ -0,0 +1,94 @@
+# frontend/tests/test_update_protocol.py
+import msgpack
+
+from update_protocol import SessionStream, UpdateStreams, subscription_frame, encode_frame
+
+
+def point(id_module, lat, lon=37.0):
+    return {'id_module': id_module, 'id_session': 1, 'lat': lat, 'lon': lon}
+
+
+def make_stream(replay_frames=10):
+    stream = SessionStream('epoch', 1, replay_frames)
+    # Кадры поочередно меняют модуль A и модуль B
+    for i in range(6):
+        stream.apply([point('A' if i % 2 == 0 else 'B', 55.0 + i)], now=float(i))
+    return stream
+
+
+def decode_frames(frames, selected):
+    return [msgpack.unpackb(encode_frame(subscription_frame(frame, selected)), raw=False) for frame in frames]
+
+
+def test_missed_since_returns_frames_after_last_seq():
+    stream = make_stream()
+
+    missed = stream.missed_since(3)
+
+    assert [frame['seq'] for frame in missed] == [4, 5, 6]
+    assert stream.missed_since(6) == []
+
+
+def test_missed_since_requires_snapshot_outside_buffer_or_ahead():
+    stream = make_stream(replay_frames=3)
+
+    assert stream.missed_since(2) is None
+    assert [frame['seq'] for frame in stream.missed_since(3)] == [4, 5, 6]
+    assert stream.missed_since(7) is None
+
+
+def test_filtered_replay_has_no_sequence_gaps():
+    stream = make_stream()
+
+    frames = decode_frames(stream.missed_since(1), frozenset({'A'}))
+
+    assert [frame['seq'] for frame in frames] == [2, 3, 4, 5, 6]
+    assert [sorted(frame['modules']) for frame in frames] == [[], ['A'], [], ['A'], []]
+
+
+def test_filtered_frame_keeps_only_subscribed_modules():
+    stream = SessionStream('epoch', 1, 10)
+    frame = stream.apply([point('A', 55.0), point('B', 56.0)], now=0.0)
+
+    filtered = subscription_frame(frame, frozenset({'B'}))
+
+    assert list(filtered['modules']) == ['B']
+    assert filtered['seq'] == frame['seq']
+    assert sorted(frame['modules']) == ['A', 'B']
+    assert subscription_frame(frame, None) is frame
+
+
+def test_delta_contains_only_changed_fields():
+    stream = SessionStream('epoch', 1, 10)
+    stream.apply([point('A', 55.0)], now=0.0)
+
+    frame = stream.apply([point('A', 55.5)], now=1.0)
+
+    assert frame['modules'] == {'A': {'lat': 55.5}}
+    assert stream.apply([point('A', 55.5)], now=2.0) is None
+    assert stream.seq == 2
+
+
+def test_idle_streams_without_subscribers_are_evicted():
+    streams = UpdateStreams(replay_frames=10, idle_seconds=0)
+    watched = streams.get(1)
+    watched.apply([point('A', 55.0)], now=0.0)
+    idle = streams.get(2)
+    idle.apply([point('A', 55.0)], now=0.0)
+
+    assert streams.evict_idle(active={1}) == 1
+    assert streams.sessions() == 1
+    assert streams.get(1) is watched
+
+    # Пересозданный поток начинает номера заново в новом epoch: клиент прежнего потока получит снимок
+    recreated = streams.get(2)
+    assert recreated.epoch != idle.epoch
+    assert recreated.seq == 0
+
+
+def test_recently_updated_streams_are_kept():
+    streams = UpdateStreams(replay_frames=10, idle_seconds=60)
+    streams.get(1).apply([point('A', 55.0)], now=0.0)
+
+    assert streams.evict_idle(active=()) == 0
+    assert streams.sessions() == 1
@@ -7,6 +7,8 @@ from .parser import parse_message, HopData
 
 import json
 from shared.redis_client import get_redis_client
+from shared.tracing import TraceContext
+from shared.ingest_partition import publish_partitioned
 
 def handle_provider(conn, address):
     client_info = f"{address[0]}:{address[1]}"
@@ -55,6 +57,8 @@ def handle_data_provider(conn, address, initial_bytes_data):
         conn.settimeout(30.0)
         
         while True:
+            # Трасса начинается сразу после приема пакета из TCP
+            trace = TraceContext.start()
             time_stamp = datetime.now()
             scet += 1
             
@@ -69,6 +73,7 @@ def handle_data_provider(conn, address, initial_bytes_data):
 
             # Парсинг сообщения
             hops, errors = parse_message(data_byte)
+            trace.mark('parse')
             
             # Формируем данные для веб-интерфейса
             parsed_data = {
@@ -112,7 +117,9 @@ def handle_data_provider(conn, address, initial_bytes_data):
                     'provider': client_info,
                     'timestamp': time_stamp.isoformat()
                 }
-                redis_client.publish('module_data', redis_message)
+                trace.mark('publish')
+                redis_message['trace'] = trace.to_dict()
+                publish_partitioned(redis_client, 'module_data', redis_message)
             else:
                 # НЕВАЛИДНЫЕ данные - отправляем с причиной ошибки и сырыми данными
                 corrupted_message = {
@@ -138,7 +145,9 @@ def handle_data_provider(conn, address, initial_bytes_data):
                     'provider': client_info,
                     'timestamp': time_stamp.isoformat()
                 }
-                redis_client.publish('corrupted_data', corrupted_message)
+                trace.mark('publish')
+                corrupted_message['trace'] = trace.to_dict()
+                publish_partitioned(redis_client, 'corrupted_data', corrupted_message)
             
             ConnectionService.update_module_activity(client_info)
             
@@ -169,7 +178,7 @@ def handle_data_provider(conn, address, initial_bytes_data):
             'provider': client_info,
             'timestamp': datetime.now().isoformat()
         }
-        redis_client.publish('corrupted_data', critical_error_message)
+        publish_partitioned(redis_client, 'corrupted_data', critical_error_message)
         log_message("ERROR", f"Critical parser error: {e}", client_info)
     finally:
         log_message("INFO", f"Provider disconnected: {client_info}", client_info)
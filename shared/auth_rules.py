@@ -0,0 +1,350 @@
+# shared/auth_rules.py
+"""
+Правила доступа из auth_rules.yml: компиляция в префиксные деревья ролей,
+неизменяемые снимки и отслеживание изменений файла.
+
+Используется auth-service (/auth/validate для Traefik forwardAuth) и
+локальной проверкой в сервисах (shared.local_auth) - решения совпадают.
+"""
+import os
+import yaml
+import time
+import threading
+import logging
+import functools
+from pathlib import Path
+from typing import Dict, Set, List, Optional, FrozenSet, Tuple, Any
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger("auth-config")
+
+# Путь к правилам в сервисах, проверяющих доступ локально
+AUTH_RULES_PATH = os.getenv("AUTH_RULES_PATH", "auth_rules.yml")
+# Опрос файла, если inotify недоступен (не Linux, нет inotify_simple, лимит watch)
+AUTH_CONFIG_POLL_SECONDS = float(os.getenv("AUTH_CONFIG_POLL_SECONDS", "30"))
+# Пауза после события файла: редакторы и ConfigMap пишут файл в несколько шагов
+AUTH_CONFIG_SETTLE_SECONDS = 0.2
+
+# Роли с доступом ко всему без проверки правил
+SUPERUSER_ROLES = frozenset(("admin", "developer"))
+
+
+class PathTrie:
+    """
+    Префиксное дерево правил одной роли (по символам пути)
+
+    В каждом узле - объединение методов всех правил-префиксов до этого узла,
+    поэтому проверка - один проход по пути без перебора правил.
+    Совпадение по символам, как у прежнего path.startswith(rule_path).
+    """
+
+    __slots__ = ('root', 'rules')
+
+    def __init__(self, rules: Dict[str, Set[str]]):
+        # Узел: [дети {символ: узел}, методы префикса]
+        self.root = [{}, frozenset()]
+        self.rules = len(rules)
+        for path, methods in rules.items():
+            node = self.root
+            for char in path:
+                node = node[0].setdefault(char, [{}, frozenset()])
+            node[1] = node[1] | frozenset(methods)
+        self._propagate(self.root, frozenset())
+
+    def _propagate(self, node: list, inherited: FrozenSet[str]):
+        node[1] = node[1] | inherited
+        for child in node[0].values():
+            self._propagate(child, node[1])
+
+    def methods(self, path: str) -> FrozenSet[str]:
+        """Методы, разрешенные правилами-префиксами пути"""
+        node = self.root
+        for char in path:
+            child = node[0].get(char)
+            if child is None:
+                break
+            node = child
+        return node[1]
+
+
+def normalize_path(path: str) -> str:
+    """
+    Путь без query и fragment для проверки и ключа кэша
+
+    В правилах нет '?' и '#', поэтому результат сравнения префиксов
+    тот же, что для исходного X-Forwarded-Uri.
+    """
+    for separator in ('?', '#'):
+        index = path.find(separator)
+        if index != -1:
+            path = path[:index]
+    return path
+
+
+class AuthSnapshot:
+    """
+    Неизменяемый результат компиляции правил
+
+    Читатели берут текущий снимок одной ссылкой и не блокируются;
+    перезагрузка собирает новый снимок и заменяет ссылку целиком.
+    """
+
+    __slots__ = ('role_minimum_access', 'role_tries', 'decide', 'role_access_stats',
+                 'signature', 'loaded_at', 'version')
+
+    def __init__(self, role_minimum_access: Dict[str, Dict[str, FrozenSet[str]]],
+                 role_tries: Dict[str, PathTrie], decide, role_access_stats: Dict[str, Dict[str, int]],
+                 signature: Optional[Tuple[int, int, int]], version: int):
+        self.role_minimum_access = role_minimum_access
+        self.role_tries = role_tries
+        self.decide = decide
+        self.role_access_stats = role_access_stats
+        # (st_mtime_ns, st_size, st_ino) файла, из которого собран снимок
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.version = version
+
+
+class AuthConfig:
+    def __init__(self, config_path: str = AUTH_RULES_PATH, decision_cache_size: int = 8192,
+                 poll_seconds: float = AUTH_CONFIG_POLL_SECONDS):
+        self.config_path = Path(config_path)
+        self.decision_cache_size = decision_cache_size
+        self.poll_seconds = poll_seconds
+        # Блокировка только между перезагрузками; читатели используют self._snapshot без нее
+        self._reload_lock = threading.Lock()
+        self.watch_mode = None
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+        
+        # Иерархия ролей
+        self.ROLE_HIERARCHY = {
+            "developer": 4,
+            "admin": 3, 
+            "curator": 2,
+            "user": 1,
+            "public": 0
+        }
+        
+        # Пустой снимок до первой загрузки: доступ только суперпользователям
+        self._snapshot = self._compile_rules({}, None, 0)
+        self._load_and_compile()
+        self._start_watcher()
+    
+    @property
+    def snapshot(self) -> AuthSnapshot:
+        return self._snapshot
+    
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.config_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _load_and_compile(self, force: bool = False) -> bool:
+        """Загрузка и компиляция YAML в новый снимок (True - снимок заменен)"""
+        with self._reload_lock:
+            try:
+                signature = self._file_signature()
+                if signature is None:
+                    logger.error(f"Config file not found: {self.config_path}")
+                    return False
+                
+                # Сравнение на неравенство: ConfigMap и откат файла могут вернуть mtime назад
+                if not force and signature == self._snapshot.signature:
+                    logger.debug("Auth config not modified")
+                    return False
+                
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    raw_config = yaml.safe_load(f) or {}
+                
+                self._snapshot = self._compile_rules(raw_config, signature, self._snapshot.version + 1)
+                self.last_error = None
+                logger.info(f"Auth config reloaded and compiled (version {self._snapshot.version})")
+                return True
+                
+            except Exception as e:
+                # Прежний снимок продолжает действовать
+                self.reload_errors += 1
+                self.last_error = str(e)
+                logger.error(f"Error loading auth config: {e}")
+                return False
+    
+    def _compile_rules(self, raw_config: Dict, signature: Optional[Tuple[int, int, int]],
+                       version: int) -> AuthSnapshot:
+        """Трансформация YAML в неизменяемый снимок"""
+        # Компиляция всех ролей
+        role_minimum_access = {}
+        for role, rules in (raw_config.get('role_minimum_access') or {}).items():
+            role_rules = {}
+            for rule in rules or []:
+                path = rule['path']
+                methods = frozenset(rule['methods'])
+                role_rules[path] = methods
+            role_minimum_access[role] = role_rules
+        
+        # Префиксные деревья с уже объединенной иерархией: строятся один раз на загрузку
+        role_tries = {}
+        role_access_stats = {}
+        for role in self.ROLE_HIERARCHY:
+            aggregated = self._aggregate(role_minimum_access, role)
+            role_tries[role] = PathTrie(aggregated)
+            role_access_stats[role] = {
+                'paths': len(aggregated),
+                'total_methods': sum(len(methods) for methods in aggregated.values())
+            }
+        
+        # Кэш решений живет вместе со снимком: перезагрузка начинает новый кэш
+        def decide(role: str, method: str, path: str) -> bool:
+            trie = role_tries.get(role) or role_tries['public']
+            return method in trie.methods(path)
+        
+        return AuthSnapshot(
+            role_minimum_access,
+            role_tries,
+            functools.lru_cache(maxsize=self.decision_cache_size)(decide),
+            role_access_stats,
+            signature,
+            version
+        )
+    
+    def _start_watcher(self):
+        """Фоновое отслеживание изменений конфига: inotify, при недоступности - опрос"""
+        inotify = self._create_inotify()
+        if inotify is not None:
+            self.watch_mode = 'inotify'
+            target = functools.partial(self._inotify_loop, inotify)
+        else:
+            self.watch_mode = 'polling'
+            target = self._poll_loop
+        
+        watcher_thread = threading.Thread(target=target, daemon=True, name="auth-config-watcher")
+        watcher_thread.start()
+        logger.info(f"Auth config watcher: {self.watch_mode}")
+    
+    def _create_inotify(self):
+        if INotify is None:
+            return None
+        try:
+            inotify = INotify()
+            # Наблюдается каталог: файл часто заменяется переименованием (редакторы, ConfigMap).
+            # Без resolve(): в ConfigMap файл - ссылка через ..data на каталог версии,
+            # который при обновлении удаляется, а переключается ссылка в каталоге файла
+            inotify.add_watch(
+                str(self.config_path.absolute().parent),
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+                | inotify_flags.DELETE | inotify_flags.ATTRIB
+            )
+            return inotify
+        except OSError as e:
+            logger.warning(f"inotify unavailable, falling back to polling: {e}")
+            return None
+    
+    def _inotify_loop(self, inotify):
+        watched = {self.config_path.name, '..data'}
+        while True:
+            try:
+                # Таймаут - страховка от пропущенных событий (например, смена тома)
+                events = inotify.read(timeout=int(max(self.poll_seconds, 1) * 1000))
+                if events and not any(event.name in watched for event in events):
+                    continue
+                if events:
+                    time.sleep(AUTH_CONFIG_SETTLE_SECONDS)
+                    # События, пришедшие за паузу, покрываются одной перезагрузкой
+                    inotify.read(timeout=0)
+                self._load_and_compile()
+            except Exception as e:
+                logger.error(f"Auth config watcher error: {e}")
+                time.sleep(self.poll_seconds)
+    
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self._load_and_compile()
+    
+    def has_role_access(self, user_role: str, required_role: str) -> bool:
+        """Проверка что user_role >= required_role в иерархии"""
+        user_level = self.ROLE_HIERARCHY.get(user_role, 0)
+        required_level = self.ROLE_HIERARCHY.get(required_role, 0)
+        return user_level >= required_level
+    
+    def is_public_endpoint(self, method: str, path: str) -> bool:
+        """Проверка публичного эндпоинта через роль public"""
+        return self.can_access("public", method, path)
+    
+    def can_access(self, role: str, method: str, path: str) -> bool:
+        """Проверка доступа с учетом иерархии ролей"""
+        # Админы и разработчики имеют доступ ко всему
+        if role in SUPERUSER_ROLES:
+            return True
+        
+        if self._snapshot.decide(role, method, normalize_path(path)):
+            return True
+        
+        # Логирование неизвестных endpoints
+        logger.warning(f"No access rules for {role} to {method} {path}")
+        return False
+    
+    def _get_aggregated_access(self, role: str) -> Dict[str, Set]:
+        """Получить ВСЕ права для роли (с наследованием иерархии)"""
+        return self._aggregate(self._snapshot.role_minimum_access, role)
+    
+    def _aggregate(self, role_minimum_access: Dict[str, Dict[str, FrozenSet[str]]], role: str) -> Dict[str, Set]:
+        """Объединение правил всех ролей не выше role"""
+        aggregated = {}
+        user_level = self.ROLE_HIERARCHY.get(role, 0)
+        
+        for min_role, rules in role_minimum_access.items():
+            min_level = self.ROLE_HIERARCHY.get(min_role, 0)
+            
+            # Если роль пользователя >= минимальной роли для права
+            if user_level >= min_level:
+                for path, methods in rules.items():
+                    # Объединяем методы для этого пути
+                    if path in aggregated:
+                        aggregated[path].update(methods)
+                    else:
+                        aggregated[path] = set(methods)
+        
+        return aggregated
+    
+    def force_reload(self) -> bool:
+        """Принудительная перезагрузка конфига"""
+        return self._load_and_compile(force=True)
+    
+    def health(self) -> Dict[str, Any]:
+        """Состояние загруженных правил без обращения к файловой системе"""
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot.signature is not None,
+            'version': snapshot.version,
+            'loaded_at': snapshot.loaded_at,
+            'watch_mode': self.watch_mode,
+            'reload_errors': self.reload_errors,
+            'last_error': self.last_error
+        }
+    
+    def get_stats(self):
+        """Статистика загруженных правил"""
+        snapshot = self._snapshot
+        cache_info = snapshot.decide.cache_info()
+        
+        return {
+            'roles_defined': len(snapshot.role_minimum_access),
+            'role_hierarchy': self.ROLE_HIERARCHY,
+            'role_access_stats': snapshot.role_access_stats,
+            'decision_cache': {
+                'hits': cache_info.hits,
+                'misses': cache_info.misses,
+                'size': cache_info.currsize,
+                'max_size': cache_info.maxsize
+            },
+            'version': snapshot.version,
+            'watch_mode': self.watch_mode,
+            'last_modified': snapshot.signature[0] / 1e9 if snapshot.signature else 0
+        }
@@ -0,0 +1,68 @@
+# shared/ingest_partition.py
+"""
+Разбиение потока приема данных на шарды.
+
+module-service публикует пакет в канал своего шарда (module_data:1,
+corrupted_data:0, ...), шард выбирается по модулю-источнику пакета
+(первый хоп), для пакетов без хопов - по провайдеру. Каждый процесс
+приема data-service подписывается только на каналы своих шардов, поэтому
+N процессов делят нагрузку без повторной записи пакетов, а пакеты одного
+модуля всегда обрабатываются одним процессом по порядку.
+
+При INGEST_SHARDS=1 используются прежние имена каналов без суффикса.
+Число шардов должно совпадать у module-service и data-service.
+"""
+import os
+import zlib
+from typing import Dict, Any, Iterable, List
+
+INGEST_SHARDS = max(1, int(os.getenv('INGEST_SHARDS', '1')))
+
+INGEST_CHANNELS = ('module_data', 'corrupted_data')
+
+
+def partition_key(message: Dict[str, Any]) -> str:
+    """Ключ порядка пакета: модуль-источник (первый хоп) или провайдер"""
+    data = message.get('data') or {}
+    hops = data.get('hops') or (data.get('parsed_attempt') or {}).get('hops') or []
+    if hops and isinstance(hops[0], dict) and hops[0].get('module_num') is not None:
+        return f"module:{hops[0]['module_num']}"
+    return f"provider:{message.get('provider', '')}"
+
+
+def partition(message: Dict[str, Any], partitions: int, nested: bool = False) -> int:
+    """
+    Номер раздела (шарда, воркера) сообщения из partitions
+
+    nested - разбиение внутри шарда (воркеры процесса): хэш перемешивается,
+    иначе ключи одного шарда с одинаковым остатком crc32 попадали бы в часть
+    воркеров, а остальные простаивали
+    """
+    if partitions <= 1:
+        return 0
+    value = zlib.crc32(partition_key(message).encode())
+    if nested:
+        value = ((value * 0x9E3779B1) & 0xFFFFFFFF) >> 16
+    return value % partitions
+
+
+def shard_channel(channel: str, shard: int, shards: int = INGEST_SHARDS) -> str:
+    """Имя канала шарда (без суффикса, если шард один)"""
+    return channel if shards <= 1 else f"{channel}:{shard}"
+
+
+def base_channel(channel: str) -> str:
+    """Имя канала без номера шарда"""
+    return channel.split(':', 1)[0]
+
+
+def shard_channels(shards_owned: Iterable[int], shards: int = INGEST_SHARDS,
+                   channels: Iterable[str] = INGEST_CHANNELS) -> List[str]:
+    """Каналы приема для набора шардов"""
+    return [shard_channel(channel, shard, shards) for shard in shards_owned for channel in channels]
+
+
+def publish_partitioned(redis_client, channel: str, message: Dict[str, Any],
+                        shards: int = INGEST_SHARDS) -> bool:
+    """Публикация сообщения в канал шарда его модуля-источника"""
+    return redis_client.publish(shard_channel(channel, partition(message, shards), shards), message)
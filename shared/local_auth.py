@@ -0,0 +1,214 @@
+# shared/local_auth.py
+"""
+Локальная проверка доступа в сервисах вместо Traefik forwardAuth.
+
+LocalAuthorizer повторяет /auth/validate auth-service: публичные пути по
+роли public, затем Bearer access token (подпись общим SECRET_KEY), затем
+правила роли из auth_rules.yml (shared.auth_rules). Разрешенный запрос
+получает те же заголовки X-User-*, что выставлял forwardAuth, поэтому
+shared.auth_dependencies и shared.auth_utils работают без изменений.
+Заголовки X-User-* от клиента всегда удаляются.
+
+LocalAuthMiddleware - ASGI (FastAPI), LocalAuthWSGIMiddleware - WSGI (Flask).
+Проверяются только пути из prefixes - роуты, которые раньше шли через
+auth-forward; остальные (внутренние /users, /health) пропускаются как есть.
+
+Отзывы токенов auth-service (выход) приходят через Redis
+(shared.token_revocation) в TokenCache авторизатора. Без Redis отзыв
+здесь не виден, и токен принимается до своего exp (15 минут для access token).
+"""
+import os
+import logging
+from typing import Optional, Dict, List, Tuple, Iterable
+
+from .auth_rules import AuthConfig
+from .token_cache import TokenCache
+from .token_revocation import RevocationListener
+
+try:
+    from jose import jwt as jose_jwt
+except ImportError:
+    jose_jwt = None
+
+try:
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
+
+logger = logging.getLogger("local-auth")
+
+LOCAL_AUTH_ENABLED = os.getenv("LOCAL_AUTH_ENABLED", "false").lower() == "true"
+JWT_SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+
+USER_HEADERS = ("X-User-Id", "X-User-Name", "X-User-Role", "X-User-Permissions", "X-User-Email")
+
+
+def parse_prefixes(value: str) -> List[str]:
+    """Список префиксов путей из строки '/api/sessions,/api/table'"""
+    return [prefix.strip() for prefix in value.split(',') if prefix.strip()]
+
+
+class LocalAuthorizer:
+    """Решение forwardAuth без сетевого запроса к auth-service"""
+
+    def __init__(self, auth_config: Optional[AuthConfig] = None, secret_key: str = JWT_SECRET_KEY,
+                 algorithm: str = JWT_ALGORITHM, token_cache_size: int = 10000, redis_client=None):
+        if jose_jwt is None and pyjwt is None:
+            raise RuntimeError("python-jose or PyJWT is required for local token verification")
+        self.auth_config = auth_config or AuthConfig()
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.token_cache = TokenCache(max_size=token_cache_size)
+        # Отзывы из auth-service (None - отзыв не учитывается)
+        self.revocations = RevocationListener(redis_client, self.token_cache) if redis_client is not None else None
+        if self.revocations is not None:
+            self.revocations.start()
+        self.metrics = {'allowed': 0, 'public': 0, 'unauthorized': 0, 'forbidden': 0}
+
+    def verify_token(self, token: str) -> Optional[dict]:
+        """Payload токена с проверенной подписью и exp (None - токен недействителен)"""
+        payload = self.token_cache.get(token)
+        if payload is not None:
+            return payload
+        try:
+            if jose_jwt is not None:
+                payload = jose_jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            else:
+                payload = pyjwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except Exception as e:
+            logger.warning(f"JWT token verification failed: {e}")
+            return None
+        if not self.token_cache.put(token, payload):
+            logger.warning(f"Revoked token rejected for {payload.get('sub')}")
+            return None
+        return payload
+
+    def authorize(self, method: str, uri: str, authorization: str) -> Tuple[int, Dict[str, str]]:
+        """
+        (статус, заголовки пользователя) как у /auth/validate
+
+        200 - запрос пропускается (заголовки пусты для публичных путей),
+        401 - нет или недействителен access token, 403 - роли не хватает прав.
+        """
+        if self.auth_config.can_access("public", method, uri):
+            self.metrics['public'] += 1
+            return 200, {}
+
+        if not authorization.startswith("Bearer "):
+            logger.warning(f"Missing Authorization header for {method} {uri}")
+            self.metrics['unauthorized'] += 1
+            return 401, {}
+
+        payload = self.verify_token(authorization[7:])
+        if not payload or payload.get('type') != 'access':
+            logger.warning(f"Invalid token for {method} {uri}")
+            self.metrics['unauthorized'] += 1
+            return 401, {}
+
+        username = payload.get("sub")
+        user_id = payload.get("user_id")
+        role = payload.get("role", "public")
+        if not username or not user_id:
+            logger.warning(f"Missing user data in token for {method} {uri}")
+            self.metrics['unauthorized'] += 1
+            return 401, {}
+
+        if not self.auth_config.can_access(role, method, uri):
+            logger.warning(f"Access denied for {username} ({role}) to {method} {uri}")
+            self.metrics['forbidden'] += 1
+            return 403, {}
+
+        self.metrics['allowed'] += 1
+        return 200, {
+            "X-User-Id": str(user_id),
+            "X-User-Name": username,
+            "X-User-Role": role,
+            "X-User-Permissions": ",".join(payload.get("permissions", []))
+        }
+
+    def status(self) -> Dict:
+        return {
+            'decisions': dict(self.metrics),
+            'token_cache': self.token_cache.stats(),
+            'revocations': self.revocations.status() if self.revocations is not None else None,
+            'rules': self.auth_config.health()
+        }
+
+
+def _guarded(path: str, prefixes: Iterable[str]) -> bool:
+    return any(path.startswith(prefix) for prefix in prefixes)
+
+
+class LocalAuthMiddleware:
+    """ASGI middleware: проверка доступа до передачи запроса приложению"""
+
+    def __init__(self, app, authorizer: LocalAuthorizer, prefixes: Iterable[str]):
+        self.app = app
+        self.authorizer = authorizer
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _guarded(scope["path"], self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        raw_headers = scope.get("headers") or []
+        authorization = ""
+        headers = []
+        for name, value in raw_headers:
+            lowered = name.lower()
+            if lowered.startswith(b"x-user-"):
+                continue
+            if lowered == b"authorization":
+                authorization = value.decode("latin-1")
+            headers.append((name, value))
+
+        uri = (scope.get("raw_path") or scope["path"].encode()).decode("latin-1")
+        if scope.get("query_string"):
+            uri += "?" + scope["query_string"].decode("latin-1")
+
+        status, user_headers = self.authorizer.authorize(scope["method"], uri, authorization)
+        if status != 200:
+            await send({"type": "http.response.start", "status": status,
+                        "headers": [(b"content-length", b"0")]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers.extend((name.lower().encode("latin-1"), value.encode("latin-1"))
+                       for name, value in user_headers.items())
+        await self.app(dict(scope, headers=headers), receive, send)
+
+
+class LocalAuthWSGIMiddleware:
+    """WSGI middleware для Flask: app.wsgi_app = LocalAuthWSGIMiddleware(app.wsgi_app, ...)"""
+
+    STATUS_LINES = {401: "401 Unauthorized", 403: "403 Forbidden"}
+
+    def __init__(self, app, authorizer: LocalAuthorizer, prefixes: Iterable[str]):
+        self.app = app
+        self.authorizer = authorizer
+        self.prefixes = tuple(prefixes)
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if not _guarded(path, self.prefixes):
+            return self.app(environ, start_response)
+
+        for header in USER_HEADERS:
+            environ.pop("HTTP_" + header.upper().replace("-", "_"), None)
+
+        uri = environ.get("SCRIPT_NAME", "") + path
+        if environ.get("QUERY_STRING"):
+            uri += "?" + environ["QUERY_STRING"]
+
+        status, user_headers = self.authorizer.authorize(
+            environ.get("REQUEST_METHOD", ""), uri, environ.get("HTTP_AUTHORIZATION", "")
+        )
+        if status != 200:
+            start_response(self.STATUS_LINES[status], [("Content-Length", "0")])
+            return [b""]
+
+        for name, value in user_headers.items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        return self.app(environ, start_response)
@@ -3,7 +3,7 @@ import redis
 import json
 import logging
 import os
-from typing import Any, Dict, Optional, Callable
+from typing import Any, Dict, Optional, Callable, List
 import time
 
 logger = logging.getLogger('redis-client')
@@ -92,8 +92,41 @@ class RedisClient:
             logger.error(f"Redis subscribe error: {e}")
             return None
     
+    def listen_channels(self, channels: List[str], timeout: float = 1,
+                        is_running: Optional[Callable[[], bool]] = None):
+        """
+        Одно pubsub-соединение на все каналы: генератор пар (канал, сообщение)
+
+        Ошибки соединения пробрасываются вызывающему (для переподключения),
+        pubsub закрывается при любом выходе из генератора.
+        """
+        if not self.is_connected():
+            self._connect()
+            if not self.is_connected():
+                raise redis.ConnectionError("No Redis connection")
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(*channels)
+            logger.info(f"LISTEN_CHANNELS: Subscribed to {channels}")
+
+            while is_running is None or is_running():
+                message = pubsub.get_message(timeout=timeout)
+                if not message or message['type'] != 'message':
+                    continue
+                try:
+                    yield message['channel'], json.loads(message['data'])
+                except json.JSONDecodeError as e:
+                    logger.error(f"LISTEN_CHANNELS: JSON decode error on {message['channel']}: {e}")
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
     def listen_messages(self, channel: str, timeout: int = 1):
         """Слушатель сообщений (для синхронного использования)"""
+        pubsub = None
         try:
             logger.info(f"LISTEN_MESSAGES: Starting to listen on channel '{channel}'")
 
@@ -128,6 +161,13 @@ class RedisClient:
         except Exception as e:
             logger.error(f"LISTEN_MESSAGES: Error: {e}")
             yield from []
+        finally:
+            # Соединение pubsub не должно оставаться открытым после выхода из генератора
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
 
 # Глобальный экземпляр
 _redis_client = None
@@ -0,0 +1,6 @@
+# shared/tests/conftest.py
+import os
+import sys
+
+# Модули импортируются как в сервисах: from shared.<модуль> import ...
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
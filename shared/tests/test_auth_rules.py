@@ -0,0 +1,99 @@
+# shared/tests/test_auth_rules.py
+import os
+import time
+
+import pytest
+import yaml
+
+from shared.auth_rules import AuthConfig, PathTrie, normalize_path
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                          'auth-service', 'auth_rules.yml')
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def naive_methods(rules, path):
+    """Прежняя проверка: объединение методов всех правил, для которых path.startswith(rule)"""
+    allowed = set()
+    for rule_path, methods in rules.items():
+        if path.startswith(rule_path):
+            allowed |= set(methods)
+    return allowed
+
+
+def probe_paths(rules):
+    paths = {'', '/', '/api', '/unknown', '/api/sessionsX', '/api/admin/sessions/1/restore?x=1'}
+    for rule_path in rules:
+        paths.update({
+            rule_path,
+            rule_path + '/1',
+            rule_path + 'x',
+            rule_path[:-1],
+            rule_path[:len(rule_path) // 2],
+            rule_path + '?limit=10'
+        })
+    return sorted(paths)
+
+
+@pytest.fixture(scope='module')
+def config():
+    return AuthConfig(RULES_PATH, poll_seconds=3600)
+
+
+def test_trie_matches_prefix_scan():
+    rules = {
+        '/api/sessions': {'GET'},
+        '/api/sessions/': {'DELETE'},
+        '/api/session': {'PUT'},
+        '/api/admin': {'POST'},
+        '/': {'OPTIONS'}
+    }
+    trie = PathTrie(rules)
+
+    for path in probe_paths(rules):
+        assert set(trie.methods(path)) == naive_methods(rules, path), path
+
+
+def test_empty_trie_allows_nothing():
+    assert PathTrie({}).methods('/api/sessions') == frozenset()
+
+
+def test_compiled_rules_match_prefix_scan(config):
+    with open(RULES_PATH, encoding='utf-8') as f:
+        raw = yaml.safe_load(f)
+    all_rules = {rule['path'] for rules in raw['role_minimum_access'].values() for rule in rules or []}
+    assert config.snapshot.version == 1
+
+    for role in config.ROLE_HIERARCHY:
+        aggregated = config._get_aggregated_access(role)
+        for path in probe_paths(all_rules):
+            allowed = naive_methods(aggregated, normalize_path(path))
+            for method in METHODS:
+                expected = role in ('admin', 'developer') or method in allowed
+                assert config.can_access(role, method, path) == expected, (role, method, path)
+
+
+def test_configmap_symlink_swap_is_reloaded(tmp_path):
+    # Раскладка тома ConfigMap: auth_rules.yml -> ..data/auth_rules.yml, ..data -> ..<версия>
+    def write_version(name, rules):
+        version_dir = tmp_path / name
+        version_dir.mkdir()
+        (version_dir / 'auth_rules.yml').write_text(yaml.safe_dump({'role_minimum_access': rules}))
+
+    write_version('..v1', {'user': [{'path': '/api/sessions', 'methods': ['GET']}]})
+    os.symlink('..v1', tmp_path / '..data')
+    os.symlink('..data/auth_rules.yml', tmp_path / 'auth_rules.yml')
+
+    config = AuthConfig(str(tmp_path / 'auth_rules.yml'), poll_seconds=3600)
+    if config.watch_mode != 'inotify':
+        pytest.skip('inotify is not available')
+    assert not config.can_access('user', 'POST', '/api/sessions')
+
+    write_version('..v2', {'user': [{'path': '/api/sessions', 'methods': ['GET', 'POST']}]})
+    os.symlink('..v2', tmp_path / '..data_tmp')
+    os.rename(tmp_path / '..data_tmp', tmp_path / '..data')
+
+    deadline = time.time() + 5
+    while config.snapshot.version < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert config.can_access('user', 'POST', '/api/sessions')
@@ -0,0 +1,124 @@
+# shared/tests/test_token_cache.py
+import json
+import time
+
+import jwt
+import pytest
+
+from shared.token_cache import TokenCache
+from shared.token_revocation import REVOCATION_KEY_PREFIX, RevocationListener, apply_revocation
+from shared.local_auth import LocalAuthorizer
+
+SECRET = 'test-secret-key-for-local-token-checks'
+
+
+def make_payload(user_id=1, jti='jti-1', iat=None, exp_in=900):
+    now = int(time.time())
+    return {'sub': 'user', 'user_id': user_id, 'role': 'user', 'type': 'access',
+            'jti': jti, 'iat': iat if iat is not None else now - 10, 'exp': now + exp_in}
+
+
+class FakeRedisClient:
+    """Хранилище отзывов в памяти: только то, что читает RevocationListener.sync"""
+
+    def __init__(self):
+        self.client = self
+        self.values = {}
+
+    def scan_iter(self, match, count=None):
+        prefix = match.rstrip('*')
+        return [key for key in self.values if key.startswith(prefix)]
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+
+def test_cached_token_is_returned_until_revoked():
+    cache = TokenCache()
+    payload = make_payload()
+    assert cache.put('token', payload)
+    assert cache.get('token') == payload
+
+    cache.revoke_token('token')
+
+    assert cache.get('token') is None
+    assert not cache.put('token', payload)
+    assert cache.stats()['revoked_rejects'] == 1
+
+
+def test_revoke_jti_drops_cached_entries():
+    cache = TokenCache()
+    cache.put('token', make_payload(jti='a'))
+    cache.put('other', make_payload(jti='b'))
+
+    cache.revoke_jti('a', time.time() + 60)
+
+    assert cache.get('token') is None
+    assert cache.get('other') is not None
+    assert not cache.put('token', make_payload(jti='a'))
+
+
+def test_revoke_user_rejects_only_tokens_issued_before():
+    cache = TokenCache()
+    revoked_at = time.time()
+    cache.put('old', make_payload(user_id=7, iat=int(revoked_at) - 60))
+
+    cache.revoke_user(7, revoked_at=revoked_at)
+
+    assert cache.get('old') is None
+    assert not cache.put('old', make_payload(user_id=7, iat=int(revoked_at) - 60))
+    assert cache.put('new', make_payload(user_id=7, iat=int(revoked_at) + 1))
+    assert cache.put('other-user', make_payload(user_id=8, iat=int(revoked_at) - 60))
+
+
+def test_expired_revocations_are_pruned():
+    cache = TokenCache()
+    cache.revoke_jti('old', time.time() - 1)
+    cache.revoke_jti('new', time.time() + 60)
+
+    assert cache.stats()['revocations'] == 1
+
+
+@pytest.mark.parametrize('event', [
+    {'kind': 'token', 'value': TokenCache.key('token').hex()},
+    {'kind': 'jti', 'value': 'jti-1'},
+    {'kind': 'user', 'value': 1, 'revoked_at': time.time() + 1},
+], ids=['token', 'jti', 'user'])
+def test_revocation_event_applies_to_cache(event):
+    cache = TokenCache()
+    cache.put('token', make_payload())
+
+    # Событие приходит через Redis в JSON
+    assert apply_revocation(cache, json.loads(json.dumps(dict(event, expires_at=time.time() + 60))))
+
+    assert cache.get('token') is None
+    assert not cache.put('token', make_payload())
+
+
+def test_invalid_revocation_event_is_ignored():
+    cache = TokenCache()
+    assert not apply_revocation(cache, {'kind': 'token'})
+    assert not apply_revocation(cache, {'kind': 'unknown', 'value': 1, 'expires_at': 0})
+    assert cache.stats()['revocations'] == 0
+
+
+def test_listener_sync_loads_stored_revocations():
+    redis_client = FakeRedisClient()
+    event = {'kind': 'token', 'value': TokenCache.key('token').hex(), 'expires_at': time.time() + 60}
+    redis_client.values[f"{REVOCATION_KEY_PREFIX}:token:{event['value']}"] = json.dumps(event)
+    redis_client.values['unrelated'] = 'x'
+    cache = TokenCache()
+    cache.put('token', make_payload())
+
+    assert RevocationListener(redis_client, cache).sync() == 1
+    assert cache.get('token') is None
+
+
+def test_local_authorizer_rejects_revoked_token():
+    authorizer = LocalAuthorizer(auth_config=object(), secret_key=SECRET)
+    token = jwt.encode(make_payload(), SECRET, algorithm='HS256')
+    assert authorizer.verify_token(token)['sub'] == 'user'
+
+    authorizer.token_cache.revoke_token(token)
+
+    assert authorizer.verify_token(token) is None
@@ -0,0 +1,152 @@
+# shared/token_cache.py
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+
+class TokenCache:
+    """
+    Кэш проверенных JWT: хэш токена -> payload до истечения exp
+
+    Один и тот же access token приходит в forwardAuth на каждый запрос API;
+    подпись проверяется при первом обращении, дальше payload берется из кэша.
+    Кэш ограничен по размеру (LRU). Отозванные токены (по токену, jti или
+    всем токенам пользователя, выданным до момента отзыва) не принимаются
+    и не попадают в кэш до своего exp.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max(1, max_size)
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Отзывы: ключ -> время, до которого отзыв нужно помнить
+        self._revoked_tokens: Dict[bytes, float] = {}
+        self._revoked_jti: Dict[str, float] = {}
+        # user_id -> (токены с iat раньше этого момента недействительны, помнить до)
+        self._revoked_users: Dict[Any, tuple] = {}
+        self.metrics = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evicted': 0,
+            'revoked_rejects': 0
+        }
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Payload проверенного токена или None (нужна проверка подписи)"""
+        key = self.key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics['misses'] += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.metrics['expired'] += 1
+                self.metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics['hits'] += 1
+            return dict(payload)
+
+    def put(self, token: str, payload: dict) -> bool:
+        """
+        Сохранение payload после успешной проверки подписи
+
+        False - токен отозван (проверка и запись под одной блокировкой,
+        чтобы отзыв во время проверки подписи не потерялся).
+        Токены без exp проходят, но не кэшируются.
+        """
+        key = self.key(token)
+        expires_at = payload.get('exp')
+        with self._lock:
+            if self._is_revoked(key, payload):
+                self.metrics['revoked_rejects'] += 1
+                return False
+            if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+                return True
+            self._entries[key] = (dict(payload), float(expires_at))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.metrics['evicted'] += 1
+        return True
+
+    def _is_revoked(self, key: bytes, payload: dict) -> bool:
+        if not (self._revoked_tokens or self._revoked_jti or self._revoked_users):
+            return False
+        if key in self._revoked_tokens or payload.get('jti') in self._revoked_jti:
+            return True
+        user_revocation = self._revoked_users.get(payload.get('user_id'))
+        # Токены без iat выданы до появления отзыва пользователя - тоже недействительны
+        return user_revocation is not None and payload.get('iat', 0) < user_revocation[0]
+
+    # ==================== ХУКИ ОТЗЫВА ====================
+
+    def revoke_token(self, token: str, expires_at: Optional[float] = None):
+        """Отзыв конкретного токена (например, при выходе)"""
+        self.revoke_key(self.key(token), expires_at)
+
+    def revoke_key(self, key: bytes, expires_at: Optional[float] = None):
+        """Отзыв токена по хэшу (key) - так отзыв приходит из других сервисов"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if expires_at is None:
+                expires_at = entry[1] if entry else time.time() + 7 * 24 * 3600
+            self._revoked_tokens[key] = expires_at
+            self._prune_revocations()
+
+    def revoke_jti(self, jti: str, expires_at: float):
+        """Отзыв по идентификатору токена (jti)"""
+        with self._lock:
+            self._revoked_jti[jti] = expires_at
+            for key in [key for key, (payload, _) in self._entries.items() if payload.get('jti') == jti]:
+                del self._entries[key]
+            self._prune_revocations()
+
+    def revoke_user(self, user_id: Any, remember_seconds: float = 7 * 24 * 3600,
+                    revoked_at: Optional[float] = None):
+        """
+        Отзыв всех токенов пользователя, выданных до момента отзыва (смена роли, блокировка)
+
+        revoked_at - момент отзыва в другом сервисе (по умолчанию - сейчас).
+        """
+        now = time.time()
+        with self._lock:
+            # iat хранится в секундах: токены, выданные в секунду отзыва, остаются действительными (повторный вход)
+            self._revoked_users[user_id] = (int(revoked_at or now), now + remember_seconds)
+            for key in [key for key, (payload, _) in self._entries.items() if payload.get('user_id') == user_id]:
+                del self._entries[key]
+            self._prune_revocations()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _prune_revocations(self):
+        """Отзывы истекших токенов больше не нужны"""
+        now = time.time()
+        for revocations in (self._revoked_tokens, self._revoked_jti):
+            for key in [key for key, until in revocations.items() if until <= now]:
+                del revocations[key]
+        for user_id in [user_id for user_id, (_, until) in self._revoked_users.items() if until <= now]:
+            del self._revoked_users[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['misses']
+            return dict(
+                self.metrics,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hit_rate=round(self.metrics['hits'] / lookups, 4) if lookups else None,
+                revocations=len(self._revoked_tokens) + len(self._revoked_jti) + len(self._revoked_users)
+            )
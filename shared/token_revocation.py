@@ -0,0 +1,136 @@
+# shared/token_revocation.py
+"""
+Отзыв токенов для всех сервисов, проверяющих доступ локально.
+
+auth-service при отзыве (выход) записывает отзыв в Redis:
+  auth:revoked:<вид>:<значение>  JSON события, TTL - до exp токена
+и публикует то же событие в REVOCATION_CHANNEL. RevocationListener в
+сервисах с LocalAuthorizer применяет события к своему TokenCache, а после
+каждой подписки перечитывает ключи - отзывы, сделанные, пока сервис был
+отключен от Redis, тоже учитываются.
+
+Виды отзыва совпадают с хуками TokenCache:
+  token - sha256 токена (hex), jti - идентификатор токена,
+  user  - все токены пользователя с iat раньше revoked_at.
+Без Redis отзыв действует только в auth-service.
+"""
+import json
+import time
+import threading
+import logging
+from typing import Optional, Dict, Any
+
+from .token_cache import TokenCache
+
+logger = logging.getLogger("token-revocation")
+
+REVOCATION_CHANNEL = "auth_revocations"
+REVOCATION_KEY_PREFIX = "auth:revoked"
+# Повторное чтение всех отзывов - страховка от пропущенных событий
+REVOCATION_SYNC_SECONDS = 60
+
+
+def publish_revocation(redis_client, kind: str, value: Any, expires_at: float, **extra) -> bool:
+    """Запись отзыва в Redis и событие для сервисов (False - Redis недоступен)"""
+    client = getattr(redis_client, 'client', None)
+    if client is None:
+        return False
+    event = dict(extra, kind=kind, value=value, expires_at=expires_at)
+    ttl = int(expires_at - time.time()) + 1
+    if ttl <= 0:
+        return True
+    try:
+        client.set(f"{REVOCATION_KEY_PREFIX}:{kind}:{value}", json.dumps(event), ex=ttl)
+        client.publish(REVOCATION_CHANNEL, json.dumps(event))
+        return True
+    except Exception as e:
+        logger.error(f"Failed to publish {kind} revocation: {e}")
+        return False
+
+
+def publish_token_revocation(redis_client, token: str, expires_at: float) -> bool:
+    """Отзыв конкретного токена (в Redis хранится только его хэш)"""
+    return publish_revocation(redis_client, 'token', TokenCache.key(token).hex(), expires_at)
+
+
+def apply_revocation(token_cache: TokenCache, event: Dict[str, Any]) -> bool:
+    """Применение события отзыва к кэшу (False - событие не распознано)"""
+    try:
+        kind, value, expires_at = event['kind'], event['value'], float(event['expires_at'])
+        if kind == 'token':
+            token_cache.revoke_key(bytes.fromhex(value), expires_at)
+        elif kind == 'jti':
+            token_cache.revoke_jti(value, expires_at)
+        elif kind == 'user':
+            token_cache.revoke_user(value, remember_seconds=expires_at - time.time(),
+                                    revoked_at=float(event['revoked_at']))
+        else:
+            return False
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Invalid revocation event {event}: {e}")
+        return False
+    return True
+
+
+class RevocationListener:
+    """Фоновое применение отзывов из Redis к TokenCache сервиса"""
+
+    def __init__(self, redis_client, token_cache: TokenCache, sync_seconds: float = REVOCATION_SYNC_SECONDS):
+        self.redis_client = redis_client
+        self.token_cache = token_cache
+        self.sync_seconds = sync_seconds
+        self.running = False
+        self.synced_at: Optional[float] = None
+        self.events = 0
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="token-revocations")
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def sync(self) -> int:
+        """Применение всех действующих отзывов из Redis"""
+        client = getattr(self.redis_client, 'client', None)
+        if client is None:
+            return 0
+        keys = list(client.scan_iter(match=f"{REVOCATION_KEY_PREFIX}:*", count=500))
+        applied = 0
+        for raw in (client.mget(keys) if keys else []):
+            if raw and apply_revocation(self.token_cache, json.loads(raw)):
+                applied += 1
+        self.synced_at = time.time()
+        return applied
+
+    def _is_running(self) -> bool:
+        # Вызывается listen_channels перед каждым чтением, то есть уже после подписки:
+        # отзывы, записанные до подписки, не теряются
+        if self.synced_at is None or time.time() - self.synced_at >= self.sync_seconds:
+            self.sync()
+        return self.running
+
+    def _loop(self):
+        backoff = 1
+        while self.running:
+            try:
+                self.synced_at = None
+                for _, event in self.redis_client.listen_channels(
+                    [REVOCATION_CHANNEL], timeout=1, is_running=self._is_running
+                ):
+                    backoff = 1
+                    if apply_revocation(self.token_cache, event):
+                        self.events += 1
+            except Exception as e:
+                logger.error(f"Revocation listener error: {e}, reconnecting in {backoff}s")
+                deadline = time.time() + backoff
+                while self.running and time.time() < deadline:
+                    time.sleep(0.1)
+                backoff = min(backoff * 2, 30)
+
+    def status(self) -> Dict[str, Any]:
+        return {'running': self.running, 'events': self.events, 'synced_at': self.synced_at}
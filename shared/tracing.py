@@ -0,0 +1,185 @@
+# shared/tracing.py
+"""
+Сквозная трассировка пакетов телеметрии:
+module-service -> Redis -> data-service -> Redis -> frontend bridge.
+
+Контекст трассы (id, время начала по стенным часам и отметки этапов в мс
+от начала) передается в поле 'trace' сообщений module_data и
+frontend_updates. Внутри процесса отметки считаются по монотонным часам от
+момента приема сообщения, между процессами - по стенным часам, поэтому
+межсервисные этапы включают расхождение часов хостов.
+
+Завершенные трассы пишутся в ограниченный Redis stream, по которому
+строится разбивка задержек по этапам за скользящее окно.
+"""
+import time
+import uuid
+import logging
+from typing import Optional, Dict, Any, List, Iterable
+
+logger = logging.getLogger('tracing')
+
+# Порядок этапов от приема TCP до отправки в WebSocket
+STAGES = (
+    'recv',              # module-service: пакет получен из TCP
+    'parse',             # module-service: пакет разобран
+    'publish',           # module-service: передан в Redis (module_data)
+    'subscribe',         # data-service: получен из Redis
+    'spool_append',      # data-service: записан в журнал на диске (fsync)
+    'db_commit',         # data-service: транзакция записи завершена
+    'frontend_publish',  # data-service: передан в Redis (frontend_updates)
+    'bridge_receive',    # frontend: получен мостом из Redis
+    'emit',              # frontend: отправлен клиентам Socket.IO
+)
+
+TRACE_STREAM = 'trace_latency'
+TRACE_STREAM_MAXLEN = 20000
+
+
+class TraceContext:
+    """Контекст трассы одного пакета"""
+
+    __slots__ = ('trace_id', 'start_ns', 'stages', '_offset_ms', '_mono_base')
+
+    def __init__(self, trace_id: Optional[str] = None, start_ns: Optional[int] = None,
+                 stages: Optional[Dict[str, float]] = None):
+        now_ns = time.time_ns()
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.start_ns = start_ns or now_ns
+        self.stages: Dict[str, float] = dict(stages or {})
+        # Опорная точка процесса: смещение от начала трассы на момент приема + монотонные часы
+        self._offset_ms = max((now_ns - self.start_ns) / 1e6, 0.0)
+        self._mono_base = time.monotonic()
+
+    @classmethod
+    def start(cls) -> 'TraceContext':
+        """Новая трасса с отметкой 'recv'"""
+        trace = cls()
+        trace.stages['recv'] = 0.0
+        return trace
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> Optional['TraceContext']:
+        """Контекст из поля 'trace' сообщения (None, если его нет или он поврежден)"""
+        raw = message.get('trace') if isinstance(message, dict) else None
+        if not isinstance(raw, dict):
+            return None
+        try:
+            return cls(raw['id'], int(raw['start_ns']), raw.get('stages'))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @classmethod
+    def all_from_message(cls, message: Dict[str, Any]) -> List['TraceContext']:
+        """Контексты из поля 'traces' (батч пакетов) или 'trace' (один пакет)"""
+        if not isinstance(message, dict):
+            return []
+        raw_traces = message.get('traces')
+        if isinstance(raw_traces, list):
+            traces = (cls.from_message({'trace': raw}) for raw in raw_traces)
+            return [trace for trace in traces if trace]
+        trace = cls.from_message(message)
+        return [trace] if trace else []
+
+    def elapsed_ms(self) -> float:
+        return self._offset_ms + (time.monotonic() - self._mono_base) * 1000
+
+    def mark(self, stage: str) -> float:
+        """Отметка этапа (мс от начала трассы)"""
+        value = round(self.elapsed_ms(), 3)
+        self.stages[stage] = value
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.trace_id, 'start_ns': self.start_ns, 'stages': dict(self.stages)}
+
+
+def record_trace(redis_client, trace: TraceContext):
+    """Запись завершенной трассы в Redis stream (ошибки не мешают основному потоку)"""
+    try:
+        client = getattr(redis_client, 'client', None)
+        if client is None:
+            return
+        fields = {stage: value for stage, value in trace.stages.items()}
+        fields['id'] = trace.trace_id
+        client.xadd(TRACE_STREAM, fields, maxlen=TRACE_STREAM_MAXLEN, approximate=True)
+    except Exception as e:
+        logger.debug(f"Trace record failed: {e}")
+
+
+def read_traces(redis_client, window_seconds: int, limit: int = TRACE_STREAM_MAXLEN) -> List[Dict[str, float]]:
+    """Отметки этапов трасс за последние window_seconds"""
+    client = getattr(redis_client, 'client', None)
+    if client is None:
+        return []
+    since_ms = int(time.time() * 1000) - window_seconds * 1000
+    entries = client.xrange(TRACE_STREAM, min=f"{since_ms}-0", max='+', count=limit)
+    traces = []
+    for _, fields in entries:
+        stages = {}
+        for key, value in fields.items():
+            if key in STAGES:
+                try:
+                    stages[key] = float(value)
+                except ValueError:
+                    continue
+        traces.append(stages)
+    return traces
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = sorted(values)
+    last = len(values) - 1
+
+    def pick(q):
+        return round(values[min(last, int(q * len(values)))], 3)
+
+    return {
+        'count': len(values),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(values[-1], 3)
+    }
+
+
+def latency_breakdown(traces: Iterable[Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Перцентили по этапам
+
+    offset - время от приема пакета до этапа, delta - время от предыдущего
+    присутствующего в трассе этапа.
+    """
+    offsets: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    deltas: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    totals: List[float] = []
+    count = 0
+
+    for stages in traces:
+        count += 1
+        previous = None
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            value = stages[stage]
+            offsets[stage].append(value)
+            if previous is not None:
+                deltas[stage].append(max(value - previous, 0.0))
+            previous = value
+        if previous is not None:
+            totals.append(previous)
+
+    return {
+        'traces': count,
+        'total_ms': _percentiles(totals),
+        'stages': [
+            {
+                'stage': stage,
+                'offset_ms': _percentiles(offsets[stage]),
+                'delta_ms': _percentiles(deltas[stage])
+            }
+            for stage in STAGES
+        ]
+    }